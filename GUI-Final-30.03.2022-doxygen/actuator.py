@@ -0,0 +1,251 @@
+'''
+module name: actuator.py
+
+info:
+    This module contains the service controlling the 16 pwm channels of the PCA9685 board.
+    Only the service thread talks to the I2C bus. Other threads send their commands through a queue.
+    The service keeps a copy (shadow) of all channel values and only writes the channels which have
+    actually changed. Adjacent channels are written in one I2C block transfer, if all channels change
+    to the same value a single ALL_LED write is used.
+'''
+
+import queue
+import threading
+import time
+
+import metrics
+
+CHANNELS = 16
+
+""" PCA9685 registers """
+MODE1 = 0x00
+MODE1_AI = 0x20         # register auto increment, needed for block writes
+LED0_ON_L = 0x06
+
+""" channels per block write (4 registers each, SMBus block transfers are limited to 32 bytes) """
+MAX_BLOCK = 8
+
+WRITE_SECONDS = metrics.histogram('farmer_pwm_write_seconds', 'Duration of the I2C writes of one command batch')
+WRITE_ERRORS = metrics.counter('farmer_pwm_errors_total', 'Failed pwm writes')
+
+
+class PCA9685Bus:
+    """
+    class PCA9685Bus writes channel values to an Adafruit_PCA9685.PCA9685 instance
+        - write
+        - write_all
+    """
+
+    def __init__(self, pwm):
+        """
+        transfer parameters:
+            pwm: object, Adafruit_PCA9685.PCA9685 instance (frequency already set)
+        """
+        self.pwm = pwm
+        self._device = getattr(pwm, '_device', None)
+        if self._device is not None:
+            self._device.write8(MODE1, self._device.readU8(MODE1) | MODE1_AI)
+
+    def write(self, start, values):
+        """
+        write(start, values)
+            - writes the values of adjacent channels in one transfer
+        transfer parameters:
+            start:  int, first channel
+            values: list, off counts (0..4095) of the channels start, start+1, ...
+        """
+        if self._device is None:
+            for i, value in enumerate(values):
+                self.pwm.set_pwm(start + i, 0, value)
+            return
+        data = []
+        for value in values:
+            data += [0, 0, value & 0xFF, value >> 8]
+        self._device.writeList(LED0_ON_L + 4 * start, data)
+
+    def write_all(self, value):
+        """
+        write_all(value)
+            - writes the same value to all channels
+        transfer parameters:
+            value: int, off count (0..4095)
+        """
+        self.pwm.set_all_pwm(0, value)
+
+
+class PWMService:
+    """
+    class PWMService owns the pwm bus and executes the commands of all threads
+        - start
+        - set
+        - set_many
+        - set_all
+        - get
+        - sync
+        - add_listener
+        - stop
+    attributes:
+        commands:  int, number of received commands
+        transfers: int, number of bus transfers
+        skipped:   int, number of channel writes skipped because the value was unchanged
+    """
+
+    def __init__(self, bus, listener=None):
+        """
+        transfer parameters:
+            bus:      object, PCA9685Bus (also of a simulator.FakePCA9685 without hardware)
+            listener: function, called as listener(channels) on the service thread after every write,
+                      channels is a dict channel -> value
+        """
+        self.bus = bus
+        self.listeners = [listener] if listener is not None else []
+        # None means unknown, so the first command for a channel is always written
+        self.shadow = [None] * CHANNELS
+        self._queue = queue.Queue()
+        self._thread = None
+        self.commands = 0
+        self.transfers = 0
+        self.skipped = 0
+
+    def start(self):
+        """
+        start()
+            - starts the service thread
+        """
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='PWMService', daemon=True)
+            self._thread.start()
+
+    def set(self, channel, value):
+        """
+        set(channel, value)
+            - sets one channel (non-blocking)
+        transfer parameters:
+            channel: int, channel 0..15
+            value:   int, pwm value between 0 and 4095
+        """
+        self._queue.put(('set', {int(channel): int(value)}))
+
+    def set_many(self, values):
+        """
+        set_many(values)
+            - sets several channels with one command, they are written together (non-blocking)
+        transfer parameters:
+            values: dict, channel -> pwm value
+        """
+        self._queue.put(('set', {int(ch): int(v) for ch, v in values.items()}))
+
+    def set_all(self, value):
+        """
+        set_all(value)
+            - sets all channels to the same value (non-blocking)
+        transfer parameters:
+            value: int, pwm value between 0 and 4095
+        """
+        self._queue.put(('set', {ch: int(value) for ch in range(CHANNELS)}))
+
+    def get(self, channel):
+        """
+        get(channel)
+            - returns the last written value of a channel
+        transfer parameters:
+            channel: int, channel 0..15
+        return parameter:
+            value: int, pwm value or None if the channel was never written
+        """
+        return self.shadow[channel]
+
+    def sync(self, timeout=None):
+        """
+        sync(timeout=None)
+            - waits until all commands sent before have been written
+        transfer parameters:
+            timeout: float, maximum seconds to wait
+        return parameter:
+            done: boolean, False if the timeout was reached
+        """
+        done = threading.Event()
+        self._queue.put(('sync', done))
+        return done.wait(timeout)
+
+    def add_listener(self, listener):
+        """
+        add_listener(listener)
+            - registers another function called after every write (e.g. to measure the latency of a controller)
+        transfer parameters:
+            listener: function, called as listener(channels) on the service thread, channels is a dict channel -> value
+        """
+        self.listeners = self.listeners + [listener]
+
+    def stop(self):
+        """
+        stop()
+            - executes the pending commands and stops the service thread
+        """
+        if self._thread is not None:
+            self._queue.put(('stop', None))
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            # commands arriving at the same time are combined into one write
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            target = {}
+            events = []
+            stop = False
+            for kind, arg in batch:
+                if kind == 'set':
+                    self.commands += 1
+                    target.update(arg)
+                elif kind == 'sync':
+                    events.append(arg)
+                elif kind == 'stop':
+                    stop = True
+
+            started = time.perf_counter()
+            try:
+                self._apply(target)
+            except Exception as e:
+                WRITE_ERRORS.inc()
+                print(f"PWM write failed: {e}")
+            if target:
+                WRITE_SECONDS.observe(time.perf_counter() - started)
+            for event in events:
+                event.set()
+            if stop:
+                return
+
+    def _apply(self, target):
+        changed = {ch: v for ch, v in target.items() if self.shadow[ch] != v}
+        self.skipped += len(target) - len(changed)
+        if not changed:
+            return
+
+        values = set(target.values())
+        if len(target) == CHANNELS and len(values) == 1:
+            self.bus.write_all(values.pop())
+            self.transfers += 1
+        else:
+            # group adjacent channels into block writes
+            channels = sorted(changed)
+            start = prev = channels[0]
+            for ch in channels[1:] + [None]:
+                if ch is not None and ch == prev + 1 and ch - start < MAX_BLOCK:
+                    prev = ch
+                    continue
+                self.bus.write(start, [changed[c] for c in range(start, prev + 1)])
+                self.transfers += 1
+                if ch is not None:
+                    start = prev = ch
+
+        for ch, v in changed.items():
+            self.shadow[ch] = v
+        for listener in self.listeners:
+            listener(changed)
@@ -0,0 +1,523 @@
+'''
+module name: aio_devices.py
+
+info:
+    This module contains the I/O loop for several racks per Pi. Any number of monitoring and robot arduinos,
+    declared in a configuration file (devices.json), are served by one asyncio event loop on one thread:
+        - every port is read non-blocking when the loop reports data (add_reader), no thread per device
+        - every device has its own parser (telemetry.FrameDecoder or serial_reader.LineSplitter)
+        - the data is tagged with the device and the rack it comes from
+        - the relocation jobs of every robot are executed by a task of the loop (AsyncRobotClient)
+    A device which is disconnected (e.g. USB unplugged) is opened again every RECONNECT_DELAY seconds.
+
+    devices.json:
+        [{"id": "rack1-monitor", "rack": "rack1", "kind": "monitoring", "port": "/dev/ttyACM1", "baudrate": 115200},
+         {"id": "rack1-robot", "rack": "rack1", "kind": "robot", "port": "/dev/ttyACM0", "baudrate": 9600,
+          "positions": "positioning.json"}]
+'''
+
+import asyncio
+import json
+import os
+import threading
+import time
+from collections import namedtuple
+
+import booking
+import robot_client
+import serial_reader
+import telemetry
+
+""" bytes read per call when the loop reports data """
+READ_SIZE = 4096
+
+""" seconds between two attempts to open a disconnected device """
+RECONNECT_DELAY = 5
+
+""" measured values of one frame, tagged with the device and the rack """
+Reading = namedtuple('Reading', ['device', 'rack', 'seq', 'values', 'timestamp'])
+
+
+class Device:
+    """
+    class Device contains one serial device served by the loop (base class)
+        - open
+        - write
+        - close
+    attributes:
+        id:        string, unique name of the device
+        rack:      string, rack the device belongs to
+        connected: boolean, True while the port is open
+        bytes_in:  int, number of received bytes
+        bytes_out: int, number of sent bytes
+        tee:       function, called with every received chunk (e.g. the serial capture), None: off
+    """
+
+    __slots__ = ('id', 'rack', 'path', 'baudrate', 'owner', 'port', 'fd', 'connected',
+                 '_out', 'bytes_in', 'bytes_out', 'errors', 'tee')
+
+    kind = None
+
+    def __init__(self, id, rack, path, baudrate):
+        self.id = id
+        self.rack = rack
+        self.path = path
+        self.baudrate = baudrate
+        self.owner = None
+        self.port = None
+        self.fd = None
+        self.connected = False
+        self._out = bytearray()
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.errors = 0
+        self.tee = None
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.id!r}, rack={self.rack!r}, port={self.path!r})"
+
+    def open(self):
+        """
+        open()
+            - opens the port and registers it at the loop (called on the loop thread)
+            - if the port cannot be opened, the next attempt is scheduled
+        """
+        import serial
+        try:
+            # pyserial configures the port and opens it non-blocking, the data is read from the file descriptor
+            self.port = serial.Serial(self.path, self.baudrate, timeout=0)
+        except (OSError, serial.SerialException) as e:
+            self.errors += 1
+            print(f"{self.id}: cannot open {self.path}: {e}")
+            self.owner.loop.call_later(RECONNECT_DELAY, self.open)
+            return
+        self.fd = self.port.fileno()
+        self.port.reset_input_buffer()
+        self.connected = True
+        self.owner.loop.add_reader(self.fd, self._readable)
+
+    def _readable(self):
+        try:
+            data = os.read(self.fd, READ_SIZE)
+        except BlockingIOError:
+            return
+        except OSError as e:
+            return self._disconnected(e)
+        if not data:
+            return self._disconnected("end of file")
+        self.bytes_in += len(data)
+        if self.tee is not None:
+            self.tee(data)
+        self.received(data)
+
+    def _disconnected(self, reason):
+        self.errors += 1
+        print(f"{self.id}: connection lost ({reason}), reconnecting in {RECONNECT_DELAY} s")
+        self.close()
+        self.owner.loop.call_later(RECONNECT_DELAY, self.open)
+
+    def received(self, data):
+        """
+        received(data)
+            - hands the received bytes to the parser of the device (implemented by the subclasses)
+        transfer parameters:
+            data: bytes, received bytes
+        """
+        raise NotImplementedError
+
+    def write(self, data):
+        """
+        write(data)
+            - sends bytes without blocking, the rest is sent when the port is writable again (called on the loop thread)
+        transfer parameters:
+            data: bytes, data to be sent
+        """
+        if not self.connected:
+            raise ConnectionError(f"{self.id} is not connected")
+        self._out += data
+        self._flush()
+
+    def _flush(self):
+        try:
+            sent = os.write(self.fd, self._out)
+        except BlockingIOError:
+            sent = 0
+        except OSError as e:
+            return self._disconnected(e)
+        self.bytes_out += sent
+        del self._out[:sent]
+        if self._out:
+            self.owner.loop.add_writer(self.fd, self._flush)
+        else:
+            self.owner.loop.remove_writer(self.fd)
+
+    def close(self):
+        """
+        close()
+            - removes the port from the loop and closes it
+        """
+        if self.fd is not None:
+            self.owner.loop.remove_reader(self.fd)
+            self.owner.loop.remove_writer(self.fd)
+        if self.port is not None:
+            try:
+                self.port.close()
+            except OSError:
+                pass
+        self.port = None
+        self.fd = None
+        self.connected = False
+        del self._out[:]
+
+    def stats(self):
+        """
+        stats()
+            - returns the state of the device
+        return parameter:
+            stats: dict
+        """
+        return {'id': self.id, 'rack': self.rack, 'kind': self.kind, 'connected': self.connected,
+                'bytes_in': self.bytes_in, 'bytes_out': self.bytes_out, 'errors': self.errors}
+
+
+class MonitoringDevice(Device):
+    """
+    class MonitoringDevice contains a monitoring arduino (Monitoring.ino), every valid frame is published as a Reading
+    attributes:
+        latest: Reading, newest frame (None before the first frame)
+    """
+
+    __slots__ = ('decoder', 'latest')
+
+    kind = 'monitoring'
+
+    def __init__(self, id, rack, path, baudrate=115200):
+        Device.__init__(self, id, rack, path, baudrate)
+        self.decoder = telemetry.FrameDecoder()
+        self.latest = None
+
+    def received(self, data):
+        now = time.time()
+        for frame in self.decoder.feed(data):
+            self.latest = Reading(self.id, self.rack, frame.seq, frame.values, now)
+            self.owner.publish('frame', self.latest)
+
+    def stats(self):
+        stats = Device.stats(self)
+        stats.update(self.decoder.stats())
+        return stats
+
+
+class RobotDevice(Device):
+    """
+    class RobotDevice contains a robot arduino (RampsFinal.ino), every line is published as (device, line)
+    attributes:
+        client: AsyncRobotClient, executes the relocation jobs of this robot
+    """
+
+    __slots__ = ('splitter', 'client')
+
+    kind = 'robot'
+
+    def __init__(self, id, rack, path, baudrate=9600, table=None):
+        Device.__init__(self, id, rack, path, baudrate)
+        self.splitter = serial_reader.LineSplitter()
+        self.client = AsyncRobotClient(self, table) if table is not None else None
+
+    def received(self, data):
+        for line in self.splitter.feed(data):
+            if self.client is not None:
+                self.client.reader.dispatch(line)
+            self.owner.publish('line', (self, line))
+
+    def stats(self):
+        stats = Device.stats(self)
+        if self.client is not None:
+            stats['jobs'] = self.client.stats()
+        return stats
+
+
+class _LoopQueue:
+    # job queue of the AsyncRobotClient, filled from any thread and emptied by a task of the loop
+    # the asyncio queue is created on the loop thread (bind), jobs submitted before are kept in a list
+    def __init__(self):
+        self.loop = None
+        self._queue = None
+        self._pending = []
+        self._lock = threading.Lock()
+
+    def bind(self, loop):
+        with self._lock:
+            self.loop = loop
+            self._queue = asyncio.Queue()
+            for item in self._pending:
+                self._queue.put_nowait(item)
+            self._pending = []
+
+    def put(self, item):
+        with self._lock:
+            if self.loop is None:
+                self._pending.append(item)
+                return
+        self.loop.call_soon_threadsafe(self._queue.put_nowait, item)
+
+    def qsize(self):
+        return len(self._pending) + (self._queue.qsize() if self._queue is not None else 0)
+
+    async def get(self):
+        return await self._queue.get()
+
+
+class AsyncRobotClient(robot_client.RobotClient):
+    """
+    class AsyncRobotClient executes the relocation jobs of one robot as a task of the loop
+    same interface as robot_client.RobotClient (submit, submit_many, get_job, stats), but no thread of its own
+    """
+
+    def __init__(self, device, table, timeout=180):
+        """
+        transfer parameters:
+            device:  RobotDevice, the robot
+            table:   PositionTable, booking table of the rack
+            timeout: float, seconds to wait for the reply of the robot
+        """
+        robot_client.RobotClient.__init__(self, device, table, timeout)
+        self.reader.name = device.id
+        self._queue = _LoopQueue()
+        self._replies = None
+        self._task = None
+
+    def start(self):
+        """
+        start()
+            - starts the task executing the jobs (called on the loop thread)
+        """
+        if self._task is None:
+            loop = self.port.owner.loop
+            self._replies = asyncio.Queue()
+            self._queue.bind(loop)
+            self._task = loop.create_task(self._run())
+
+    def stop(self):
+        """
+        stop()
+            - stops the task after the current job
+        """
+        if self._task is not None:
+            self._queue.put(None)
+            self._task = None
+
+    def _on_line(self, line):
+        # called on the loop thread
+        if self._current is not None:
+            self._replies.put_nowait(line)
+
+    async def _run(self):
+        while True:
+            job = await self._queue.get()
+            if job is None:
+                return
+            try:
+                await self._execute(job)
+            except Exception as e:
+                self._finish(job, 'failed', str(e))
+
+    async def _execute(self, job):
+        # same steps as RobotClient._execute, only the waiting for the replies is asynchronous
+        if not self._begin(job):
+            return
+        try:
+            self.port.write(f"{job.old}T{job.new}\n".encode())
+
+            deadline = time.monotonic() + self.timeout
+            while True:
+                remaining = deadline - time.monotonic()
+                try:
+                    line = await asyncio.wait_for(self._replies.get(), max(remaining, 0))
+                except asyncio.TimeoutError:
+                    return self._finish(job, 'timeout', f"no reply within {self.timeout} s")
+                if self._reply(job, line):
+                    break
+        finally:
+            self._current = None
+
+        self._complete(job)
+
+
+class DeviceLoop:
+    """
+    class DeviceLoop serves all devices with one asyncio event loop
+        - add
+        - subscribe
+        - start
+        - run
+        - call
+        - device
+        - racks
+        - stats
+        - stop
+    """
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.devices = {}
+        self._subscribers = {'frame': [], 'line': []}
+        self._thread = None
+
+    def add(self, device):
+        """
+        add(device)
+            - adds a device, it is opened when the loop starts (or immediately if the loop is running)
+        transfer parameters:
+            device: Device, device to be added
+        return parameter:
+            device: Device, the added device
+        """
+        if device.id in self.devices:
+            raise ValueError(f"Device '{device.id}' already exists")
+        device.owner = self
+        self.devices[device.id] = device
+        if self.loop.is_running():
+            self.loop.call_soon_threadsafe(self._open, device)
+        return device
+
+    def _open(self, device):
+        device.open()
+        if isinstance(device, RobotDevice) and device.client is not None:
+            device.client.start()
+
+    def subscribe(self, kind, callback):
+        """
+        subscribe(kind, callback)
+            - registers a function for the data of all devices, it is called on the loop thread and must return quickly
+        transfer parameters:
+            kind:     string, 'frame' (callback(reading)) or 'line' (callback((device, line)))
+            callback: function
+        """
+        self._subscribers[kind] = self._subscribers[kind] + [callback]
+
+    def publish(self, kind, item):
+        """
+        publish(kind, item)
+            - hands data of a device to the subscribers (called by the devices)
+        """
+        for callback in self._subscribers[kind]:
+            try:
+                callback(item)
+            except Exception as e:
+                print(f"{kind} subscriber failed: {e}")
+
+    def run(self):
+        """
+        run()
+            - opens all devices and serves them until stop() is called (blocks the calling thread)
+        """
+        asyncio.set_event_loop(self.loop)
+        for device in self.devices.values():
+            self._open(device)
+        try:
+            self.loop.run_forever()
+        finally:
+            for device in self.devices.values():
+                device.close()
+            # end the job tasks of the robots
+            tasks = asyncio.all_tasks(self.loop)
+            for task in tasks:
+                task.cancel()
+            self.loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+
+    def start(self):
+        """
+        start()
+            - runs the loop on one thread for all devices
+        """
+        if self._thread is None:
+            self._thread = threading.Thread(target=self.run, name='DeviceLoop', daemon=True)
+            self._thread.start()
+
+    def call(self, function, *args):
+        """
+        call(function, *args)
+            - executes a function on the loop thread (e.g. a write) and waits for the result
+        transfer parameters:
+            function: function to be executed
+            args:     parameters of the function
+        return parameter:
+            result: object, return value of the function
+        """
+        async def wrapper():
+            return function(*args)
+        return asyncio.run_coroutine_threadsafe(wrapper(), self.loop).result()
+
+    def device(self, kind, rack=None):
+        """
+        device(kind, rack=None)
+            - returns the first device of a kind (and rack)
+        transfer parameters:
+            kind: string, 'monitoring' or 'robot'
+            rack: string, rack name (None: any rack)
+        return parameter:
+            device: Device or None
+        """
+        for device in self.devices.values():
+            if device.kind == kind and (rack is None or device.rack == rack):
+                return device
+        return None
+
+    def racks(self):
+        """
+        racks()
+            - returns the names of all racks
+        return parameter:
+            racks: list, rack names in the order of the configuration
+        """
+        return list(dict.fromkeys(device.rack for device in self.devices.values()))
+
+    def stats(self):
+        """
+        stats()
+            - returns the state of all devices
+        return parameter:
+            stats: list, dict per device
+        """
+        return [device.stats() for device in self.devices.values()]
+
+    def stop(self):
+        """
+        stop()
+            - stops the loop and closes all devices
+        """
+        if self.loop.is_running():
+            self.loop.call_soon_threadsafe(self.loop.stop)
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+def load_devices(path='devices.json'):
+    """
+    load_devices(path='devices.json')
+        - creates a DeviceLoop with the devices of a configuration file
+        - every robot gets the booking table given as "positions" (default: 'positioning.json')
+    transfer parameters:
+        path: string, json file with the list of devices
+    return parameter:
+        loop: DeviceLoop, loop with all devices (not started yet)
+    """
+    with open(path, 'r') as file:
+        config = json.load(file)
+
+    tables = {}
+    loop = DeviceLoop()
+    for entry in config:
+        rack = entry.get('rack', 'rack1')
+        if entry['kind'] == 'monitoring':
+            loop.add(MonitoringDevice(entry['id'], rack, entry['port'], entry.get('baudrate', 115200)))
+        elif entry['kind'] == 'robot':
+            table_path = entry.get('positions', 'positioning.json')
+            if table_path not in tables:
+                tables[table_path] = booking.PositionTable(table_path)
+            loop.add(RobotDevice(entry['id'], rack, entry['port'], entry.get('baudrate', 9600), tables[table_path]))
+        else:
+            raise ValueError(f"Unknown device kind '{entry['kind']}' of '{entry['id']}'")
+    return loop
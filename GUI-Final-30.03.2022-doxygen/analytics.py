@@ -0,0 +1,324 @@
+'''
+module name: analytics.py
+
+info:
+    This module contains the rolling statistics of the telemetry channels and the drift detection.
+    For every window (e.g. the last hour and the last 24 hours) mean, standard deviation, minimum, maximum
+    and slope of all channels are computed with numpy, one column per channel.
+    A new frame only updates the running sums of the window (mean, deviation and slope), minimum and maximum
+    are computed from the stored samples when they are requested. All channels over 24 hours take about 2 ms.
+    A drift rule flags a channel whose mean has left its range or whose trend will leave it soon,
+    e.g. the pH outside of 5 - 8.5 (the range of the pH plot). The trend is only projected once the window
+    covers enough time and samples, and a state has to be found several times in a row before it is reported,
+    so the noise of a short window does not switch an alert on and off.
+'''
+
+import threading
+import time
+from collections import namedtuple
+
+import numpy as np
+
+import farmlog
+import telemetry
+
+DRIFT_LOG = farmlog.get('analytics')
+
+""" windows of the statistics in seconds """
+WINDOWS = {'1h': 3600, '24h': 86400}
+
+""" drift rule: channel index, allowed range, window of the statistics and seconds the trend is projected into the future """
+DriftRule = namedtuple('DriftRule', 'channel low high window horizon')
+
+DEFAULT_RULES = (DriftRule(8, 5.0, 8.5, '1h', 6 * 3600),      # pH, range of the pH plot
+                 DriftRule(1, 15.0, 25.0, '1h', 6 * 3600))    # water temperature, range of the temperature plot
+
+
+class RollingWindow:
+    """
+    class RollingWindow contains the samples of all channels of the last seconds and their running sums
+        - append
+        - extend
+        - stats
+    attributes:
+        seconds: float, length of the window
+        count:   int, number of samples in the window
+    """
+
+    def __init__(self, seconds, channels=telemetry.FRAME_CHANNELS, capacity=1024):
+        """
+        transfer parameters:
+            seconds:  float, length of the window
+            channels: int, number of values per frame
+            capacity: int, initial number of stored frames (the storage grows with the frame rate)
+        """
+        self.seconds = seconds
+        self.channels = channels
+        self._t = np.zeros(capacity)
+        self._v = np.zeros((capacity, channels))
+        self._start = 0
+        self._end = 0
+        self._origin = 0.0
+        self._reset_sums()
+
+    @property
+    def count(self):
+        return self._end - self._start
+
+    def _reset_sums(self):
+        # sums of t, t², v, v² and t·v, t relative to _origin so the squares stay small
+        self._st = 0.0
+        self._stt = 0.0
+        self._sv = np.zeros(self.channels)
+        self._svv = np.zeros(self.channels)
+        self._stv = np.zeros(self.channels)
+
+    def _add(self, t, v, sign):
+        # t: (n,), v: (n, channels), sign +1 adds the samples, -1 removes them
+        t = t - self._origin
+        self._st += sign * t.sum()
+        self._stt += sign * (t * t).sum()
+        self._sv += sign * v.sum(axis=0)
+        self._svv += sign * (v * v).sum(axis=0)
+        self._stv += sign * (t @ v)
+
+    def _make_room(self, n):
+        count = self.count
+        if self._end + n <= len(self._t):
+            return
+        capacity = len(self._t)
+        while count + n > capacity // 2:
+            capacity *= 2
+        t = np.zeros(capacity)
+        v = np.zeros((capacity, self.channels))
+        t[:count] = self._t[self._start:self._end]
+        v[:count] = self._v[self._start:self._end]
+        self._t, self._v = t, v
+        self._start, self._end = 0, count
+        # the running sums are computed anew with every compaction, so rounding errors can not pile up
+        self._origin = t[0] if count else 0.0
+        self._reset_sums()
+        self._add(t[:count], v[:count], 1)
+
+    def _evict(self, now):
+        start = self._start + int(np.searchsorted(self._t[self._start:self._end], now - self.seconds, 'left'))
+        if start > self._start:
+            self._add(self._t[self._start:start], self._v[self._start:start], -1)
+            self._start = start
+
+    def append(self, timestamp, values):
+        """
+        append(timestamp, values)
+            - adds one frame and removes the frames which have left the window
+        transfer parameters:
+            timestamp: float, unix time of the frame (ascending)
+            values:    list, channel values
+        """
+        self.extend(np.array([timestamp], dtype=float), np.array([values[:self.channels]], dtype=float))
+
+    def extend(self, times, values):
+        """
+        extend(times, values)
+            - adds several frames at once (e.g. the stored history at the start)
+        transfer parameters:
+            times:  array, unix times (ascending)
+            values: array, (frames, channels) channel values
+        """
+        n = len(times)
+        if n == 0:
+            return
+        if self.count == 0:
+            # t² of absolute unix times (about 1e18) would cancel out in the variance of t, the sums use t - origin
+            self._origin = float(times[0])
+            self._reset_sums()
+        self._make_room(n)
+        self._t[self._end:self._end + n] = times
+        self._v[self._end:self._end + n] = values
+        self._add(self._t[self._end:self._end + n], self._v[self._end:self._end + n], 1)
+        self._end += n
+        self._evict(times[-1])
+
+    def stats(self, extremes=True):
+        """
+        stats(extremes=True)
+            - computes the statistics of all channels over the window
+            - mean, deviation and slope come from the running sums, only minimum and maximum read the stored samples
+        transfer parameters:
+            extremes: boolean, False skips minimum and maximum
+        return parameter:
+            stats: dict, count and one array per value (one entry per channel):
+                   mean, std, min, max, slope (change per hour), None if the window is empty
+        """
+        n = self.count
+        if n == 0:
+            return None
+        mean = self._sv / n
+        var = np.maximum(self._svv / n - mean * mean, 0.0)
+        t_var = self._stt / n - (self._st / n) ** 2
+        if n > 1 and t_var > 1e-9:
+            slope = (self._stv / n - (self._st / n) * mean) / t_var * 3600
+        else:
+            slope = np.zeros(self.channels)
+        stats = {'count': n, 'start': self._t[self._start], 'end': self._t[self._end - 1],
+                 'mean': mean, 'std': np.sqrt(var), 'slope': slope}
+        if extremes:
+            window = self._v[self._start:self._end]
+            stats['min'] = window.min(axis=0)
+            stats['max'] = window.max(axis=0)
+        return stats
+
+
+class Analytics:
+    """
+    class Analytics keeps the rolling statistics of several windows up to date and checks the drift rules
+        - update
+        - preload
+        - stats
+        - alerts
+        - report
+    """
+
+    def __init__(self, windows=WINDOWS, rules=DEFAULT_RULES, min_span=900, min_samples=30, confirm=3):
+        """
+        transfer parameters:
+            windows:     dict, name -> seconds of every window
+            rules:       list, DriftRule tuples
+            min_span:    float, seconds the window has to cover before its trend is projected
+            min_samples: int, samples the window has to contain before its trend is projected
+            confirm:     int, number of checks in a row a new state has to be found before it is reported
+        """
+        self.windows = {name: RollingWindow(seconds) for name, seconds in windows.items()}
+        self.rules = list(rules)
+        self.min_span = min_span
+        self.min_samples = min_samples
+        self.confirm = confirm
+        self._alerts = {}
+        self._states = {}
+        self._candidates = {}
+        # update is called by the monitoring thread, stats by the GUI and the control interface
+        self._lock = threading.Lock()
+
+    def update(self, timestamp, values):
+        """
+        update(timestamp, values)
+            - adds a frame to all windows and checks the drift rules (subscribed with Visualization.subscribe)
+        transfer parameters:
+            timestamp: float, unix time of the frame
+            values:    list, channel values
+        """
+        with self._lock:
+            for window in self.windows.values():
+                window.append(timestamp, values)
+            self._check()
+
+    def preload(self, history):
+        """
+        preload(history)
+            - fills the windows with the stored history, so the statistics are complete right after the start
+        transfer parameters:
+            history: function, history(channel, start, end) returning (timestamp, value) rows (Visualization.get_history)
+        """
+        seconds = max(window.seconds for window in self.windows.values())
+        end = time.time()
+        columns = [history(channel, end - seconds, end) for channel in range(telemetry.FRAME_CHANNELS)]
+        # the frames are stored with the same timestamp for all channels, frames with missing channels are skipped
+        times = np.array([row[0] for row in columns[0]], dtype=float)
+        values = np.full((len(times), telemetry.FRAME_CHANNELS), np.nan)
+        for channel, rows in enumerate(columns):
+            if not rows:
+                continue
+            rows = np.array(rows, dtype=float)
+            index = np.searchsorted(times, rows[:, 0])
+            found = index < len(times)
+            found[found] = times[index[found]] == rows[found, 0]
+            values[index[found], channel] = rows[found, 1]
+        complete = ~np.isnan(values).any(axis=1)
+        with self._lock:
+            for window in self.windows.values():
+                if window.count == 0:
+                    window.extend(times[complete], values[complete])
+            self._check()
+
+    def _check(self):
+        computed = {}
+        for rule in self.rules:
+            # the rules of the same window share its statistics
+            if rule.window not in computed:
+                computed[rule.window] = self.windows[rule.window].stats(extremes=False)
+            stats = computed[rule.window]
+            if stats is None:
+                continue
+            mean = stats['mean'][rule.channel]
+            if stats['count'] >= self.min_samples and stats['end'] - stats['start'] >= self.min_span:
+                projected = mean + stats['slope'][rule.channel] * rule.horizon / 3600
+            else:
+                # the slope of a few minutes is mostly noise
+                projected = mean
+            name = telemetry.CHANNEL_NAMES[rule.channel]
+            if not rule.low <= mean <= rule.high:
+                state = 'outside'
+                message = f"{name} {mean:.2f} outside of {rule.low:g} - {rule.high:g}"
+            elif not rule.low <= projected <= rule.high:
+                state = 'trending'
+                message = f"{name} trending out of {rule.low:g} - {rule.high:g} ({projected:.2f} in {rule.horizon / 3600:g} h)"
+            else:
+                state = message = None
+            current = self._states.get(rule)
+            if state != current:
+                # a new state is only taken over after it has been found confirm times in a row
+                candidate, hits = self._candidates.get(rule, (None, 0))
+                hits = hits + 1 if candidate == state else 1
+                self._candidates[rule] = (state, hits)
+                if hits < self.confirm:
+                    continue
+                # only changes are reported, the values in the message change with every frame
+                if message:
+                    DRIFT_LOG.warning("Drift: " + message, channel=name, state=state)
+                else:
+                    DRIFT_LOG.info("Drift: " + name + " back in range", channel=name)
+                self._states[rule] = state
+            self._candidates.pop(rule, None)
+            if message:
+                self._alerts[rule] = message
+            else:
+                self._alerts.pop(rule, None)
+
+    def stats(self, window):
+        """
+        stats(window)
+            - returns the statistics of a window
+        transfer parameters:
+            window: string, name of the window (e.g. '24h')
+        return parameter:
+            stats: dict, see RollingWindow.stats
+        """
+        with self._lock:
+            return self.windows[window].stats()
+
+    def alerts(self):
+        """
+        alerts()
+            - returns the active drift alerts
+        return parameter:
+            alerts: list, messages of the rules which are violated
+        """
+        with self._lock:
+            return list(self._alerts.values())
+
+    def report(self, window):
+        """
+        report(window)
+            - returns the statistics of a window per channel name (e.g. for the GUI or the control interface)
+        transfer parameters:
+            window: string, name of the window
+        return parameter:
+            report: dict, window, count, alerts and {channel name: {mean, std, min, max, slope}}
+        """
+        stats = self.stats(window)
+        report = {'window': window, 'count': 0, 'alerts': self.alerts(), 'channels': {}}
+        if stats is None:
+            return report
+        report['count'] = stats['count']
+        for channel, name in enumerate(telemetry.CHANNEL_NAMES):
+            report['channels'][name] = {key: float(stats[key][channel]) for key in ('mean', 'std', 'min', 'max', 'slope')}
+        return report
@@ -8,31 +8,75 @@ info:
 '''
 
 #from tkinter import *
+import os
 import time
-from datetime import datetime
-import Adafruit_PCA9685
 from array import array
-import serial
 
-import csv
-import json
+import telemetry
+import robot_client
+import planner
+import ringbuffer
+import history
+import booking
+import scheduler
+import actuator
+import devices
+import metrics
+import farmlog
 
-import matplotlib
-import matplotlib.animation as animation
-from matplotlib import style
-matplotlib.use("TkAgg")
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-from matplotlib.figure import Figure
+""" 
+    hardware selection, used to run the software with the simulator (python -m simulator)
+    FARMER_ROBOT_PORT: serial port of the robot arduino
+    FARMER_MONITOR_PORT: serial port of the monitoring arduino
+    FARMER_FAKE_PWM: if set, the PCA9685 is replaced by simulator.FakePCA9685
+    FARMER_NUTRIENT_CHANNEL: pwm channel of the nutrient pump (1 is shared with the ground floor light,
+                             the automatic dosing needs a channel of its own)
+"""
+ROBOT_PORT = os.environ.get('FARMER_ROBOT_PORT', '/dev/ttyACM0')
+MONITOR_PORT = os.environ.get('FARMER_MONITOR_PORT', '/dev/ttyACM1')
+FAKE_PWM = bool(os.environ.get('FARMER_FAKE_PWM'))
+NUTRIENT_CHANNEL = int(os.environ.get('FARMER_NUTRIENT_CHANNEL', 1))
 
-""" activate style for live plots """
-style.use('ggplot')
+""" pwm channels of the lights: ground floor, first floor, second floor, third floor """
+LIGHT_CHANNELS = (1, 4, 5, 8)
 
 """ 
-    create instance of the class
-    set pwm frequency to 70 Hz
+    registry of the hardware and the other expensive resources, every resource is created on first use
+    (e.g. hw.robot_arm), so importing the module does not open ports or initialize the I2C bus
 """
-pwm = Adafruit_PCA9685.PCA9685()
-pwm.set_pwm_freq(70)
+hw = devices.Registry()
+
+def _create_pwm():
+    """ create instance of the class and set pwm frequency to 70 Hz """
+    if FAKE_PWM:
+        from simulator import FakePCA9685
+        pwm = FakePCA9685()
+    else:
+        import Adafruit_PCA9685
+        pwm = Adafruit_PCA9685.PCA9685()
+    pwm.set_pwm_freq(70)
+    return pwm
+
+def _create_actuators():
+    """ 
+    service owning the pwm board, all channels are set through it (thread-safe, non-blocking)
+    only channels whose value has changed are written
+    """
+    service = actuator.PWMService(actuator.PCA9685Bus(hw.pwm))
+    service.start()
+    metrics.counter('farmer_pwm_commands_total', 'Received pwm commands').set_function(lambda: service.commands)
+    metrics.counter('farmer_pwm_transfers_total', 'I2C transfers to the pwm board').set_function(lambda: service.transfers)
+    metrics.counter('farmer_pwm_skipped_total', 'Channel writes skipped because the value was unchanged').set_function(lambda: service.skipped)
+    metrics.gauge('farmer_pwm_queue', 'Pwm commands waiting for the service thread').set_function(service._queue.qsize)
+    return service
+
+""" loggers of the hot paths, the records are written by the writer thread of farmlog.py """
+ROBOT_LOG = farmlog.get('robot')
+PWM_LOG = farmlog.get('pwm')
+BOOKING_LOG = farmlog.get('booking')
+
+hw.register('pwm', _create_pwm)
+hw.register('actuators', _create_actuators, close=actuator.PWMService.stop)
 
 """ array for the light control checkboxes """
 state_boxes = array('I', [0, 0, 0, 0])
@@ -55,6 +99,19 @@ ON_OFF_TIME = [0, 0, 0, 0, 0]
 ON_OFF_TIME_S = ['00:00:00', '00:00:00']
 off_char = '00:00:00'
 
+""" scheduler for the time switched actions (lights on and off) """
+timers = scheduler.Scheduler()
+metrics.counter('farmer_scheduler_executed_total', 'Executed scheduled actions').set_function(lambda: timers.executed)
+metrics.counter('farmer_scheduler_late_total', 'Scheduled actions executed more than 1 s late').set_function(lambda: timers.late)
+metrics.gauge('farmer_scheduler_max_lag_seconds', 'Largest delay of a scheduled action').set_function(lambda: timers.max_lag)
+
+""" metrics of the monitoring path (see metrics.py) """
+FRAMES = metrics.counter('farmer_frames_total', 'Processed monitoring frames')
+FRAME_ERRORS = metrics.counter('farmer_frame_errors_total', 'Rejected telemetry data', ('kind',))
+FRAME_SECONDS = metrics.histogram('farmer_frame_seconds', 'Processing time of a monitoring frame (buffers, history, listeners)')
+LISTENER_ERRORS = metrics.counter('farmer_frame_listener_errors_total', 'Exceptions raised by frame listeners')
+SAVE_DATA_SECONDS = metrics.histogram('farmer_save_data_seconds', 'Duration of save_data (text files of the channels)')
+
 """ array for saving the data sent by the monitoring arduino """
 
 VIAL_PARAMETERS = [0,  # index 0: temp air
@@ -69,13 +126,82 @@ VIAL_PARAMETERS = [0,  # index 0: temp air
                    0,  # index 9: ec tank
                    0]  # index 10: time
 
+""" number of samples per channel kept in memory for the live plots """
+PLOT_WINDOW = 8
+
+""" ring buffers with the latest samples of every channel, same index as VIAL_PARAMETERS """
+CHANNELS = [ringbuffer.RingBuffer(PLOT_WINDOW) for i in range(telemetry.FRAME_CHANNELS)]
+
+""" 
+    optional persistence of the channel buffers
+    CHANNEL_FILES: text file for each persisted channel index
+    PERSIST_INTERVAL: the files are rewritten every PERSIST_INTERVAL frames, 0 disables the persistence
+"""
+CHANNEL_FILES = {0: 'air_tmp.txt',
+                 1: 'water_tmp.txt',
+                 2: 'level_T.txt',
+                 3: 'level_1.txt',
+                 4: 'level_2.txt',
+                 7: 'pH_voltage.txt',
+                 8: 'pH.txt',
+                 9: 'EC.txt'}
+PERSIST_INTERVAL = 0
+
+def _open_serial(port, baudrate, timeout):
+    import serial
+    return serial.Serial(port, baudrate, timeout=timeout)
+
+def _create_robot_arm():
+    """ client executing the relocation jobs one after another """
+    client = robot_client.RobotClient(hw.robot, hw.positions)
+    client.start()
+    metrics.gauge('farmer_robot_queue', 'Relocation jobs waiting for the robot').set_function(client._queue.qsize)
+    return client
+
+def _create_analytics():
+    """ rolling statistics and drift detection, filled with the stored history and updated with every frame """
+    import analytics
+    
+    stats = analytics.Analytics()
+    stats.preload(hw.log_store.query)
+    Visualization.subscribe(stats.update)
+    return stats
+
+def _create_dosing():
+    """ automatic dosing of the nutrient pump, reacts to every frame while it is enabled """
+    import dosing
+    
+    controller = dosing.DosingController(hw.actuators, channel=NUTRIENT_CHANNEL, reserved=LIGHT_CHANNELS)
+    hw.actuators.add_listener(controller.on_write)
+    Visualization.subscribe(controller.update)
+    metrics.gauge('farmer_dosing_duty', 'Duty cycle of the nutrient pump set by the automatic dosing').set_function(lambda: controller.duty)
+    return controller
+
+def _create_profiler():
+    """ sampling profiler of all threads, idle until it is started (SIGUSR2 or the control interface) """
+    import profiler
+    
+    return profiler.Profiler()
+
 """ 
-    creating the instances for the serial communication
-    robot >> robot arduino
-    data >> monitoring arduino
+    log_store: persistent history of all frames (replaces the monitoringlog.csv file)
+    robot: serial port of the robot arduino
+    data: serial port of the monitoring arduino
+    positions: booking table of the cultivation positions, loaded once from 'positioning.json'
+    robot_arm: robot client, its reader (robot_arm.reader) distributes the lines sent by the robot to its subscribers
+    analytics: rolling statistics of the channels and drift detection (analytics.py)
+    dosing: controller of the nutrient pump (dosing.py)
+    profiler: sampling profiler of all threads, switched on and off at runtime (profiler.py)
+    capture: recorder of the raw serial data (capture.py), only registered by farmer.py --capture
 """
-robot = serial.Serial('/dev/ttyACM0', 9600)
-data = serial.Serial('/dev/ttyACM1', 115200, timeout=10)
+hw.register('log_store', lambda: history.HistoryStore('monitoringlog.db'), close=history.HistoryStore.close)
+hw.register('robot', lambda: _open_serial(ROBOT_PORT, 9600, 1), close=lambda port: port.close())
+hw.register('data', lambda: _open_serial(MONITOR_PORT, 115200, 10), close=lambda port: port.close())
+hw.register('positions', lambda: booking.PositionTable('positioning.json'), close=booking.PositionTable.flush)
+hw.register('robot_arm', _create_robot_arm, close=robot_client.RobotClient.stop)
+hw.register('analytics', _create_analytics)
+hw.register('dosing', _create_dosing, close=lambda controller: controller.disable())
+hw.register('profiler', _create_profiler, close=lambda profiler: profiler.stop())
 
 
 class Config:
@@ -91,42 +217,19 @@ class Config:
     def edit_positioning(position, booked, species):
         """
         edit_positioning(position, booked, species)
-            - edits the different parameters of the 'positioning.json' file
+            - edits the different parameters of a position in the booking table
+            - the change is written to the 'positioning.json' file in the background
         transfer parameters:
             position:   int, position in the cultivation system
             booked:     boolean, state of booking (True or False)
             species:    string, species of the cultivated plant
         """
-        print("Editing data")
+        current = hw.positions.get(position)
+        if current is not None:
+            BOOKING_LOG.debug("Editing position", position=current.position, booked=current.booked, species=current.species)
         
-        if (species == "None"):
-            species = None
-        
-        #Edit data
-        new_data = []
-
-        with open('positioning.json', 'r') as file:
-            data_temp = json.load(file)
-        i=0
-        for edit in data_temp:
-            if (i == int(position)):
-                position_ = edit["position"]
-                booked_ = edit["booked"]
-                species_ = edit["species"]
-
-                print(f"Current Position : {position_}")
-                print(f"Current booking state : {booked_}")
-                print(f"Current species : {species_}")
-                new_data.append({"position": position, "booked": booked, "species": species})
-                i=i+1
-            else:
-                new_data.append(edit)
-                i=i+1
-
-        with open('positioning.json', 'w') as file:
-            json.dump(new_data, file, indent=4)
-        
-        print("File 'positioning.json' successfully updated.")
+        hw.positions.update(position, booked, species)
+        BOOKING_LOG.info("Booking table updated", position=position, booked=booked, species=species)
     
     
     def switch_position(old, new):
@@ -134,43 +237,17 @@ class Config:
         switch_position(old, new)
             - exchanges the information in case of displacement of a planting
             - information of the initial position is moved to the target position and then reset
+            - both changes are written to the 'positioning.json' file together
         transfer parameters:
             old: int, initial position
             new: int, target position
         """
         
-        data_old = [0, 0, 0]
-        data_reset = [old, False, None]
-        
-        # Check and save old data
-        i=0
-        with open('positioning.json', 'r') as file:
-            data = json.load(file)
-        
-        for view in data:
-            if (i == int(old)):
-                data_old[0] = view["position"]
-                data_old[1] = view["booked"]
-                data_old[2] = view["species"]
-                i=i+1
-            else:
-                i=i+1
-        print(data_old)
-        
-        # Overwrite new position
-        Config.edit_positioning(new, data_old[1], data_old[2])
-        
-        # Clear old position
-        Config.edit_positioning(data_reset[0], data_reset[1], data_reset[2])
-        
-        print("Editing File successful.")
-        print("Old data: ")
-        print(data_old)
-        print("\n")
-        print("Cleared old data: ")
-        print(data_reset)
-        print("\n")
-        print("New data: ")
+        data_old = hw.positions.get(old)
+        data_new = hw.positions.move(old, new)
+        BOOKING_LOG.info("Position moved", old=old, new=new, species=data_new.species if data_new is not None else None)
+        if BOOKING_LOG.enabled(farmlog.DEBUG):
+            BOOKING_LOG.debug("Position entries", before=data_old, cleared=hw.positions.get(old), after=data_new)
     
     
     def check_booking(pos):
@@ -184,27 +261,17 @@ class Config:
             label_string: string, Label string for printing the information on the UI
         """
         
-        print(f"Checking Booking position: {pos}")
-        i=0
-        with open('positioning.json', 'r') as file:
-            data = json.load(file)
-        
-        for view in data:
-            if (i == int(pos)):
-                position = view["position"]
-                booked = view["booked"]
-                species = view["species"]
-                
-                if (species == None):
-                    label_string = "Requested position: " + str(position) + ",\n" + "booking state: " + str(booked) + ",\n" + "no cultivated species"
-                    print(label_string)
-                    return label_string
-                else:
-                    label_string = "Requested position: " + str(position) + ",\n" + "booking state: " + str(booked) + ",\n" + "cultivated species: " + str(species)
-                    print(label_string)
-                    return label_string
-            else:
-                i=i+1
+        BOOKING_LOG.debug("Checking booking", position=pos)
+        view = hw.positions.get(pos)
+        if view is None:
+            return None
+        
+        if (view.species == None):
+            label_string = "Requested position: " + str(view.position) + ",\n" + "booking state: " + str(view.booked) + ",\n" + "no cultivated species"
+        else:
+            label_string = "Requested position: " + str(view.position) + ",\n" + "booking state: " + str(view.booked) + ",\n" + "cultivated species: " + str(view.species)
+        BOOKING_LOG.debug("Booking checked", position=view.position, booked=view.booked, species=view.species)
+        return label_string
     
     
     def return_booking_state(pos):
@@ -215,22 +282,13 @@ class Config:
         transfer parameters:
             pos: int, position to be checked
         return parameter:
-            booked: boolean, state of booking
+            booked: boolean, state of booking (None if the position does not exist)
         """
         
-        print(f"Checking Booking position: {pos}")
-        i=0
-        with open('positioning.json', 'r') as file:
-            data = json.load(file)
-        
-        for view in data:
-            if (i == int(pos)):
-                #position = view["position"]
-                booked = view["booked"]
-                #species = view["species"]
-                return booked
-            else:
-                i=i+1
+        view = hw.positions.get(pos)
+        if view is None:
+            return None
+        return view.booked
 
 
 class Control_Parameters:
@@ -241,9 +299,13 @@ class Control_Parameters:
         - change_val_lights
         - change_val_pump
         - change_val_nutrients
+        - start_dosing
+        - stop_dosing
+        - dosing_status
         - reset_pwm_channels
         - get_current_time
         - check_time
+        - update_schedule
         - start_circulation
         - stop_circulation
     """
@@ -288,6 +350,7 @@ class Control_Parameters:
         ON_OFF_TIME_S[1] = str(off_h)+':'+str(off_m)+':00'
         
         print(ON_OFF_TIME_S)
+        Control_Parameters.update_schedule()
     
     
     def change_val_lights(value):
@@ -298,7 +361,7 @@ class Control_Parameters:
             value: int, pwm value between 0 and 4095
         """
         
-        print(value)
+        PWM_LOG.debug("Lights value", value=value)
         if (value == 0):
             real_eg = 0
             real_fst = 0
@@ -306,32 +369,30 @@ class Control_Parameters:
             real_trd = 0
         else:
             dez_val = (1 / value) * 100
-            print(dez_val)
             
             real_eg = (4095 / dez_val)
             real_fst = (4095 / dez_val)
             real_snd = (4095 / dez_val)
             real_trd = (4095 / dez_val)
         
+        # all selected channels are written together, unchanged channels are skipped by the service
+        channels = {}
         if (state_boxes[0] == 1):
-            pwm.set_pwm(1, 0, int(real_eg))
-            print("PWM Setted (EG). Value: ")
-            print(int(real_eg))
+            channels[LIGHT_CHANNELS[0]] = int(real_eg)
             
         if (state_boxes[1] == 1):
-            pwm.set_pwm(4, 0, int(real_fst))
-            print("PWM Setted (1). Value: ")
-            print(int(real_fst))
+            channels[LIGHT_CHANNELS[1]] = int(real_fst)
         
         if (state_boxes[2] == 1):
-            pwm.set_pwm(5, 0, int(real_snd))
-            print("PWM Setted (2). Value: ")
-            print(int(real_snd))
+            channels[LIGHT_CHANNELS[2]] = int(real_snd)
             
         if (state_boxes[3] == 1):
-            pwm.set_pwm(8, 0, int(real_trd))
-            print("PWM Setted (3). Value: ")
-            print(int(real_trd))
+            channels[LIGHT_CHANNELS[3]] = int(real_trd)
+        
+        if not channels:
+            return
+        hw.actuators.set_many(channels)
+        PWM_LOG.info("PWM set", channels=channels)
 
     
     def change_val_pump(value):
@@ -342,54 +403,80 @@ class Control_Parameters:
             value: int, pwm value between 0 and 4095
         """
         
-        print(value)
         if (value == 0):
-            pwm.set_pwm(9, 0, value)
+            hw.actuators.set(9, value)
+            PWM_LOG.info("PWM set", channel=9, pwm=0)
         else:
             dez_val = (1 / value) * 100
-            print(dez_val)
             real_val = (4095 / dez_val)
-            pwm.set_pwm(9, 0, int(real_val))
-            print("PWM Setted (9). Value: ")
-            print(int(real_val))
+            hw.actuators.set(9, int(real_val))
+            PWM_LOG.info("PWM set", channel=9, pwm=int(real_val), value=value)
     
     def change_val_nutrients(value):
         """
         change_val_nutrients(value)
             - changes the pwm value of the nutrients pump
+            - the manual value ends the automatic dosing
         transfer parameters:
             value: int, pwm value between 0 and 4095
         """
         
-        print(value)
+        if hw.created('dosing') and hw.dosing.enabled:
+            hw.dosing.disable()
+            print("Automatic dosing stopped.")
         if (value == 0):
-            pwm.set_pwm(1, 0, value)
+            hw.actuators.set(NUTRIENT_CHANNEL, value)
+            PWM_LOG.info("PWM set", channel=NUTRIENT_CHANNEL, pwm=0)
         else:
             dez_val = (1 / value) * 100
-            print(dez_val)
             real_val = (4095 / dez_val)
-            pwm.set_pwm(1, 0, int(real_val))
-            print("PWM Setted (1). Value: ")
-            print(int(real_val))
+            hw.actuators.set(NUTRIENT_CHANNEL, int(real_val))
+            PWM_LOG.info("PWM set", channel=NUTRIENT_CHANNEL, pwm=int(real_val), value=value)
+    
+    def start_dosing(setpoint, mode='hysteresis', sensor=9):
+        """
+        start_dosing(setpoint, mode='hysteresis', sensor=9)
+            - starts the automatic dosing of the nutrient pump
+            - the pump is limited in rate and dose per hour and stopped while the pH is outside of 5 - 8.5 (see dosing.py)
+            - raises ValueError while the nutrient pump shares its channel with a light (FARMER_NUTRIENT_CHANNEL)
+        transfer parameters:
+            setpoint: float, target value of the sensor (e.g. 700 ppm TDS)
+            mode:     string, 'hysteresis' or 'pid'
+            sensor:   int, index for the VIAL_PARAMETERS array (9: TDS)
+        """
+        
+        hw.dosing.configure(setpoint=float(setpoint), mode=mode, sensor=int(sensor))
+        hw.dosing.enable()
+        print("Automatic dosing started. Setpoint: " + str(setpoint))
+    
+    def stop_dosing():
+        """
+        stop_dosing()
+            - stops the automatic dosing and the nutrient pump
+        """
+        
+        hw.dosing.disable()
+        print("Automatic dosing stopped.")
+    
+    def dosing_status():
+        """
+        dosing_status()
+            - returns the state of the automatic dosing
+        return parameter:
+            status: dict, setpoint, value, duty cycle, dose of the last hour and the latency from frame to pump write
+        """
+        
+        return hw.dosing.status()
     
     def reset_pwm_channels():
         """
         reset_pwm_channels
-            - resets all pwm channels
+            - resets all pwm channels with one write (non-blocking)
         """
         
-        channel = 0
         print("Resetting PWM Channels...")
-        time.sleep(.25)
-
-        while channel < 16:
-            print("Channel:", channel)
-            pwm.set_pwm(channel, 0, 0)
-            channel = channel + 1
-            time.sleep(.1)
-
+        hw.actuators.set_all(0)
         print("PWM-Channels resetted.")
-        time.sleep(1)
     
     def get_current_time():
         """
@@ -414,31 +501,44 @@ class Control_Parameters:
     def check_time():
         """
         check_time()
-            - checks the current time and compares it with the ON_OFF_TIME_S Array
-            - if the value matches with the on time, the lights will turned on
-            - if the value matches with the off time, the lights will turned off
+            - runs the scheduler for the time switched actions until the program stops
+            - the thread sleeps until the next on or off time instead of polling the clock
         """
         
-        while True:
-            time_ = Control_Parameters
-            time_now = time_.get_current_time()
-            
-            if time_now == ON_OFF_TIME_S[0] :
-                #cmd = get_on_off(ON_OFF_TIME_S.index(time_now))
-                #print(str(cmd))
-                print("LIGHTS ON")
-                time_.change_val_lights(ON_OFF_TIME[4])
-            
-            if time_now == ON_OFF_TIME_S[1]:    
-                print("LIGHTS ON")
-                time_.change_val_lights(0)
-            
-            if ((ON_OFF_TIME_S[0] == off_char) and (ON_OFF_TIME_S[1] == off_char)):
-                #print("00:00:00 - Manuelle Steuerung");
-                time_.change_val_lights(ON_OFF_TIME[4])
-            
-            #print(time_now)
-            time.sleep(1)
+        Control_Parameters.update_schedule()
+        timers.run()
+    
+    def update_schedule():
+        """
+        update_schedule()
+            - (re)schedules the on and off time of the lights from the ON_OFF_TIME array
+            - applies the state belonging to the current time immediately
+            - if both times are '00:00:00', the lights are controlled manually with the value of ON_OFF_TIME
+        """
+        
+        if ((ON_OFF_TIME_S[0] == off_char) and (ON_OFF_TIME_S[1] == off_char)):
+            #print("00:00:00 - Manuelle Steuerung");
+            timers.cancel('lights_on')
+            timers.cancel('lights_off')
+            Control_Parameters.change_val_lights(ON_OFF_TIME[4])
+            return
+        
+        def lights_on():
+            print("LIGHTS ON")
+            Control_Parameters.change_val_lights(ON_OFF_TIME[4])
+        
+        def lights_off():
+            print("LIGHTS OFF")
+            Control_Parameters.change_val_lights(0)
+        
+        on_job = timers.schedule_daily('lights_on', ON_OFF_TIME[0], ON_OFF_TIME[1], lights_on)
+        off_job = timers.schedule_daily('lights_off', ON_OFF_TIME[2], ON_OFF_TIME[3], lights_off)
+        
+        # the lights are on if the next switching is the off time
+        if off_job.deadline < on_job.deadline:
+            lights_on()
+        else:
+            lights_off()
 
     def start_circulation(pin, val):
         """
@@ -449,7 +549,7 @@ class Control_Parameters:
             val: int, pwm value between 0 and 4095
         """
         
-        pwm.set_pwm(pin, 0, val)
+        hw.actuators.set(pin, val)
     
     def stop_circulation(pin):
         """
@@ -459,109 +559,185 @@ class Control_Parameters:
             pin: int, input pin
         """
         
-        pwm.set_pwm(pin, 0, 0)
+        hw.actuators.set(pin, 0)
 
 class Control_Robot(Config):
     """ 
     class Control_Robot(Config) contains the functions to interact with the robot via serial
         - read_serial
         - relocate
+        - reorganize
+        - relocation_status
     """
     
     def read_serial():
         """
         read_serial()
-            - reads the serial buffer
-            - prints the delivered messages
+            - reads the serial buffer of the robot until the program stops
+            - logs the delivered messages (logger 'robot', shown on the console by the writer thread of farmlog.py)
+            - every line is also handed to the other subscribers of robot_lines (e.g. the relocation)
         """
         
-        robot.flush()
-        while True:            
-            while robot.in_waiting > 0:
-               line=robot.readline().decode('utf-8').rstrip()
-               print(line)
+        hw.robot.reset_input_buffer()
+        lines = hw.robot_arm.reader
+        if hw.created('capture'):
+            lines.tee = hw.capture.tee('robot')
+        lines.subscribe(ROBOT_LOG.info)
+        lines.run()
 
     def relocate(old, new):
         """
         relocate(old, new)
             - checks whether a relocation is possible with the transferring positions. 
                 - if yes:
-                    - sends the relocation command with initial and target positions to the robot
-                    - calls the switch_position function for changing the booking system
+                    - queues the relocation job, the robot client sends the command with initial and target positions to the robot
+                    - the booking system is changed by the robot client as soon as the robot reports success
                 - if not:
                     - print out the error message including the detected problem
         transfer parameters:
             old: int, initial position
             new: new, target position
+        return parameter:
+            job: Job, the queued relocation (None if the relocation is not possible)
         """
         
-        robot.flush()
+        booked_old = Config.return_booking_state(old)
+        booked_new = Config.return_booking_state(new)
         
-        if ((Config.return_booking_state(old) == True) and (Config.return_booking_state(new) == False)):
+        if ((booked_old == True) and (booked_new == False)):
             print("Relocate")
-            print(old + 'T' + new)
-            
-            command = old + 'T' + new
-            end_line = "\n"
-            
-            msg = command.encode()
-            
-            print("Sending message to the robot...")
-            print(msg)
-            robot.write(msg)
-            robot.write(end_line.encode())
-            
-            while robot.in_waiting != 0:
-                line=robot.readline().decode('utf-8').rstrip()
-                print(line)
-                
-                if (line=="Success"):
-                    print("Success. You can now send a new command.")
-                    robot.flush()
-                #    return
-            robot.flush()
-            
-            Config.switch_position(old, new)
+            print(str(old) + 'T' + str(new))
             
-            print("Finished.")
-            #return 0
-        elif (Config.return_booking_state(old) == False):
-            print("Position " + old + " currently has no plant.")
+            job = hw.robot_arm.submit(old, new)
+            print("Relocation queued as job " + str(job.id) + ".")
+            return job
+        elif (booked_old == False):
+            print("Position " + str(old) + " currently has no plant.")
             print("Please check or update the position booking.")
             
-        elif((Config.return_booking_state(old) == False) and (Config.return_booking_state(new) == True)):
-            print("There is currently a plant in position " + new)
-            print("Please check or update the position booking.")
-            
-        elif((Config.return_booking_state(old) == True) and (Config.return_booking_state(new) == True)):
+        elif((booked_old == True) and (booked_new == True)):
             print("There are currently plants in both positions.")
             print("Please check or update the position booking.")
         else:
             print("Something failed by calling the relocate function.")
             print("Please check your intype or update the position booking.")
+        return None
+    
+    def reorganize(target):
+        """
+        reorganize(target)
+            - plans the relocations leading to the target layout (see planner.py) and queues them in the order of execution
+            - positions missing in the target layout keep their plant
+        transfer parameters:
+            target: dict, position -> species of the plant (None for a free position)
+        return parameter:
+            jobs: list, the queued relocations (empty if the target layout is not possible)
+        """
+        
+        current = {}
+        for pos in hw.positions.positions:
+            entry = hw.positions.get(pos)
+            current[pos] = entry.species if entry.booked else None
+        
+        try:
+            moves = planner.plan(current, target)
+        except ValueError as e:
+            print(e)
+            print("Please check the target layout or update the position booking.")
+            return []
+        
+        print(str(len(moves)) + " relocations planned, estimated travel time: " + str(round(planner.plan_cost(moves))) + " s")
+        return hw.robot_arm.submit_many(moves)
+    
+    def relocation_status():
+        """
+        relocation_status()
+            - returns the state of the relocation queue
+        return parameter:
+            stats: dict, queued, running, done and failed jobs, average duration and throughput
+        """
+        
+        return hw.robot_arm.stats()
 
-""" 
-    Creating figures and subplots to online visualize the data
+class Plots:
+    """ 
+    class Plots contains the figures and subplots to online visualize the data, created on first use (hw.plots)
         - f and a to plot the temperature
         - lev and lev_sub to plot the waterlevel
         - pH_plot and pH_sub to plot the pH
         - ec_plot and ec_sub to plot the TDS value (called it ec because it was planned to monitor ec first)
-"""
-f = Figure(figsize=(8,4), dpi=90)
-a = f.add_subplot(111)
+        - live plots drawing the channel buffers into the subplots (temp_live, lev_live, pH_live, ec_live),
+          the lines are created once and updated by the animate functions
+        - history views showing the stored history in the same subplots with zoom and pan
+          (temp_history, lev_history, pH_history, ec_history)
+    matplotlib is only imported when the plots are created
+    """
+    
+    def __init__(self):
+        import matplotlib
+        matplotlib.use("TkAgg")
+        from matplotlib import style
+        from matplotlib.figure import Figure
+        import live_plot
+        
+        # activate style for live plots
+        style.use('ggplot')
+        
+        self.f = Figure(figsize=(8,4), dpi=90)
+        self.a = self.f.add_subplot(111)
+        
+        self.lev = Figure(figsize=(8,4), dpi=90)
+        self.lev_sub = self.lev.add_subplot(111)
+        
+        self.pH_plot = Figure(figsize=(8,4), dpi=90)
+        self.pH_sub = self.pH_plot.add_subplot(111)
+        #pH_vol = pH_plot.add_subplot(111)
+        
+        self.ec_plot = Figure(figsize=(8,4), dpi=90)
+        self.ec_sub = self.ec_plot.add_subplot(111)
+        
+        self.temp_live = live_plot.LivePlot(self.f, self.a, [(CHANNELS[1], 'water temperature tank'),
+                                                             (CHANNELS[0], 'air temperature')],
+                                            ylim=(15, 25), ylabel='Degree (°C)')
+        self.lev_live = live_plot.LivePlot(self.lev, self.lev_sub, [(CHANNELS[2], 'level tank'),
+                                                                    (CHANNELS[3], 'level floor 1'),
+                                                                    (CHANNELS[4], 'level floor 2')],
+                                           ylabel='Waterlevel')
+        self.pH_live = live_plot.LivePlot(self.pH_plot, self.pH_sub, [(CHANNELS[8], 'pH')],
+                                          ylim=(5, 8.5), ylabel='pH-Value')
+        self.ec_live = live_plot.LivePlot(self.ec_plot, self.ec_sub, [(CHANNELS[9], 'TDS')],
+                                          ylabel='TDS (ppm)')
+        
+        history = lambda *args: Visualization.get_history_points(*args)
+        self.temp_history = live_plot.HistoryPlot(self.temp_live, [1, 0], history)
+        self.lev_history = live_plot.HistoryPlot(self.lev_live, [2, 3, 4], history)
+        self.pH_history = live_plot.HistoryPlot(self.pH_live, [8], history)
+        self.ec_history = live_plot.HistoryPlot(self.ec_live, [9], history)
 
-lev = Figure(figsize=(8,4), dpi=90)
-lev_sub = lev.add_subplot(111)
+hw.register('plots', Plots)
 
-pH_plot = Figure(figsize=(8,4), dpi=90)
-pH_sub = pH_plot.add_subplot(111)
-#pH_vol = pH_plot.add_subplot(111)
+""" names of the figures and live plots, still available as module attributes (e.g. backend.pH_live) """
+PLOT_NAMES = ('f', 'a', 'lev', 'lev_sub', 'pH_plot', 'pH_sub', 'ec_plot', 'ec_sub',
+              'temp_live', 'lev_live', 'pH_live', 'ec_live',
+              'temp_history', 'lev_history', 'pH_history', 'ec_history')
 
-ec_plot = Figure(figsize=(8,4), dpi=90)
-ec_sub = ec_plot.add_subplot(111)
+def __getattr__(name):
+    """
+    module attributes of the resources created on first use (e.g. backend.positions, backend.pH_live)
+    """
+    if name in PLOT_NAMES:
+        return getattr(hw.plots, name)
+    if name == 'robot_lines':
+        return hw.robot_arm.reader
+    if name in hw:
+        return hw.get(name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+""" number of frames processed since the start, used for the periodic persistence """
+frame_count = 0
 
-""" boolean var for saving the data to an csv file but do not overwrite the first line """
-header = False
+""" functions called with every processed frame, see Visualization.subscribe """
+frame_listeners = []
 
 
 class Visualization:
@@ -569,7 +745,15 @@ class Visualization:
     class Visualization contains the functions to get, write and visualize data
         - get_parameter
         - get_vial_parameters
+        - process_frame
+        - subscribe
+        - set_plot_window
+        - get_channel
+        - get_samples
         - save_log_file
+        - get_history
+        - get_history_points
+        - get_statistics
         - save_data
         - plot_figure
         - plot_figure2
@@ -595,92 +779,202 @@ class Visualization:
     def get_vial_parameters():
         """
         get_vial_parameters()
-            - receives the measured data from the monitoring arduino
-            - saves the data into the respective text file bond to the current time by calling the save_data function
+            - receives the telemetry frames from the monitoring arduino
+            - decodes them with a telemetry.FrameDecoder, corrupt data is skipped until the next sync marker
+            - hands every valid frame to the process_frame function
+            - the received bytes are also recorded if the serial capture is running (farmer.py --capture)
         """
         
-        data.flush()
+        tee = hw.capture.tee('monitor') if hw.created('capture') else None
+        decoder = telemetry.FrameDecoder()
+        for kind in ('corrupt', 'lost', 'skipped'):
+            FRAME_ERRORS.labels(kind).set_function(lambda kind=kind: getattr(decoder, kind))
+        data = hw.data
+        data.reset_input_buffer()
         while True:
-            msg = ''
-            while data.in_waiting > 0:
-                i = 0
-                time.sleep(0.2)
-                while i < 10:
-                    line = data.readline().decode('utf-8').rstrip()
-                    VIAL_PARAMETERS[i] = round(float(line), 2)
-                    time.sleep(0.1)
-                    i = i + 1
-                VIAL_PARAMETERS[10] = Control_Parameters.get_current_time()
-                data.flush()
-                i = 0
-                
-                Visualization.save_data(0, 'air_tmp.txt')
-                Visualization.save_data(1, 'water_tmp.txt')
-                Visualization.save_data(2, 'level_T.txt')
-                Visualization.save_data(3, 'level_1.txt')
-                Visualization.save_data(4, 'level_2.txt')
-                Visualization.save_data(7, 'pH_voltage.txt')
-                Visualization.save_data(8, 'pH.txt')
-                Visualization.save_data(9, 'EC.txt')
-                #Visualization.save_log_file()
-    
-    def save_log_file():
-        """
-        save_log_file()
-            - saves the VIAL_PARAMETERS data to a csv file for long-term monitoring
-        """
-        
-        current_time = datetime.now()
-        time = current_time.strftime("%m/%d/%Y; %H:%M:%S")
-        if header == False:
-            
-            with open('monitoringlog.csv', 'w', newline='') as write_obj:
-                write_obj = csv.writer(write_obj, delimiter=',', quotechar='"', quoting=csv.QUOTE_MINIMAL)
-                write_obj.writerow(["date; time", "air temperature", "water temperature", "level tank", "level 1", "level 2", "humidity", "pH voltage", "pH", "tds"])
-                header == True
-            
-        with open('monitoringlog.csv', 'a+', newline='') as write_obj:
-            write_obj = csv.writer(write_obj, delimiter=',', quotechar='"', quoting=csv.QUOTE_MINIMAL)
-            write_obj.writerow([time,
-                                VIAL_PARAMETERS[0],
-                                VIAL_PARAMETERS[1],
-                                VIAL_PARAMETERS[2],
-                                VIAL_PARAMETERS[3],
-                                VIAL_PARAMETERS[4],
-                                VIAL_PARAMETERS[5],
-                                VIAL_PARAMETERS[7],
-                                VIAL_PARAMETERS[8],
-                                VIAL_PARAMETERS[9] ])
-        print(time)
-        print("Monitoring log-file updated.")
-
-    def save_data(index, filename):
-        """
-        save_data(index, filename)
-            - saves the measured value from the VIAL_PARAMETERS array at the position index into the respective text file
-            - if there are more than 8 values the first will be overwritten by the second value, the last
-              value will be attached at the end
+            # blocks until at least one byte has arrived (or the port timeout is reached)
+            try:
+                chunk = data.read(data.in_waiting or 1)
+            except Exception:
+                # the port was closed on shutdown
+                if not data.is_open:
+                    return
+                raise
+            if tee is not None and chunk:
+                tee(chunk)
+            for frame in decoder.feed(chunk):
+                Visualization.process_frame(frame.values)
+    
+    def process_frame(values, timestamp=None):
+        """
+        process_frame(values, timestamp=None)
+            - updates the VIAL_PARAMETERS array with the values of one telemetry frame
+            - appends the values to the channel buffers read by the live plots
+            - saves the buffers to the text files every PERSIST_INTERVAL frames by calling the save_data function
+            - hands the frame to the subscribed functions (e.g. the telemetry stream)
         transfer parameters:
-            index:    int, index for the VIAL_PARAMETERS array
-            filename: string, name of the specific text file to store the data
+            values:    list, channel values in the order of the VIAL_PARAMETERS array
+            timestamp: float, unix time of the frame (default: now)
         """
+        global frame_count
         
-        num_lines = sum(1 for line in open(filename))
+        started = time.perf_counter()
+        if timestamp is None:
+            timestamp = time.time()
         
-        if num_lines >= 8:
-            outfile = open(filename, 'r+')
-            lines = outfile.readlines()
-            outfile.seek(0)
-            outfile.truncate()
-            outfile.writelines(lines[1:])
-            outfile.close()
-            
-        outfile = open(filename, 'a')
-        outfile.write(str(VIAL_PARAMETERS[10]))
-        outfile.write(";")
-        outfile.write(str(VIAL_PARAMETERS[index]) + '\n')
+        for i, value in enumerate(values):
+            value = round(value, 2)
+            VIAL_PARAMETERS[i] = value
+            CHANNELS[i].append(timestamp, value)
+        VIAL_PARAMETERS[10] = time.strftime('%H:%M:%S', time.localtime(timestamp))
+        
+        frame_count = frame_count + 1
+        if PERSIST_INTERVAL and frame_count % PERSIST_INTERVAL == 0:
+            Visualization.save_data()
+        Visualization.save_log_file(timestamp)
+        
+        for listener in frame_listeners:
+            try:
+                listener(timestamp, VIAL_PARAMETERS[:telemetry.FRAME_CHANNELS])
+            except Exception as e:
+                LISTENER_ERRORS.inc()
+                print("Frame listener failed: " + str(e))
+        FRAMES.inc()
+        FRAME_SECONDS.observe(time.perf_counter() - started)
+    
+    def subscribe(listener):
+        """
+        subscribe(listener)
+            - registers a function which is called with every processed frame (on the monitoring thread, must return quickly)
+        transfer parameters:
+            listener: function, called as listener(timestamp, values)
+        """
+        global frame_listeners
+        
+        frame_listeners = frame_listeners + [listener]
+    
+    def set_plot_window(samples):
+        """
+        set_plot_window(samples)
+            - changes the number of samples kept for the live plots
+            - raises ValueError if samples is smaller than 1
+        transfer parameters:
+            samples: int, number of samples per channel
+        """
+        global PLOT_WINDOW
+        
+        samples = int(samples)
+        if samples < 1:
+            raise ValueError(f"The plot window must hold at least 1 sample (got {samples})")
+        PLOT_WINDOW = samples
+        for buffer in CHANNELS:
+            buffer.resize(PLOT_WINDOW)
+    
+    def get_channel(index):
+        """
+        get_channel(index)
+            - returns the buffered samples of a channel
+        transfer parameter:
+            index: int, index for the VIAL_PARAMETERS array
+        return parameter:
+            times:  list, timestamps formatted as 'HH:MM:SS'
+            values: array, measured values
+        """
+        
+        times, values = CHANNELS[index].snapshot()
+        return [time.strftime('%H:%M:%S', time.localtime(t)) for t in times], values
+    
+    def get_samples(since):
+        """
+        get_samples(since)
+            - returns the buffered samples of all channels newer than a point in time (e.g. for clients of the control interface)
+        transfer parameter:
+            since: float, unix time, only later samples are returned
+        return parameter:
+            samples: list, [index, times, values] for every channel with new samples
+        """
+        
+        samples = []
+        for index, buffer in enumerate(CHANNELS):
+            times, values = buffer.snapshot()
+            new = [i for i, t in enumerate(times) if t > since]
+            if new:
+                samples.append([index, [times[i] for i in new], [values[i] for i in new]])
+        return samples
+    
+    def save_log_file(timestamp):
+        """
+        save_log_file(timestamp)
+            - saves the VIAL_PARAMETERS data to the history store for long-term monitoring
+            - the store collects the frames and writes them in batches
+        transfer parameters:
+            timestamp: float, unix time of the frame
+        """
+        
+        hw.log_store.add(timestamp, VIAL_PARAMETERS[:telemetry.FRAME_CHANNELS])
+    
+    def get_history(index, start, end):
+        """
+        get_history(index, start, end)
+            - returns the stored samples of a channel in a time range, e.g. the pH of the last week
+        transfer parameters:
+            index: int, index for the VIAL_PARAMETERS array
+            start: float, unix time, begin of the range
+            end:   float, unix time, end of the range
+        return parameter:
+            rows: list, (timestamp, value) tuples sorted by time
+        """
+        
+        return hw.log_store.query(index, start, end)
+    
+    def get_history_points(index, start, end, points, method='lttb'):
+        """
+        get_history_points(index, start, end, points, method='lttb')
+            - returns the stored samples of a channel in a time range, reduced to a number of points (e.g. the width of a plot in pixels)
+            - used by the history view of the plots and the telemetry stream, so a month is drawn as fast as a minute
+        transfer parameters:
+            index:  int, index for the VIAL_PARAMETERS array
+            start:  float, unix time, begin of the range
+            end:    float, unix time, end of the range
+            points: int, maximum number of points
+            method: string, 'lttb' or 'minmax' (see decimate.py)
+        return parameter:
+            times:  array, timestamps of the kept samples
+            values: array, values of the kept samples
+        """
+        import decimate
+        
+        rows = hw.log_store.query(index, start, end)
+        if not rows:
+            return decimate.np.empty(0), decimate.np.empty(0)
+        samples = decimate.np.array(rows, dtype=float)
+        return decimate.reduce(samples[:, 0], samples[:, 1], int(points), method)
+    
+    def get_statistics(window='24h'):
+        """
+        get_statistics(window='24h')
+            - returns mean, standard deviation, minimum, maximum and slope (per hour) of all channels over a window
+            - the active drift alerts are included, e.g. the pH trending out of 5 - 8.5
+        transfer parameters:
+            window: string, '1h' or '24h' (see analytics.WINDOWS)
+        return parameter:
+            report: dict, window, count, alerts and the statistics per channel name
+        """
+        
+        return hw.analytics.report(window)
+
+    def save_data():
+        """
+        save_data()
+            - saves the channel buffers listed in CHANNEL_FILES into the respective text files
+            - every file is written at once with the buffered samples, one line per sample
+        """
         
-        outfile.close()
+        with SAVE_DATA_SECONDS.time():
+            for index, filename in CHANNEL_FILES.items():
+                times, values = Visualization.get_channel(index)
+                with open(filename, 'w') as outfile:
+                    outfile.writelines([t + ';' + str(v) + '\n' for t, v in zip(times, values)])
     
     def plot_figure():
         """
@@ -689,7 +983,7 @@ class Visualization:
             f: object, plot
         """
         
-        return f
+        return hw.plots.f
     
     def plot_figure2():
         """
@@ -698,7 +992,7 @@ class Visualization:
             lev: object, plot
         """
         
-        return lev
+        return hw.plots.lev
     
     def plot_figure_pH():
         """
@@ -707,7 +1001,7 @@ class Visualization:
             pH_plot: object, plot
         """
         
-        return pH_plot
+        return hw.plots.pH_plot
     
     def plot_figure_ec():
         """
@@ -716,168 +1010,57 @@ class Visualization:
             ec_plot: object, plot
         """
         
-        return ec_plot
+        return hw.plots.ec_plot
     
     def animate(i):
         """
         animate(i)
             - animates the temperature plot
-            - updates the plot by get called in the gui
+            - updates the plot by get called in the gui, redraws only if new data has arrived
         transfer parameters:
-            i: ?
-        """
-        
-        data_watertmp = open('water_tmp.txt', 'r').read()
-        data_airtmp = open('air_tmp.txt', 'r').read()
-        dataList_watertmp = data_watertmp.split('\n')
-        dataList_airtmp = data_airtmp.split('\n')
-        
-        xList1 = []
-        xList2 = []
-        yList_watertmp = []
-        yList_airtmp = []
-        
-        for eachLine in dataList_watertmp:
-            if len(eachLine) > 1:
-                x, y = eachLine.split(';')
-                xList1.append(str(x))
-                yList_watertmp.append(round(float(y), 1))
-        
-        for eachLine in dataList_airtmp:
-            if len(eachLine) > 1:
-                x, y = eachLine.split(';')
-                xList2.append(str(x))
-                yList_airtmp.append(round(float(y), 1))
-        
-        a.clear()
-        a.plot(xList1, yList_watertmp, label='water temperature tank')
-        a.plot(xList2, yList_airtmp, label='air temperature')
-        a.set_ylim(15, 25)
-        a.set_xlabel('Time')
-        a.set_ylabel('Degree (°C)')
-        a.legend()
+            i: int, frame number (unused)
+        return parameter:
+            drawn: boolean, True if the plot was redrawn
+        """
+        
+        return hw.plots.temp_live.update(i)
     
     def animate2(i):
         """
         animate2(i)
             - animates the waterlevel plot
-            - updates the plot by get called in the gui
+            - updates the plot by get called in the gui, redraws only if new data has arrived
         transfer parameters:
-            i: ?
-        """
-        
-        data_waterlevelT = open('level_T.txt', 'r').read()
-        data_waterlevel1 = open('level_1.txt', 'r').read()
-        data_waterlevel2 = open('level_2.txt', 'r').read()
-        
-        dataList_levelT = data_waterlevelT.split('\n')
-        dataList_level1 = data_waterlevel1.split('\n')
-        dataList_level2 = data_waterlevel2.split('\n')
-        
-        xList1 = []
-        xList2 = []
-        xList3 = []
-        yList_T = []
-        yList_1 = []
-        yList_2 = []
-        
-        for eachLine in dataList_levelT:
-            if len(eachLine) > 1:
-                x, y = eachLine.split(';')
-                xList1.append(str(x))
-                yList_T.append(float(y))
-        
-        for eachLine in dataList_level1:
-            if len(eachLine) > 1:
-                x, y = eachLine.split(';')
-                xList2.append(str(x))
-                yList_1.append(float(y))
-        
-        for eachLine in dataList_level2:
-            if len(eachLine) > 1:
-                x, y = eachLine.split(';')
-                xList3.append(str(x))
-                yList_2.append(float(y))
-        
-        lev_sub.clear()
-        lev_sub.plot(xList1, yList_T, label='level tank')
-        lev_sub.plot(xList2, yList_1, label='level floor 1')
-        lev_sub.plot(xList3, yList_2, label='level floor 2')
-        #lev_sub.set_ylim(0, 300)
-        lev_sub.set_xlabel('Time')
-        lev_sub.set_ylabel('Waterlevel')
-        lev_sub.legend()
+            i: int, frame number (unused)
+        return parameter:
+            drawn: boolean, True if the plot was redrawn
+        """
+        
+        return hw.plots.lev_live.update(i)
     
     def animate_pH(i):
         """
         animate_pH(i)
             - animates the pH plot
-            - updates the plot by get called in the gui
+            - updates the plot by get called in the gui, redraws only if new data has arrived
         transfer parameters:
-            i: ?
+            i: int, frame number (unused)
+        return parameter:
+            drawn: boolean, True if the plot was redrawn
         """
         
-        data_ph = open('pH.txt', 'r').read()
-        dataList_ph = data_ph.split('\n')
-        
-        #data_voltage = open('pH_voltage.txt', 'r').read()
-        #dataList_voltage = data_voltage.split('\n')
-        
-        xList1 = []
-        #xList2 = []
-        yList_ph = []
-        #yList_voltage = []
-        
-        for eachLine in dataList_ph:
-            if len(eachLine) > 1:
-                x, y = eachLine.split(';')
-                xList1.append(str(x))
-                yList_ph.append(float(y))
-        
-        #for eachLine in dataList_voltage:
-         #   if len(eachLine) > 1:
-          #      x, y = eachLine.split(';')
-           #     xList2.append(str(x))
-            #    yList_voltage.append(float(y))
-        
-        pH_sub.clear()
-        pH_sub.plot(xList1, yList_ph, label='pH')
-        pH_sub.set_ylim(5, 8.5)
-        pH_sub.set_xlabel('Time')
-        pH_sub.set_ylabel('pH-Value')
-        pH_sub.legend()
-        
-        #pH_vol = pH_sub.twinx()
-        #pH_vol.clear()
-        #pH_vol.plot(xList2, yList_voltage, label='voltage')
-        #pH_vol.set_ylabel('voltage (mV)')
-        #pH_vol.legend()
+        return hw.plots.pH_live.update(i)
     
     def animate_ec(i):
         """
         animate_ec(i)
             - animates the TDS plot
-            - updates the plot by get called in the gui
+            - updates the plot by get called in the gui, redraws only if new data has arrived
         transfer parameters:
-            i: ?
+            i: int, frame number (unused)
+        return parameter:
+            drawn: boolean, True if the plot was redrawn
         """
         
-        data_ec = open('EC.txt', 'r').read()
-        dataList_ec = data_ec.split('\n')
-        
-        xList = []
-        yList_ec = []
-        
-        for eachLine in dataList_ec:
-            if len(eachLine) > 1:
-                x, y = eachLine.split(';')
-                xList.append(str(x))
-                yList_ec.append(float(y))
-        
-        ec_sub.clear()
-        ec_sub.plot(xList, yList_ec, label='TDS')
-        #ec_sub.set_ylim(0, 300)
-        ec_sub.set_xlabel('Time')
-        ec_sub.set_ylabel('TDS (ppm)')
-        ec_sub.legend()
+        return hw.plots.ec_live.update(i)
 
@@ -0,0 +1,440 @@
+#!/usr/bin/python3
+
+'''
+module name: benchmark.py
+
+info:
+    This module contains the benchmark suite of the backend. It runs against the simulator (no hardware needed):
+        - ingest:    frames per second get_vial_parameters can process from a flooding monitoring arduino
+        - latency:   delay from a frame being sent to being processed (ingest) and to being drawn on the pH plot
+        - booking:   duration of lookups, updates and moves in the booking table
+        - scheduler: deadline error of timer actions while the plots are redrawn continuously (GUI load)
+        - robot:     relocation jobs per second through the robot client (protocol overhead, no movement time)
+        - replay:    frames per second of a recorded day (monitoringlog.csv format) replayed through process_frame
+    The results are written as a flat JSON object, so two runs can be compared:
+
+        python benchmark.py --output before.json
+        python benchmark.py --output after.json --compare before.json
+
+    The benchmark runs in a temporary directory with a copy of 'positioning.json'.
+'''
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from simulator import PtyLink, MonitoringSimulator, RobotSimulator
+
+""" directory of the software, the benchmark itself runs in a temporary directory """
+SOURCE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def percentile(values, p):
+    """
+    percentile(values, p)
+        - returns the p-th percentile of the values (nearest rank)
+    transfer parameters:
+        values: list, measured values
+        p:      float, percentile between 0 and 100
+    return parameter:
+        value: float, percentile or None if there are no values
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(p / 100 * len(ordered))) - 1))]
+
+
+def summary(name, values, scale=1000):
+    """
+    summary(name, values, scale=1000)
+        - returns the p50, p99 and maximum of the values as result entries (in ms by default)
+    transfer parameters:
+        name:   string, prefix of the result names
+        values: list, measured values in seconds
+        scale:  float, factor applied to the values
+    return parameter:
+        results: dict, name_p50_ms, name_p99_ms and name_max_ms
+    """
+    return {f"{name}_p50_ms": _scaled(percentile(values, 50), scale),
+            f"{name}_p99_ms": _scaled(percentile(values, 99), scale),
+            f"{name}_max_ms": _scaled(max(values) if values else None, scale)}
+
+
+def _scaled(value, scale):
+    return None if value is None else round(value * scale, 3)
+
+
+@contextlib.contextmanager
+def quiet():
+    """
+    quiet()
+        - suppresses the console output of the backend while measuring
+    """
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield
+
+
+class Ingest:
+    """
+    class Ingest measures the monitoring path (get_vial_parameters -> process_frame -> live plot)
+        - wait_idle
+        - throughput
+        - latency
+    """
+
+    def __init__(self, backend, link):
+        self.backend = backend
+        self.link = link
+        self.processed = []
+        process_frame = backend.Visualization.process_frame
+
+        def timed(values, timestamp=None):
+            process_frame(values, timestamp)
+            self.processed.append(time.monotonic())
+
+        backend.Visualization.process_frame = timed
+        threading.Thread(target=backend.Visualization.get_vial_parameters, name='MonitoringThread', daemon=True).start()
+
+    def wait_idle(self, quiet_time=0.5):
+        """
+        wait_idle(quiet_time=0.5)
+            - waits until all sent frames have been processed
+        """
+        count = -1
+        while count != len(self.processed):
+            count = len(self.processed)
+            time.sleep(quiet_time)
+
+    def throughput(self, duration):
+        """
+        throughput(duration)
+            - floods the monitoring port and counts the processed frames
+        transfer parameters:
+            duration: float, seconds
+        return parameter:
+            results: dict
+        """
+        simulator = MonitoringSimulator(self.link, speed=0, seed=1)
+        start = len(self.processed)
+        simulator.start()
+        time.sleep(duration)
+        processed = len(self.processed) - start
+        simulator.stop()
+        self.wait_idle()
+        return {'ingest_fps': round(processed / duration, 1),
+                'ingest_backlog_frames': simulator.sent - processed}
+
+    def latency(self, duration, speed, plot_interval):
+        """
+        latency(duration, speed, plot_interval)
+            - sends frames at a fixed rate and measures when they are processed and drawn on the pH plot
+            - the plot is updated every plot_interval seconds like the GUI does
+        transfer parameters:
+            duration:      float, seconds
+            speed:         float, frame rate factor of the simulator
+            plot_interval: float, seconds between two plot updates
+        return parameter:
+            results: dict
+        """
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+        plot = self.backend.pH_live
+        plot.attach(FigureCanvasAgg(plot.figure))
+        plot.canvas.draw()
+
+        sent = []
+        draws = []
+        draw_times = []
+        offset = len(self.processed)
+        running = threading.Event()
+        running.set()
+
+        def draw():
+            while running.is_set():
+                count = len(self.processed) - offset
+                started = time.monotonic()
+                if plot.update():
+                    finished = time.monotonic()
+                    draws.append((finished, count))
+                    draw_times.append(finished - started)
+                time.sleep(plot_interval)
+
+        drawer = threading.Thread(target=draw, name='GuiThread', daemon=True)
+        drawer.start()
+        simulator = MonitoringSimulator(self.link, speed=speed, seed=2, listener=lambda seq, t: sent.append(t))
+        simulator.start()
+        time.sleep(duration)
+        simulator.stop()
+        self.wait_idle()
+        running.clear()
+        drawer.join()
+
+        processed = self.processed[offset:offset + len(sent)]
+        ingest = [done - start for start, done in zip(sent, processed)]
+        shown = []
+        index = 0
+        for k, start in enumerate(sent[:len(processed)]):
+            # first draw which already contained frame k
+            while index < len(draws) and draws[index][1] <= k:
+                index += 1
+            if index == len(draws):
+                break
+            shown.append(draws[index][0] - start)
+
+        results = {'latency_frames': len(sent)}
+        results.update(summary('ingest_latency', ingest))
+        results.update(summary('plot_latency', shown))
+        results.update(summary('plot_draw', draw_times))
+        return results
+
+
+def bench_booking(table, operations):
+    """
+    bench_booking(table, operations)
+        - measures lookups, updates and moves of the booking table
+    transfer parameters:
+        table:      PositionTable, booking table (a copy of 'positioning.json')
+        operations: int, number of operations per kind
+    return parameter:
+        results: dict
+    """
+    free = [pos for pos, entry in table.positions.items() if not entry.booked]
+    if len(free) < 2:
+        raise ValueError("The booking benchmark needs two free positions")
+    a, b = free[:2]
+    table.update(a, True, 'Benchmark')
+
+    lookups, updates, moves = [], [], []
+    for i in range(operations):
+        start = time.perf_counter()
+        table.get(i % 24)
+        lookups.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        table.update(a, True, 'Benchmark')
+        updates.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        table.move(a, b)
+        moves.append(time.perf_counter() - start)
+        a, b = b, a
+
+    table.update(a, False, None)
+    start = time.perf_counter()
+    table.flush()
+    flush = time.perf_counter() - start
+
+    results = {}
+    results.update(summary('booking_get', lookups, 1e6))
+    results.update(summary('booking_update', updates, 1e6))
+    results.update(summary('booking_move', moves, 1e6))
+    results = {key.replace('_ms', '_us'): value for key, value in results.items()}
+    results['booking_flush_ms'] = _scaled(flush, 1000)
+    results['booking_file_writes'] = table.writes
+    return results
+
+
+def bench_scheduler(backend, duration, interval):
+    """
+    bench_scheduler(backend, duration, interval)
+        - executes timer actions every interval seconds while all live plot figures are redrawn continuously
+    transfer parameters:
+        backend:  module, imported backend
+        duration: float, seconds
+        interval: float, seconds between two deadlines
+    return parameter:
+        results: dict
+    """
+    import scheduler
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+    timers = scheduler.Scheduler()
+    errors = []
+    start = time.time() + interval
+    for k in range(int(duration / interval)):
+        deadline = start + k * interval
+        timers.schedule_at(f"bench{k}", deadline, lambda deadline=deadline: errors.append(time.time() - deadline))
+    thread = threading.Thread(target=timers.run, name='BackEndThread', daemon=True)
+    thread.start()
+
+    canvases = [FigureCanvasAgg(figure) for figure in (backend.f, backend.lev, backend.pH_plot, backend.ec_plot)]
+    redraws = 0
+    end = time.monotonic() + duration + interval
+    while time.monotonic() < end:
+        canvases[redraws % len(canvases)].draw()
+        redraws += 1
+    time.sleep(interval)
+    timers.stop()
+    thread.join()
+
+    results = {'scheduler_actions': len(errors), 'scheduler_load_redraws': redraws}
+    results.update(summary('scheduler_error', errors))
+    return results
+
+
+def bench_robot(backend, link, jobs):
+    """
+    bench_robot(backend, link, jobs)
+        - executes relocations back and forth through the robot client, the simulated robot does not move
+    transfer parameters:
+        backend: module, imported backend
+        link:    PtyLink, pseudo terminal of the robot port
+        jobs:    int, number of relocations
+    return parameter:
+        results: dict
+    """
+    simulator = RobotSimulator(link, speed=0)
+    simulator.start()
+    threading.Thread(target=backend.robot_lines.run, name='ConsoleThread', daemon=True).start()
+
+    table = backend.positions
+    free = [pos for pos, entry in table.positions.items() if not entry.booked]
+    a, b = free[:2]
+    table.update(a, True, 'Benchmark')
+
+    moves = [(a, b) if k % 2 == 0 else (b, a) for k in range(jobs)]
+    start = time.monotonic()
+    queued = backend.robot_arm.submit_many(moves)
+    for job in queued:
+        job.wait()
+    elapsed = time.monotonic() - start
+    simulator.stop()
+
+    table.update(a, False, None)
+    table.update(b, False, None)
+    results = {'robot_jobs_per_s': round(jobs / elapsed, 1),
+               'robot_jobs_failed': sum(1 for job in queued if job.status != 'done')}
+    results.update(summary('robot_job', [job.finished - job.started for job in queued if job.started]))
+    return results
+
+
+def bench_replay(backend, days, path=None):
+    """
+    bench_replay(backend, days, path=None)
+        - replays recorded frames as fast as possible through the processing of the monitoring frames
+        - without a file the frames of the simulator are written to a monitoringlog.csv first
+    transfer parameters:
+        backend: module, imported backend
+        days:    float, recorded days generated for the workload (5 s per frame)
+        path:    string, recorded file used instead of the generated one
+    return parameter:
+        results: dict
+    """
+    import replay
+
+    if path is None:
+        simulator = MonitoringSimulator(None, seed=3)
+        count = int(days * 86400 / replay.CYCLE_TIME)
+        start = time.time() - days * 86400
+        path = 'replay.csv'
+        replay.write_csv(path, ((start + k * replay.CYCLE_TIME, simulator.next_values()) for k in range(count)))
+    status = replay.Replay(replay.open_source(path), speed=0, sink=backend.Visualization.process_frame).run()
+    return {'replay_frames': status['frames'],
+            'replay_fps': round(status['fps'], 1),
+            'replay_s': round(status['duration'], 3)}
+
+
+def compare(results, reference):
+    """
+    compare(results, reference)
+        - prints the relative change of every result compared to a previous run
+    transfer parameters:
+        results:   dict, current results
+        reference: dict, results of the previous run
+    """
+    for name, value in results.items():
+        old = reference.get(name)
+        if isinstance(value, (int, float)) and isinstance(old, (int, float)) and old:
+            print(f"{name:32} {old:>12} -> {value:>12} ({100 * (value - old) / old:+.1f} %)")
+
+
+def main(argv=None):
+    """
+    main(argv=None)
+        - runs all benchmarks and writes the results
+    transfer parameters:
+        argv: list, command line arguments (default: sys.argv[1:])
+    """
+    parser = argparse.ArgumentParser(description='Benchmark of the vertical farm backend (runs on the simulator)')
+    parser.add_argument('--output', default='benchmark.json', help='JSON file for the results')
+    parser.add_argument('--compare', default=None, help='JSON file of a previous run')
+    parser.add_argument('--duration', type=float, default=5.0, help='seconds per measurement')
+    parser.add_argument('--speed', type=float, default=100.0, help='frame rate factor for the latency measurement')
+    parser.add_argument('--plot-interval', type=float, default=1.0, help='seconds between two plot updates (gui.py: 1 s)')
+    parser.add_argument('--operations', type=int, default=10000, help='booking operations per kind')
+    parser.add_argument('--jobs', type=int, default=200, help='relocations for the robot benchmark')
+    parser.add_argument('--replay-days', type=float, default=1.0, help='recorded days replayed by the replay benchmark')
+    parser.add_argument('--replay', default=None, help='recorded file for the replay benchmark (default: generated frames)')
+    args = parser.parse_args(argv)
+
+    output = os.path.abspath(args.output)
+    recorded = os.path.abspath(args.replay) if args.replay else None
+    reference = None
+    if args.compare:
+        with open(args.compare) as file:
+            reference = json.load(file)
+
+    monitor_link = PtyLink()
+    robot_link = PtyLink()
+    os.environ.update({'FARMER_MONITOR_PORT': monitor_link.path,
+                       'FARMER_ROBOT_PORT': robot_link.path,
+                       'FARMER_FAKE_PWM': '1'})
+    workdir = tempfile.mkdtemp(prefix='farmer-benchmark-')
+    shutil.copy(os.path.join(SOURCE_DIR, 'positioning.json'), workdir)
+    os.chdir(workdir)
+    sys.path.insert(0, SOURCE_DIR)
+
+    results = {}
+    try:
+        with quiet():
+            # the log records of the backend are neither written nor printed while measuring
+            import farmlog
+            farmlog.configure(None, console=None)
+            started = time.perf_counter()
+            import backend
+            results['backend_import_s'] = round(time.perf_counter() - started, 3)
+
+            ingest = Ingest(backend, monitor_link)
+            results.update(ingest.throughput(args.duration))
+            results.update(ingest.latency(args.duration, args.speed, args.plot_interval))
+            results.update(bench_booking(backend.positions, args.operations))
+            results.update(bench_scheduler(backend, args.duration, 0.05))
+            results.update(bench_robot(backend, robot_link, args.jobs))
+            results.update(bench_replay(backend, args.replay_days, recorded))
+    finally:
+        os.chdir(SOURCE_DIR)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    try:
+        revision = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=SOURCE_DIR,
+                                  capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        revision = None
+    report = {'revision': revision,
+              'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+              'python': platform.python_version(),
+              'machine': platform.machine()}
+    report.update(results)
+
+    with open(output, 'w') as file:
+        json.dump(report, file, indent=4)
+    for name, value in results.items():
+        print(f"{name:32} {value}")
+    print(f"Results written to {output}")
+    if reference is not None:
+        print(f"\nCompared to {args.compare} (revision {reference.get('revision')}):")
+        compare(results, reference)
+
+
+if __name__ == '__main__':
+    main()
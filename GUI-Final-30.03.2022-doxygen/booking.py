@@ -0,0 +1,166 @@
+'''
+module name: booking.py
+
+info:
+    This module contains the booking table of the cultivation positions.
+    The 'positioning.json' file is read once, afterwards all lookups are answered from memory.
+    Changes are written back in the background: several changes within write_delay seconds are
+    combined into one write, which replaces the file atomically (temporary file + rename).
+'''
+
+import atexit
+import json
+import os
+import threading
+
+
+class Position:
+    """
+    class Position contains the booking information of one cultivation position
+        - to_dict
+    attributes:
+        position: int, position in the cultivation system
+        booked:   boolean, state of booking
+        species:  string, species of the cultivated plant or None
+    """
+
+    __slots__ = ('position', 'booked', 'species')
+
+    def __init__(self, position, booked=False, species=None):
+        self.position = int(position)
+        self.booked = bool(booked)
+        self.species = None if species in (None, "None") else str(species)
+
+    def __repr__(self):
+        return f"Position({self.position}, {self.booked}, {self.species!r})"
+
+    def to_dict(self):
+        """
+        to_dict()
+            - returns the position in the format of the 'positioning.json' file
+        return parameter:
+            data: dict, position, booked and species
+        """
+        return {"position": self.position, "booked": self.booked, "species": self.species}
+
+
+class PositionTable:
+    """
+    class PositionTable contains the functions to read and change the booking of all positions
+        - load
+        - get
+        - update
+        - move
+        - flush
+    """
+
+    def __init__(self, path='positioning.json', write_delay=0.5):
+        """
+        transfer parameters:
+            path:        string, json file with the booking of the positions
+            write_delay: float, seconds changes are collected before they are written
+        """
+        self.path = path
+        self.write_delay = write_delay
+        self.positions = {}
+        self._lock = threading.RLock()
+        self._timer = None
+        self._dirty = False
+        self.writes = 0
+
+        self.load()
+        atexit.register(self.flush)
+
+    def load(self):
+        """
+        load()
+            - reads the json file into the table
+            - the position ids are normalized to int (the file contains strings like "0" as well)
+        """
+        with open(self.path, 'r') as file:
+            data = json.load(file)
+        with self._lock:
+            self.positions = {}
+            for entry in data:
+                position = Position(entry["position"], entry["booked"], entry["species"])
+                self.positions[position.position] = position
+
+    def get(self, pos):
+        """
+        get(pos)
+            - returns the booking of a position
+        transfer parameters:
+            pos: int or string, position id
+        return parameter:
+            position: Position, booking of the position or None if the position does not exist
+        """
+        try:
+            return self.positions.get(int(pos))
+        except ValueError:
+            return None
+
+    def update(self, pos, booked, species):
+        """
+        update(pos, booked, species)
+            - changes the booking of a position and schedules the write
+        transfer parameters:
+            pos:     int, position id
+            booked:  boolean, state of booking
+            species: string, species of the cultivated plant ("None" or None for no plant)
+        return parameter:
+            position: Position, the changed position
+        """
+        with self._lock:
+            position = Position(pos, booked, species)
+            self.positions[position.position] = position
+            self._schedule_write()
+        return position
+
+    def move(self, old, new):
+        """
+        move(old, new)
+            - moves the booking of the initial position to the target position and clears the initial position
+            - both changes are written together
+        transfer parameters:
+            old: int, initial position
+            new: int, target position
+        return parameter:
+            moved: Position, the booking now stored at the target position
+        """
+        with self._lock:
+            source = self.positions[int(old)]
+            moved = Position(new, source.booked, source.species)
+            self.positions[moved.position] = moved
+            self.positions[source.position] = Position(source.position, False, None)
+            self._schedule_write()
+        return moved
+
+    def _schedule_write(self):
+        self._dirty = True
+        if self._timer is None:
+            self._timer = threading.Timer(self.write_delay, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def flush(self):
+        """
+        flush()
+            - writes the pending changes immediately
+            - the file is written to a temporary file first and then renamed, so it is never left half written
+        """
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if not self._dirty:
+                return
+            data = [self.positions[pos].to_dict() for pos in sorted(self.positions)]
+            self._dirty = False
+
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'w') as file:
+                json.dump(data, file, indent=4)
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(tmp_path, self.path)
+            self.writes += 1
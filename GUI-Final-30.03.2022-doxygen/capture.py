@@ -0,0 +1,427 @@
+#!/usr/bin/python3
+
+'''
+module name: capture.py
+
+info:
+    This module contains the recorder of the raw serial data (farmer.py --capture) and the reader of the recordings.
+    Every chunk read from the monitoring or the robot port is appended as one record to a binary file:
+
+        file header (16 bytes)  magic 'FCAP', version (uint16), reserved (uint16), wall clock offset (float64)
+        record header (12 bytes) monotonic time in ns (uint64), port id (uint8), reserved (uint8), length (uint16)
+        record data              the received bytes
+
+    The unix time of a record is its monotonic time + the wall clock offset of the file. Port 255 records
+    contain the names of the ports ("0=monitor"), they are written before the first data of a port.
+    The index file (same name + '.idx') holds one entry (monotonic time, file offset, 2 x uint64) per
+    second of recording or MB of data. It is read with mmap and a binary search, so a record at a given time
+    is found in a capture of several GB without reading the data before it.
+    The read path only appends (time, port, bytes) to a queue (about 0.3 µs), a background thread writes
+    the queued records every 100 ms with one write call.
+
+        python capture.py capture-20220330-120000.bin --port robot --start "2022-03-30 12:05"
+'''
+
+import argparse
+import mmap
+import os
+import struct
+import threading
+import time
+from collections import deque
+
+import metrics
+
+MAGIC = b'FCAP'
+INDEX_MAGIC = b'FIDX'
+VERSION = 1
+
+FILE_HEADER = struct.Struct('<4sHHd')
+RECORD_HEADER = struct.Struct('<QBBH')
+INDEX_ENTRY = struct.Struct('<QQ')
+
+""" port id of the records holding the port names """
+NAMES_PORT = 255
+
+""" largest data of one record, longer chunks are split """
+MAX_RECORD = 0xFFFF
+
+CAPTURE_BYTES = metrics.counter('farmer_capture_bytes_total', 'Bytes written to the serial capture')
+CAPTURE_DROPPED = metrics.counter('farmer_capture_dropped_total', 'Chunks not captured because the writer fell behind')
+
+
+def default_path():
+    """
+    default_path()
+        - returns the name of a new capture file with the current time
+    return parameter:
+        path: string, e.g. 'capture-20220330-120000.bin'
+    """
+    return time.strftime('capture-%Y%m%d-%H%M%S.bin')
+
+
+class Recorder:
+    """
+    class Recorder appends the chunks of several serial ports to a capture file on a background thread
+        - tee
+        - flush
+        - close
+    attributes:
+        path:    string, capture file
+        records: int, number of written records
+        dropped: int, number of chunks dropped because too many chunks were waiting
+    """
+
+    def __init__(self, path=None, interval=0.1, index_interval=1.0, index_bytes=1024 * 1024, max_pending=100000):
+        """
+        transfer parameters:
+            path:           string, new capture file (None: default_path())
+            interval:       float, seconds between two writes
+            index_interval: float, seconds of recording between two index entries
+            index_bytes:    int, bytes of data between two index entries
+            max_pending:    int, chunks which may wait for the writer, newer chunks are dropped (e.g. a stalled disk)
+        """
+        self.path = path or default_path()
+        self.interval = interval
+        self.index_interval = int(index_interval * 1e9)
+        self.index_bytes = index_bytes
+        self.max_pending = max_pending
+        self.records = 0
+        self.dropped = 0
+        self._ports = {}
+        self._pending = deque()
+        self._lock = threading.Lock()
+        self._file = open(self.path, 'xb')
+        self._index = open(self.path + '.idx', 'xb')
+        self._file.write(FILE_HEADER.pack(MAGIC, VERSION, 0, time.time() - time.monotonic()))
+        self._index.write(FILE_HEADER.pack(INDEX_MAGIC, VERSION, 0, 0.0))
+        self._file.flush()
+        self._index.flush()
+        self._offset = FILE_HEADER.size
+        self._last_index = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='CaptureWriter', daemon=True)
+        self._thread.start()
+        CAPTURE_DROPPED.set_function(lambda: self.dropped)
+        print("Capturing the serial ports to " + self.path)
+
+    def port_id(self, name):
+        """
+        port_id(name)
+            - returns the id of a port name, a new name gets the next id and is written to the capture
+        transfer parameters:
+            name: string, name of the port (e.g. 'monitor', 'robot' or the id of a device)
+        return parameter:
+            port: int, port id of the records
+        """
+        with self._lock:
+            port = self._ports.get(name)
+            if port is None:
+                port = len(self._ports)
+                if port >= NAMES_PORT:
+                    raise ValueError("A capture holds at most 255 ports")
+                self._ports[name] = port
+                self._pending.append((time.monotonic_ns(), NAMES_PORT, f"{port}={name}".encode()))
+            return port
+
+    def tee(self, name):
+        """
+        tee(name)
+            - returns the function recording the chunks of one port, called in the read path with every chunk
+        transfer parameters:
+            name: string, name of the port
+        return parameter:
+            record: function, called as record(data) with the received bytes
+        """
+        port = self.port_id(name)
+        pending = self._pending
+        clock = time.monotonic_ns
+        limit = self.max_pending
+
+        def record(data):
+            # runs on the reader thread: no lock, no formatting, no i/o
+            if len(pending) < limit:
+                pending.append((clock(), port, data))
+            else:
+                self.dropped += 1
+        return record
+
+    def _write(self):
+        pending = self._pending
+        parts = []
+        entries = []
+        offset = self._offset
+        while pending:
+            timestamp, port, data = pending.popleft()
+            for start in range(0, max(len(data), 1), MAX_RECORD):
+                piece = data[start:start + MAX_RECORD]
+                last = self._last_index
+                if last is None or timestamp - last[0] >= self.index_interval or offset - last[1] >= self.index_bytes:
+                    self._last_index = (timestamp, offset)
+                    entries.append(INDEX_ENTRY.pack(timestamp, offset))
+                parts.append(RECORD_HEADER.pack(timestamp, port, 0, len(piece)))
+                parts.append(piece)
+                offset += RECORD_HEADER.size + len(piece)
+                self.records += 1
+        if not parts:
+            return
+        # the data is written before the index, so an index entry never points behind the data
+        self._file.write(b''.join(parts))
+        self._file.flush()
+        if entries:
+            self._index.write(b''.join(entries))
+            self._index.flush()
+        CAPTURE_BYTES.inc(offset - self._offset)
+        self._offset = offset
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                with self._lock:
+                    self._write()
+            except Exception as e:
+                print("Capture writer failed: " + str(e))
+        with self._lock:
+            self._write()
+
+    def flush(self):
+        """
+        flush()
+            - writes the waiting records at once (on the calling thread)
+        """
+        with self._lock:
+            self._write()
+
+    def close(self):
+        """
+        close()
+            - writes the remaining records and closes the files
+        """
+        self._stop.set()
+        self._thread.join()
+        self._file.close()
+        self._index.close()
+
+
+class Capture:
+    """
+    class Capture reads a capture file without loading it (mmap)
+        - records
+        - seek
+        - port_id
+        - unix_time
+        - close
+    attributes:
+        names:  dict, port id -> port name (complete after the records have been read once)
+        offset: float, wall clock offset (unix time = monotonic time + offset)
+    """
+
+    def __init__(self, path):
+        """
+        transfer parameters:
+            path: string, capture file, the index is rebuilt if it is missing
+        """
+        self.path = path
+        with open(path, 'rb') as infile:
+            self._data = mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, reserved, self.offset = FILE_HEADER.unpack_from(self._data, 0)
+        if magic != MAGIC or version != VERSION:
+            self._data.close()
+            raise ValueError(f"{path} is not a capture file")
+        self.names = {}
+        if not os.path.exists(path + '.idx'):
+            build_index(path)
+        with open(path + '.idx', 'rb') as infile:
+            size = os.fstat(infile.fileno()).st_size
+            self._index = mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ) if size else None
+        # an index entry may be half written if the recorder was killed
+        count = (size - FILE_HEADER.size) // INDEX_ENTRY.size if size else 0
+        self._entries = (memoryview(self._index)[FILE_HEADER.size:FILE_HEADER.size + count * INDEX_ENTRY.size].cast('Q')
+                         if count else None)
+        self._count = count
+
+    def unix_time(self, monotonic_ns):
+        """
+        unix_time(monotonic_ns)
+            - converts the time of a record to unix time
+        transfer parameters:
+            monotonic_ns: int, time of the record
+        return parameter:
+            timestamp: float, unix time
+        """
+        return monotonic_ns / 1e9 + self.offset
+
+    def seek(self, timestamp):
+        """
+        seek(timestamp)
+            - finds the file offset from which the records at or after a time start (binary search in the index)
+        transfer parameters:
+            timestamp: float, unix time
+        return parameter:
+            offset: int, file offset of an index entry at or before the time
+        """
+        target = (timestamp - self.offset) * 1e9
+        low, high = 0, self._count
+        while low < high:
+            middle = (low + high) // 2
+            if self._entries[2 * middle] <= target:
+                low = middle + 1
+            else:
+                high = middle
+        return self._entries[2 * (low - 1) + 1] if low else FILE_HEADER.size
+
+    def _scan(self, offset):
+        # yields (offset, time, port, start, length) of the records from an offset, stops at a cut off record
+        data = self._data
+        size = len(data)
+        while offset + RECORD_HEADER.size <= size:
+            timestamp, port, reserved, length = RECORD_HEADER.unpack_from(data, offset)
+            start = offset + RECORD_HEADER.size
+            if start + length > size:
+                return
+            yield offset, timestamp, port, start, length
+            offset = start + length
+
+    def port_id(self, name):
+        """
+        port_id(name)
+            - returns the id of a port name (the name records are read from the start of the file until it is found)
+        transfer parameters:
+            name: string, name of the port
+        return parameter:
+            port: int, port id (None if the port is not in the capture)
+        """
+        for port, known in self.names.items():
+            if known == name:
+                return port
+        for offset, timestamp, port, start, length in self._scan(FILE_HEADER.size):
+            if port == NAMES_PORT:
+                port, known = self._add_name(start, length)
+                if known == name:
+                    return port
+        return None
+
+    def _add_name(self, start, length):
+        port, name = bytes(self._data[start:start + length]).decode().split('=', 1)
+        self.names[int(port)] = name
+        return int(port), name
+
+    def records(self, start=None, end=None, port=None):
+        """
+        records(start=None, end=None, port=None)
+            - returns the records of a time range, only the records from the index entry before start are read
+        transfer parameters:
+            start: float, unix time of the first record (None: start of the capture)
+            end:   float, unix time after the last record (None: end of the capture)
+            port:  int or string, only the records of this port (None: all ports)
+        return parameter:
+            records: iterator, (unix time, port id, data as bytes)
+        """
+        if isinstance(port, str):
+            port = self.port_id(port)
+            if port is None:
+                return
+        offset = self.seek(start) if start is not None else FILE_HEADER.size
+        first = (start - self.offset) * 1e9 if start is not None else None
+        last = (end - self.offset) * 1e9 if end is not None else None
+        data = self._data
+        for offset, timestamp, record_port, begin, length in self._scan(offset):
+            if record_port == NAMES_PORT:
+                self._add_name(begin, length)
+                continue
+            if first is not None and timestamp < first:
+                continue
+            if last is not None and timestamp >= last:
+                return
+            if port is None or record_port == port:
+                yield timestamp / 1e9 + self.offset, record_port, data[begin:begin + length]
+
+    def close(self):
+        """
+        close()
+            - releases the mapped files
+        """
+        self._entries = None
+        if self._index is not None:
+            self._index.close()
+        self._data.close()
+
+
+def build_index(path, index_interval=1.0, index_bytes=1024 * 1024):
+    """
+    build_index(path, index_interval=1.0, index_bytes=1024 * 1024)
+        - writes the index of a capture file anew (e.g. if the index file was lost)
+    transfer parameters:
+        path:           string, capture file
+        index_interval: float, seconds of recording between two index entries
+        index_bytes:    int, bytes of data between two index entries
+    return parameter:
+        count: int, number of index entries
+    """
+    with open(path, 'rb') as infile:
+        data = mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ)
+    entries = []
+    last = None
+    offset = FILE_HEADER.size
+    try:
+        while offset + RECORD_HEADER.size <= len(data):
+            timestamp, port, reserved, length = RECORD_HEADER.unpack_from(data, offset)
+            if offset + RECORD_HEADER.size + length > len(data):
+                break
+            if last is None or timestamp - last[0] >= index_interval * 1e9 or offset - last[1] >= index_bytes:
+                last = (timestamp, offset)
+                entries.append(INDEX_ENTRY.pack(timestamp, offset))
+            offset += RECORD_HEADER.size + length
+    finally:
+        data.close()
+    tmp = path + '.idx.tmp'
+    with open(tmp, 'wb') as outfile:
+        outfile.write(FILE_HEADER.pack(INDEX_MAGIC, VERSION, 0, 0.0))
+        outfile.write(b''.join(entries))
+    os.replace(tmp, path + '.idx')
+    return len(entries)
+
+
+def _parse_time(text):
+    for form in ('%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M', '%Y-%m-%d'):
+        try:
+            return time.mktime(time.strptime(text, form))
+        except ValueError:
+            pass
+    return float(text)
+
+
+def main(argv=None):
+    """
+    main(argv=None)
+        - prints the records of a capture file (time, port, length and data)
+    transfer parameters:
+        argv: list, command line arguments (default: sys.argv[1:])
+    """
+    parser = argparse.ArgumentParser(description='Show the records of a serial capture')
+    parser.add_argument('file', help='capture file')
+    parser.add_argument('--port', default=None, help='only the records of this port (e.g. monitor, robot)')
+    parser.add_argument('--start', default=None, help='first time, "YYYY-MM-DD HH:MM[:SS]" or unix time')
+    parser.add_argument('--end', default=None, help='last time, "YYYY-MM-DD HH:MM[:SS]" or unix time')
+    parser.add_argument('--hex', action='store_true', help='show the data as hex (default: text, e.g. the robot lines)')
+    parser.add_argument('--reindex', action='store_true', help='build the index anew')
+    args = parser.parse_args(argv)
+
+    if args.reindex:
+        print(str(build_index(args.file)) + " index entries written")
+    capture = Capture(args.file)
+    start = _parse_time(args.start) if args.start else None
+    end = _parse_time(args.end) if args.end else None
+    try:
+        for timestamp, port, data in capture.records(start, end, args.port):
+            text = data.hex(' ') if args.hex else bytes(data).decode('utf-8', 'replace').replace('\n', '\\n').replace('\r', '\\r')
+            clock = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(timestamp)) + f".{int(timestamp % 1 * 1000):03d}"
+            print(f"{clock} {capture.names.get(port, port):<10} {len(data):>5} {text}")
+    except BrokenPipeError:
+        pass
+    finally:
+        capture.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,321 @@
+'''
+module name: control_api.py
+
+info:
+    This module contains the local control interface of the farmer process (Unix socket, one JSON object per line).
+    Request:  {"id": 1, "cmd": "Control_Robot.relocate", "args": [6, 0]}
+    Response: {"id": 1, "ok": true, "result": {...}} or {"id": 1, "ok": false, "error": "..."}
+    The commands are the functions of the backend classes listed in COMMANDS and the built-in commands 'ping', 'status'
+    and 'profile_start', 'profile_stop', 'profile_status' (sampling profiler, see profiler.py).
+    With a device loop (several racks, aio_devices.py) there are also 'devices', 'rack_latest' and 'rack_relocate'.
+    The Client offers the same classes as the backend (client.Config.check_booking(6), ...), so the GUI can run
+    as a client of a headless farmer process.
+'''
+
+import json
+import os
+import socket
+import socketserver
+import threading
+import time
+from array import array
+
+""" path of the control socket """
+DEFAULT_SOCKET = os.environ.get('FARMER_SOCKET', 'farmer.sock')
+
+""" backend functions available through the interface, the blocking loops (read_serial, check_time, ...) are not included """
+COMMANDS = {'Config': ('edit_positioning', 'check_booking', 'return_booking_state'),
+            'Control_Parameters': ('get_state_boxes', 'write_time_list', 'change_val_lights', 'change_val_pump',
+                                   'change_val_nutrients', 'start_dosing', 'stop_dosing', 'dosing_status', 'reset_pwm_channels', 'start_circulation', 'stop_circulation'),
+            'Control_Robot': ('relocate', 'reorganize', 'relocation_status'),
+            'Visualization': ('get_parameter', 'get_channel', 'get_history', 'get_history_points', 'get_statistics', 'get_samples')}
+
+
+class ControlError(Exception):
+    """
+    class ControlError is raised by the client if a command failed in the farmer process
+    """
+
+
+def to_json(value):
+    """
+    to_json(value)
+        - converts a result of a backend function into json compatible types
+        - objects with a to_dict function (Job, Position) are converted with it, numpy arrays with tolist
+    transfer parameters:
+        value: object, result of the function
+    return parameter:
+        value: object, json compatible value
+    """
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if hasattr(value, 'to_dict'):
+        return to_json(value.to_dict())
+    if hasattr(value, 'tolist'):
+        return value.tolist()
+    if isinstance(value, dict):
+        return {str(key): to_json(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple, array)):
+        return [to_json(item) for item in value]
+    return str(value)
+
+
+class Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    class Server executes the commands of the clients in the farmer process
+        - execute
+        - serve_forever (socketserver)
+        - close
+    every connection is served by its own thread
+    """
+
+    daemon_threads = True
+
+    def __init__(self, backend, path=DEFAULT_SOCKET, device_loop=None):
+        """
+        transfer parameters:
+            backend:     module, the imported backend
+            path:        string, path of the socket file (an old socket file is replaced)
+            device_loop: DeviceLoop, devices of several racks (None: single rack)
+        """
+        self.backend = backend
+        self.path = path
+        self.device_loop = device_loop
+        self.started = time.time()
+        self.functions = {f"{cls}.{name}": getattr(getattr(backend, cls), name)
+                          for cls, names in COMMANDS.items() for name in names}
+        self.functions['ping'] = lambda: 'pong'
+        self.functions['status'] = self.status
+        self.functions['profile_start'] = self.profile_start
+        self.functions['profile_stop'] = lambda: backend.hw.profiler.stop()
+        self.functions['profile_status'] = lambda: backend.hw.profiler.status()
+        if device_loop is not None:
+            self.functions['devices'] = device_loop.stats
+            self.functions['rack_latest'] = self.rack_latest
+            self.functions['rack_relocate'] = self.rack_relocate
+        if os.path.exists(path):
+            os.unlink(path)
+        socketserver.UnixStreamServer.__init__(self, path, _Handler)
+        # only the local user may send commands
+        os.chmod(path, 0o600)
+
+    def status(self):
+        """
+        status()
+            - returns an overview of the farmer process
+        return parameter:
+            status: dict, uptime, number of frames, latest values, robot queue and pwm channels
+        """
+        backend = self.backend
+        hw = backend.hw
+        return {'uptime': time.time() - self.started,
+                'frames': backend.frame_count,
+                'parameters': backend.VIAL_PARAMETERS,
+                'robot': hw.robot_arm.stats() if hw.created('robot_arm') else None,
+                'pwm': hw.actuators.shadow if hw.created('actuators') else None}
+
+    def profile_start(self, interval=None, path=None):
+        """
+        profile_start(interval=None, path=None)
+            - starts the sampling profiler of the farmer process (stopped and written with 'profile_stop')
+        transfer parameters:
+            interval: float, seconds between two samples (None: 0.01)
+            path:     string, file of the collapsed stacks (None: farmer.folded)
+        return parameter:
+            status: dict, state of the profiler
+        """
+        profiler = self.backend.hw.profiler
+        profiler.start(interval, path)
+        return profiler.status()
+
+    def rack_latest(self, rack):
+        """
+        rack_latest(rack)
+            - returns the newest frame of the monitoring arduino of a rack
+        transfer parameters:
+            rack: string, rack name
+        return parameter:
+            reading: dict, device, rack, seq, values and timestamp (None before the first frame)
+        """
+        device = self.device_loop.device('monitoring', rack)
+        if device is None:
+            raise KeyError(f"Rack '{rack}' has no monitoring arduino")
+        return device.latest._asdict() if device.latest is not None else None
+
+    def rack_relocate(self, rack, old, new):
+        """
+        rack_relocate(rack, old, new)
+            - queues a relocation for the robot of a rack
+        transfer parameters:
+            rack: string, rack name
+            old:  int, initial position
+            new:  int, target position
+        return parameter:
+            job: Job, the queued relocation
+        """
+        device = self.device_loop.device('robot', rack)
+        if device is None or device.client is None:
+            raise KeyError(f"Rack '{rack}' has no robot")
+        return device.client.submit(old, new)
+
+    def execute(self, request):
+        """
+        execute(request)
+            - executes one request
+        transfer parameters:
+            request: dict, id, cmd and args
+        return parameter:
+            response: dict, id, ok and result or error
+        """
+        response = {'id': request.get('id')}
+        function = self.functions.get(request.get('cmd'))
+        if function is None:
+            response.update(ok=False, error=f"Unknown command '{request.get('cmd')}'")
+            return response
+        try:
+            response.update(ok=True, result=to_json(function(*request.get('args', []))))
+        except Exception as e:
+            response.update(ok=False, error=f"{type(e).__name__}: {e}")
+        return response
+
+    def close(self):
+        """
+        close()
+            - stops serve_forever and removes the socket file
+        """
+        self.shutdown()
+        self.server_close()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+
+class _Handler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        for line in self.rfile:
+            try:
+                request = json.loads(line)
+                response = self.server.execute(request if isinstance(request, dict) else {})
+            except ValueError as e:
+                response = {'id': None, 'ok': False, 'error': f"Invalid request: {e}"}
+            self.wfile.write(json.dumps(response).encode() + b'\n')
+
+
+class _Namespace:
+    # functions of one backend class, called in the farmer process
+    def __init__(self, client, name):
+        self._client = client
+        self._name = name
+
+    def __getattr__(self, name):
+        if name not in COMMANDS[self._name]:
+            raise AttributeError(f"{self._name}.{name} is not available through the control interface")
+        command = f"{self._name}.{name}"
+        return lambda *args: self._client.call(command, *args)
+
+
+class Client:
+    """
+    class Client sends commands to a farmer process
+        - call
+        - mirror_channels
+        - close
+    attributes:
+        Config, Control_Parameters, Control_Robot, Visualization: the functions of the backend classes listed in COMMANDS
+    """
+
+    def __init__(self, path=DEFAULT_SOCKET, timeout=10):
+        """
+        transfer parameters:
+            path:    string, path of the socket file
+            timeout: float, seconds to wait for a response
+        """
+        self.path = path
+        self.timeout = timeout
+        self._sock = None
+        self._file = None
+        self._ids = 0
+        # several threads (e.g. the command workers of the GUI) share one connection
+        self._lock = threading.Lock()
+        for name in COMMANDS:
+            setattr(self, name, _Namespace(self, name))
+
+    def _connect(self):
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._sock.settimeout(self.timeout)
+        self._sock.connect(self.path)
+        self._file = self._sock.makefile('rwb')
+
+    def call(self, cmd, *args):
+        """
+        call(cmd, *args)
+            - executes a command in the farmer process
+        transfer parameters:
+            cmd:  string, command, e.g. 'Control_Robot.relocate' or 'status'
+            args: parameters of the command (json compatible)
+        return parameter:
+            result: object, result of the command
+        """
+        with self._lock:
+            self._ids += 1
+            request = json.dumps({'id': self._ids, 'cmd': cmd, 'args': list(args)}).encode() + b'\n'
+            for attempt in (1, 2):
+                try:
+                    if self._file is None:
+                        self._connect()
+                    self._file.write(request)
+                    self._file.flush()
+                    break
+                except OSError:
+                    # the farmer process may have been restarted, connect once more
+                    self.close()
+                    if attempt == 2:
+                        raise
+            # the request has been sent, it is not repeated (e.g. a relocation must not be executed twice)
+            try:
+                line = self._file.readline()
+            except OSError:
+                self.close()
+                raise
+            if not line:
+                self.close()
+                raise ConnectionError("Connection closed by the farmer process")
+        response = json.loads(line)
+        if not response.get('ok'):
+            raise ControlError(response.get('error'))
+        return response.get('result')
+
+    def mirror_channels(self, channels):
+        """
+        mirror_channels(channels)
+            - appends the samples received by the farmer process since the last call to local ring buffers
+            - used by the GUI to draw the live plots as a client
+        transfer parameters:
+            channels: list, RingBuffer per channel (same index as VIAL_PARAMETERS)
+        return parameter:
+            count: int, number of appended samples
+        """
+        latest = [buffer.latest() for buffer in channels]
+        since = min((sample[0] if sample else 0.0) for sample in latest)
+        count = 0
+        for index, times, values in self.call('Visualization.get_samples', since):
+            last = latest[index][0] if latest[index] else 0.0
+            for t, value in zip(times, values):
+                if t > last:
+                    channels[index].append(t, value)
+                    count += 1
+        return count
+
+    def close(self):
+        """
+        close()
+            - closes the connection (it is opened again by the next call)
+        """
+        if self._file is not None:
+            try:
+                self._file.close()
+                self._sock.close()
+            except OSError:
+                pass
+        self._file = None
+        self._sock = None
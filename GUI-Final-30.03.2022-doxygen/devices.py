@@ -0,0 +1,100 @@
+'''
+module name: devices.py
+
+info:
+    This module contains the registry of the devices and other expensive resources (serial ports,
+    pwm board, databases, figures, ...). A resource is registered with a factory and only created
+    on first use, so importing a module does not touch the hardware.
+    Every resource is created once, also if several threads request it at the same time.
+'''
+
+import threading
+
+
+class Registry:
+    """
+    class Registry creates the registered resources on first use
+        - register
+        - get
+        - created
+        - close
+    a resource can also be requested as an attribute, e.g. registry.robot instead of registry.get('robot')
+    """
+
+    def __init__(self):
+        self._factories = {}
+        self._closers = {}
+        self._instances = {}
+        self._order = []
+        # reentrant, a factory may request other resources
+        self._lock = threading.RLock()
+
+    def register(self, name, factory, close=None):
+        """
+        register(name, factory, close=None)
+            - registers a resource, an existing resource with the same name is replaced
+        transfer parameters:
+            name:    string, name of the resource
+            factory: function, called without parameters to create the resource
+            close:   function, called with the resource to release it (None: nothing to release)
+        """
+        with self._lock:
+            self._factories[name] = factory
+            self._closers[name] = close
+
+    def get(self, name):
+        """
+        get(name)
+            - returns a resource, it is created at the first request
+        transfer parameters:
+            name: string, name of the resource
+        return parameter:
+            resource: object, the created resource
+        """
+        try:
+            return self._instances[name]
+        except KeyError:
+            pass
+        with self._lock:
+            if name not in self._instances:
+                if name not in self._factories:
+                    raise KeyError(f"Unknown device '{name}'")
+                self._instances[name] = self._factories[name]()
+                self._order.append(name)
+            return self._instances[name]
+
+    def __getattr__(self, name):
+        if name.startswith('_') or name not in self._factories:
+            raise AttributeError(name)
+        return self.get(name)
+
+    def __contains__(self, name):
+        return name in self._factories
+
+    def created(self, name):
+        """
+        created(name)
+            - checks whether a resource has already been created
+        transfer parameters:
+            name: string, name of the resource
+        return parameter:
+            created: boolean
+        """
+        return name in self._instances
+
+    def close(self):
+        """
+        close()
+            - releases all created resources in the reverse order of their creation
+            - a resource requested again afterwards is created anew
+        """
+        with self._lock:
+            for name in reversed(self._order):
+                resource = self._instances.pop(name)
+                close = self._closers.get(name)
+                if close is not None:
+                    try:
+                        close(resource)
+                    except Exception as e:
+                        print(f"Closing '{name}' failed: {e}")
+            self._order = []
@@ -0,0 +1,252 @@
+'''
+module name: dosing.py
+
+info:
+    This module contains the automatic dosing of the nutrient pump (pwm channel 1 by default).
+    The pump channel must not be shared with another output (e.g. a light), the controller can not be enabled
+    on one of the reserved channels.
+    With every monitoring frame the controller compares a sensor value (TDS by default) with its setpoint
+    and sets the duty cycle of the pump:
+        hysteresis: the pump runs with a fixed duty cycle while the value is more than 'band' below the setpoint
+                    and stops when the setpoint is reached
+        pid:        the duty cycle follows a PID controller (anti-windup, derivative on the measurement)
+    Safety limits:
+        - the duty cycle rises by at most max_rate per second, it may always drop at once
+        - the pumped dose (seconds at full duty cycle) within the last hour is limited to max_dose
+        - the pump is stopped while an interlock channel is outside of its range (pH 5 - 8.5 by default,
+          nutrients shift the pH)
+    The time from the arrival of a frame to the write of the pump channel on the pwm board is measured,
+    so it can be shown that the loop reacts within one monitoring interval.
+'''
+
+import threading
+import time
+from collections import deque
+
+import telemetry
+
+""" pwm channel of the nutrient pump and maximum pwm value """
+PUMP_CHANNEL = 1
+PWM_MAX = 4095
+
+MODES = ('hysteresis', 'pid')
+
+
+class DosingController:
+    """
+    class DosingController sets the nutrient pump depending on the monitored values
+        - enable
+        - disable
+        - configure
+        - update
+        - on_write
+        - status
+    attributes:
+        enabled: boolean, the controller sets the pump
+        duty:    float, current duty cycle (0..1)
+        reason:  string, why the pump is stopped or limited (None: not limited)
+    """
+
+    def __init__(self, actuators, channel=PUMP_CHANNEL, reserved=(), sensor=9, setpoint=700.0, mode='hysteresis', band=50.0,
+                 direction=1, pump_duty=0.5, kp=0.002, ki=0.00002, kd=0.0, max_rate=0.05, max_dose=60.0,
+                 interlocks=None, interval=5.0):
+        """
+        transfer parameters:
+            actuators:  PWMService, service writing the pwm channels
+            channel:    int, pwm channel of the pump
+            reserved:   iterable, pwm channels used by other outputs (e.g. the lights), not allowed as pump channel
+            sensor:     int, controlled value (index of VIAL_PARAMETERS, 9: TDS, 8: pH)
+            setpoint:   float, target value of the sensor
+            mode:       string, 'hysteresis' or 'pid'
+            band:       float, hysteresis: the pump starts below setpoint - band (above for direction -1)
+            direction:  int, 1 if dosing raises the value (TDS), -1 if it lowers it (e.g. pH down solution)
+            pump_duty:  float, duty cycle of the pump in hysteresis mode (0..1)
+            kp, ki, kd: float, PID gains (duty cycle per unit of the sensor)
+            max_rate:   float, maximum rise of the duty cycle per second
+            max_dose:   float, maximum seconds at full duty cycle within one hour
+            interlocks: dict, sensor index -> (low, high), the pump is stopped outside of the range (default: pH 5 - 8.5)
+            interval:   float, monitoring interval in seconds, latency budget of the loop
+        """
+        self.actuators = actuators
+        self.channel = channel
+        self.reserved = frozenset(reserved)
+        self.interlocks = {8: (5.0, 8.5)} if interlocks is None else dict(interlocks)
+        self.interval = interval
+        self.max_rate = max_rate
+        self.max_dose = max_dose
+        self.enabled = False
+        self.duty = 0.0
+        self.reason = None
+        self.value = None
+        self.latencies = deque(maxlen=1000)
+        self._lock = threading.Lock()
+        self._pwm = 0
+        self._pending = None
+        self._last = None
+        self._doses = deque()
+        self.configure(sensor=sensor, setpoint=setpoint, mode=mode, band=band, direction=direction,
+                       pump_duty=pump_duty, kp=kp, ki=ki, kd=kd)
+
+    def configure(self, **settings):
+        """
+        configure(**settings)
+            - changes settings of the controller (channel, sensor, setpoint, mode, band, direction, pump_duty, kp, ki, kd,
+              max_rate, max_dose, interval), the PID state is reset
+        transfer parameters:
+            settings: new values of the settings
+        """
+        unknown = set(settings) - {'channel', 'sensor', 'setpoint', 'mode', 'band', 'direction', 'pump_duty', 'kp', 'ki', 'kd',
+                                   'max_rate', 'max_dose', 'interval'}
+        if unknown:
+            raise ValueError(f"Unknown settings: {', '.join(sorted(unknown))}")
+        if settings.get('mode', 'pid') not in MODES:
+            raise ValueError(f"Unknown mode '{settings['mode']}', use one of {', '.join(MODES)}")
+        if 'channel' in settings and self.enabled and settings['channel'] != self.channel:
+            raise ValueError("The pump channel can not be changed while the dosing is enabled")
+        with self._lock:
+            for name, value in settings.items():
+                setattr(self, name, value)
+            self._integral = 0.0
+            self._pumping = False
+            self._last = None
+
+    def enable(self):
+        """
+        enable()
+            - starts the automatic dosing with the next frame
+            - raises ValueError if the pump channel is also used by another output
+        """
+        if self.channel in self.reserved:
+            raise ValueError(f"The pump channel {self.channel} is also used by another output (reserved channels: "
+                             f"{', '.join(str(ch) for ch in sorted(self.reserved))})")
+        with self._lock:
+            self.enabled = True
+            self._integral = 0.0
+            self._pumping = False
+            # the frame before the last disable must not count as the previous frame
+            self._last = None
+
+    def disable(self):
+        """
+        disable()
+            - stops the automatic dosing and the pump
+        """
+        with self._lock:
+            self.enabled = False
+            self.duty = 0.0
+            self.reason = None
+            self._write(None, 0)
+
+    def _write(self, timestamp, pwm):
+        # compared with the value on the board, a value written by another thread is corrected with the next frame
+        if pwm != self.actuators.get(self.channel):
+            # the latency is measured by on_write when the service has written the channel
+            self._pending = timestamp
+            self._pwm = pwm
+            self.actuators.set(self.channel, pwm)
+
+    def update(self, timestamp, values):
+        """
+        update(timestamp, values)
+            - computes the duty cycle of the pump from a new frame (subscribed with Visualization.subscribe)
+        transfer parameters:
+            timestamp: float, unix time of the frame
+            values:    list, channel values
+        """
+        with self._lock:
+            if not self.enabled:
+                return
+            value = values[self.sensor]
+            last = self._last
+            dt = timestamp - last[0] if last is not None else 0.0
+            self._last = (timestamp, value)
+            self.value = value
+
+            # dose of the last interval and of the last hour (the pump ran with the old duty cycle the whole time)
+            if dt > 0:
+                self._doses.append((timestamp, self.duty * dt))
+            # after a gap in the frames the control steps as if one monitoring interval had passed,
+            # otherwise the rate limit and the PID terms would allow a jump to full duty cycle
+            dt = min(dt, self.interval)
+            while self._doses and self._doses[0][0] < timestamp - 3600:
+                self._doses.popleft()
+            dosed = sum(dose for t, dose in self._doses)
+
+            error = self.direction * (self.setpoint - value)
+            if self.mode == 'hysteresis':
+                if error > self.band:
+                    self._pumping = True
+                elif error <= 0:
+                    self._pumping = False
+                duty = self.pump_duty if self._pumping else 0.0
+            else:
+                duty = self._pid(error, value, last, dt)
+
+            reason = None
+            for sensor, (low, high) in self.interlocks.items():
+                if not low <= values[sensor] <= high:
+                    duty = 0.0
+                    reason = f"{telemetry.CHANNEL_NAMES[sensor]} {values[sensor]:.2f} outside of {low:g} - {high:g}"
+            remaining = self.max_dose - dosed
+            if remaining <= 0:
+                duty = 0.0
+                reason = "maximum dose per hour reached"
+            elif duty * self.interval > remaining:
+                # the next interval must not exceed the dose of the hour
+                duty = remaining / self.interval
+                reason = "limited by the maximum dose per hour"
+            # rising slowly, stopping at once
+            rise = self.max_rate * (dt if dt > 0 else self.interval)
+            if duty > self.duty + rise:
+                duty = self.duty + rise
+                reason = reason or "limited by the maximum rate"
+
+            self.duty = duty
+            self.reason = reason
+            self._write(timestamp, int(round(duty * PWM_MAX)))
+
+    def _pid(self, error, value, last, dt):
+        if dt <= 0:
+            return self.duty
+        derivative = -self.direction * (value - last[1]) / dt
+        integral = self._integral + error * dt
+        output = self.kp * error + self.ki * integral + self.kd * derivative
+        # anti-windup: the integral only grows while the output is not saturated
+        if 0.0 <= output <= 1.0 or (output > 1.0 and error < 0) or (output < 0.0 and error > 0):
+            self._integral = integral
+        return min(max(output, 0.0), 1.0)
+
+    def on_write(self, channels):
+        """
+        on_write(channels)
+            - records the latency from the frame to the write of the pump channel (registered with PWMService.add_listener)
+        transfer parameters:
+            channels: dict, written channels -> values
+        """
+        pending = self._pending
+        if self.channel in channels and pending is not None:
+            self._pending = None
+            self.latencies.append(time.time() - pending)
+
+    def status(self):
+        """
+        status()
+            - returns the state of the controller and the measured latencies
+        return parameter:
+            status: dict, settings, current value, duty cycle, dose of the last hour and latency statistics
+                    (count, mean, p99 and max in seconds, writes later than one monitoring interval)
+        """
+        with self._lock:
+            latencies = sorted(self.latencies)
+            dosed = sum(dose for t, dose in self._doses)
+            status = {'enabled': self.enabled, 'mode': self.mode, 'sensor': self.sensor, 'setpoint': self.setpoint,
+                      'value': self.value, 'duty': self.duty, 'pwm': self._pwm, 'reason': self.reason,
+                      'dose_hour': dosed, 'max_dose': self.max_dose}
+        latency = {'count': len(latencies), 'budget': self.interval}
+        if latencies:
+            latency.update(mean=sum(latencies) / len(latencies),
+                           p99=latencies[min(int(len(latencies) * 0.99), len(latencies) - 1)],
+                           max=latencies[-1],
+                           over_budget=sum(1 for t in latencies if t > self.interval))
+        status['latency'] = latency
+        return status
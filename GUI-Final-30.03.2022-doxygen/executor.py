@@ -0,0 +1,156 @@
+'''
+module name: executor.py
+
+info:
+    This module contains the command executor of the user interface.
+    Button actions (relocation, booking, pwm, ...) are executed on worker threads, so the UI and the
+    live plots keep running while a command is busy. Every command name has its own worker, so commands
+    with the same name are executed in the order of submission while different commands run in parallel.
+    The results are handed back to the tkinter thread through a queue, which is emptied periodically with after().
+'''
+
+import queue
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+
+COMMANDS = metrics.counter('farmer_gui_commands_total', 'Commands of the user interface', ('command', 'result'))
+COMMAND_SECONDS = metrics.histogram('farmer_gui_command_seconds', 'Time from submitting a command to its result (waiting included)',
+                                    ('command',))
+
+
+class CommandExecutor:
+    """
+    class CommandExecutor runs the commands of the UI in the background
+        - submit
+        - bind_button
+        - on_state
+        - is_busy
+        - shutdown
+    attributes:
+        busy:       dict, name -> number of running or waiting commands
+        last_error: string, message of the last failed command (None after a successful command)
+    """
+
+    def __init__(self, root, poll_interval=50):
+        """
+        transfer parameters:
+            root:          object, tkinter root window
+            poll_interval: int, milliseconds between two checks of the result queue
+        """
+        self.root = root
+        self.poll_interval = poll_interval
+        self.busy = {}
+        self.last_error = None
+        self._workers = {}
+        self._results = queue.SimpleQueue()
+        self._buttons = {}
+        self._listeners = []
+
+        root.after(poll_interval, self._drain)
+
+    def submit(self, name, fn, *args, on_done=None, on_error=None):
+        """
+        submit(name, fn, *args, on_done=None, on_error=None)
+            - executes fn(*args) on a worker thread, commands with the same name are executed one after another
+            - must be called on the tkinter thread (e.g. in a button command)
+        transfer parameters:
+            name:     string, name of the command, shown in the UI
+            fn:       function, function to be executed
+            args:     parameters of the function (read tkinter variables before submitting)
+            on_done:  function, called on the tkinter thread with the return value of fn
+            on_error: function, called on the tkinter thread with the exception raised by fn
+        return parameter:
+            future: Future, result of the command
+        """
+        worker = self._workers.get(name)
+        if worker is None:
+            worker = ThreadPoolExecutor(max_workers=1, thread_name_prefix='GuiCommand')
+            self._workers[name] = worker
+
+        self.busy[name] = self.busy.get(name, 0) + 1
+        self._changed(name)
+
+        submitted = time.perf_counter()
+        future = worker.submit(fn, *args)
+
+        def finished(f):
+            COMMAND_SECONDS.labels(name).observe(time.perf_counter() - submitted)
+            COMMANDS.labels(name, 'error' if f.cancelled() or f.exception() is not None else 'ok').inc()
+            self._results.put((name, f, on_done, on_error))
+
+        future.add_done_callback(finished)
+        return future
+
+    def bind_button(self, name, button):
+        """
+        bind_button(name, button)
+            - disables the button while a command with the given name is busy
+        transfer parameters:
+            name:   string, name of the command
+            button: object, tkinter button
+        """
+        self._buttons.setdefault(name, []).append(button)
+
+    def on_state(self, callback):
+        """
+        on_state(callback)
+            - registers a function called on the tkinter thread whenever a command starts or ends
+        transfer parameters:
+            callback: function, called as callback(executor)
+        """
+        self._listeners.append(callback)
+
+    def is_busy(self, name=None):
+        """
+        is_busy(name=None)
+            - checks whether a command is busy
+        transfer parameters:
+            name: string, name of the command (None: any command)
+        return parameter:
+            busy: boolean
+        """
+        if name is None:
+            return any(self.busy.values())
+        return self.busy.get(name, 0) > 0
+
+    def shutdown(self):
+        """
+        shutdown()
+            - stops accepting commands, running commands are finished in the background
+        """
+        for worker in self._workers.values():
+            worker.shutdown(wait=False)
+
+    def _changed(self, name):
+        state = 'disabled' if self.is_busy(name) else 'normal'
+        for button in self._buttons.get(name, []):
+            button.config(state=state)
+        for callback in self._listeners:
+            callback(self)
+
+    def _drain(self):
+        try:
+            while True:
+                try:
+                    name, future, on_done, on_error = self._results.get_nowait()
+                except queue.Empty:
+                    break
+
+                self.busy[name] -= 1
+                error = future.exception()
+                try:
+                    if error is None:
+                        self.last_error = None
+                        if on_done is not None:
+                            on_done(future.result())
+                    else:
+                        self.last_error = f"{name}: {error}"
+                        print(f"Command '{name}' failed: {error}")
+                        if on_error is not None:
+                            on_error(error)
+                finally:
+                    self._changed(name)
+        finally:
+            self.root.after(self.poll_interval, self._drain)
@@ -8,14 +8,36 @@ last update: 2022/03/30
 info:
     This module contains classes for executing threads. 
     User interface, serial communication between the microcontrollers as well as monitoring for time switching are started as parallel processes.
+    Modes (see python farmer.py --help):
+        - default:    all threads including the GUI and the control interface
+        - --headless: daemon without Tk and matplotlib, controlled through the control interface (control_api.py)
+        - --client:   only the GUI, connected to a running headless farmer process
+        - --devices:  the serial devices of several racks are served by one event loop (aio_devices.py),
+                      the first rack is shown in the GUI and controlled by the backend
+        - --http:     additionally streams the telemetry to remote dashboards over HTTP (http_stream.py)
+        - --metrics:  publishes the metrics of the threads and hardware paths for Prometheus (metrics.py)
+        - --profile:  samples the stacks of all threads from the start (profiler.py)
+        - --capture:  records every chunk read from the serial ports to a capture file (capture.py), which can be
+                      shown with python capture.py FILE and replayed with --replay FILE
+        - --replay:   replays a recorded file (monitoringlog.csv, capture or raw dump) instead of reading the monitoring port (replay.py)
+        - --log-file, --log-level: file and level of the log (farmlog.py), robot lines, pwm writes and booking changes
+                      are written by a background thread to the rotating file and shown on the console
+    The profiler can also be switched on and off in a running process with SIGUSR2 (kill -USR2 <pid>)
+    or the control interface (profile_start, profile_stop), the stacks are written to farmer.folded.
 '''
 
+import argparse
+import signal
 import threading
 import time
-import gui
+from concurrent.futures import ThreadPoolExecutor
 import backend
-
-import serial
+import control_api
+import aio_devices
+import metrics
+import farmlog
+import replay
+import capture
 
 class GuiThread(threading.Thread):
     
@@ -25,14 +47,17 @@ class GuiThread(threading.Thread):
         - run
     """
 
-    def __init__(self, iD, name):
+    def __init__(self, iD, name, api=None):
         threading.Thread.__init__(self)
         self.iD = iD
         self.name = name
+        self.api = api
 
     def run(self):
+        # the GUI modules (tkinter, matplotlib) are only imported if the GUI is started
+        import gui
         print("Starting GUI...\nThread-ID: ", self.iD)
-        gui.gui()
+        gui.gui(self.api)
         
 class ConsoleThread(threading.Thread):
     
@@ -89,21 +114,212 @@ class MonitoringThread(threading.Thread):
         print("Reading parameters: ")
         parameters.get_vial_parameters()
 
-def main():
+class ReplayThread(threading.Thread):
+    
     """
-    main()
+    class ReplayThread inherits from the threading.Thread class and replays recorded monitoring data instead of the MonitoringThread
+        - __init__
+        - run
+    """
+    
+    def __init__(self, iD, name, path, speed):
+        threading.Thread.__init__(self)
+        self.iD = iD
+        self.name = name
+        self.path = path
+        self.speed = speed
+
+    def run(self):
+        print("Replaying " + self.path + "\nThread-ID: ", self.iD)
+        # the frames are moved to the current time, so the live plots show them like new measurements
+        replay.Replay(replay.open_source(self.path), self.speed, shift=True).run()
+
+class ControlThread(threading.Thread):
+    
+    """
+    class ControlThread inherits from the threading.Thread class and serves the control interface (control_api.py) as a thread
+        - __init__
+        - run
+    """
+    
+    def __init__(self, iD, name, path, device_loop=None):
+        threading.Thread.__init__(self)
+        self.iD = iD
+        self.name = name
+        self.server = control_api.Server(backend, path, device_loop)
+
+    def run(self):
+        print("Control interface on " + self.server.path + "\nThread-ID: ", self.iD)
+        self.server.serve_forever()
+
+def start_device_loop(path):
+    """
+    start_device_loop(path)
+        - starts the event loop serving all devices of the configuration file
+        - the frames of the first rack are processed by the backend (live plots, history) on a worker thread,
+          so a write to the history database does not stall the devices on the loop
+        - the lines of all robots are logged
+        - the robot client and the booking table of the first rack replace the ones of the backend
+    transfer parameters:
+        path: string, json file with the devices (see aio_devices.py)
+    return parameter:
+        loop: DeviceLoop, the running loop
+    """
+    loop = aio_devices.load_devices(path)
+    rack = loop.racks()[0]
+    if backend.hw.created('capture'):
+        for device in loop.devices.values():
+            device.tee = backend.hw.capture.tee(device.id)
+    
+    # one worker, so the frames are processed in the order of their arrival
+    worker = ThreadPoolExecutor(max_workers=1, thread_name_prefix='FrameWorker')
+    
+    def process(reading):
+        if reading.rack == rack:
+            loop.loop.run_in_executor(worker, backend.Visualization.process_frame, reading.values, reading.timestamp)
+    
+    loop.subscribe('frame', process)
+    loop.subscribe('line', lambda item: backend.ROBOT_LOG.info(item[1], rack=item[0].id))
+    
+    robot = loop.device('robot', rack)
+    if robot is not None:
+        backend.hw.register('robot_arm', lambda: robot.client)
+        backend.hw.register('positions', lambda: robot.client.table)
+    
+    print("Device loop: " + ", ".join(loop.devices))
+    loop.start()
+    return loop
+
+def start_telemetry_server(host, port):
+    """
+    start_telemetry_server(host, port)
+        - starts the HTTP server streaming the processed frames to remote dashboards
+    transfer parameters:
+        host: string, address the server listens on
+        port: int, tcp port
+    return parameter:
+        server: TelemetryServer, the running server
+    """
+    import http_stream
+    
+    server = http_stream.TelemetryServer(backend.Visualization.get_history_points, host, port)
+    server.start()
+    backend.Visualization.subscribe(server.publish)
+    print("Telemetry stream on http://" + server.host + ":" + str(server.port) + "/stream")
+    return server
+
+def watch_threads(threads):
+    """
+    watch_threads(threads)
+        - publishes whether the threads are still running (metric farmer_thread_alive, labelled with the class name)
+    transfer parameters:
+        threads: list, started or to be started threads
+    """
+    alive = metrics.gauge('farmer_thread_alive', 'Threads of the farmer process (1: running)', ('thread',))
+    for thread in threads:
+        alive.labels(type(thread).__name__).set_function(lambda thread=thread: int(thread.is_alive()))
+
+def main(argv=None):
+    """
+    main(argv=None)
         - creating objects of the classes listed above
-        - starting the threads
+        - starting the threads depending on the mode
+        - headless: waits for SIGTERM or Ctrl+C and releases the hardware
+    transfer parameters:
+        argv: list, command line arguments (default: sys.argv[1:])
     """
-    console_thread = ConsoleThread(1, "Console Thread")  
-    gui_thread = GuiThread(2, "Gui Thread")
+    parser = argparse.ArgumentParser(description='Vertical-Farming-Bot')
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument('--headless', action='store_true', help='run without GUI, controlled through the control socket')
+    mode.add_argument('--client', action='store_true', help='only start the GUI as a client of a headless farmer process')
+    parser.add_argument('--socket', default=control_api.DEFAULT_SOCKET, help='path of the control socket')
+    parser.add_argument('--no-api', action='store_true', help='do not start the control interface')
+    parser.add_argument('--devices', default=None, help='json file with the serial devices of several racks')
+    parser.add_argument('--http', type=int, default=None, metavar='PORT', help='stream the telemetry over HTTP on this port')
+    parser.add_argument('--http-host', default='127.0.0.1', help='address of the HTTP server (0.0.0.0: local network)')
+    parser.add_argument('--metrics', type=int, default=None, metavar='PORT', help='publish the metrics on http://127.0.0.1:PORT/metrics')
+    parser.add_argument('--capture', default=None, nargs='?', const='', metavar='FILE',
+                        help='record the raw serial data (default file: capture-<date>-<time>.bin)')
+    parser.add_argument('--replay', default=None, metavar='FILE', help='replay monitoringlog.csv, a capture or a raw dump instead of reading the monitoring port')
+    parser.add_argument('--replay-speed', type=float, default=1.0, help='factor of the recorded pace (1: real time, 0: as fast as possible)')
+    parser.add_argument('--log-file', default=farmlog.DEFAULT_PATH, help='rotating log file (farmer.log.1, ... are the older files)')
+    parser.add_argument('--log-level', default='info', choices=sorted(farmlog.LEVELS, key=farmlog.LEVELS.get),
+                        help='lowest level written to the log file, the console shows info and above')
+    parser.add_argument('--profile', type=float, default=None, nargs='?', const=0.01, metavar='INTERVAL',
+                        help='sample the stacks of all threads from the start (seconds between two samples, default 0.01)')
+    args = parser.parse_args(argv)
+    
+    if args.metrics is not None:
+        metrics.serve(args.metrics)
+        print("Metrics on http://127.0.0.1:" + str(args.metrics) + "/metrics")
+    
+    if args.client:
+        # the log file belongs to the headless process
+        farmlog.configure(None, args.log_level)
+        gui_thread = GuiThread(2, "Gui Thread", control_api.Client(args.socket))
+        gui_thread.start()
+        return
+    
+    farmlog.configure(args.log_file, args.log_level)
+    # SIGUSR2 switches the profiler on and off, the stacks are written when it is switched off
+    signal.signal(signal.SIGUSR2, lambda signum, frame: backend.hw.profiler.toggle())
+    if args.profile is not None:
+        backend.hw.profiler.start(args.profile)
+    if args.capture is not None:
+        # created before the reader threads, so they find the recorder when they start
+        backend.hw.register('capture', lambda: capture.Recorder(args.capture or None), close=capture.Recorder.close)
+        backend.hw.get('capture')
     backend_thread = BackEndThread(3, "BackEnd Thread")
-    monitoring = MonitoringThread(4, "Monitoring Thread")
+    # the drift detection follows every frame from the start, not only after the GUI has asked for it
+    backend.hw.get('analytics')
+    device_loop = None
+    if args.devices:
+        # one event loop for the serial devices of all racks instead of the console and monitoring threads
+        device_loop = start_device_loop(args.devices)
+        threads = [backend_thread]
+    else:
+        console_thread = ConsoleThread(1, "Console Thread")  
+        if args.replay:
+            monitoring = ReplayThread(4, "Replay Thread", args.replay, args.replay_speed)
+        else:
+            monitoring = MonitoringThread(4, "Monitoring Thread")
+        threads = [console_thread, backend_thread, monitoring]
+    telemetry_server = None
+    if args.http is not None:
+        telemetry_server = start_telemetry_server(args.http_host, args.http)
+    control = None
+    if not args.no_api:
+        control = ControlThread(5, "Control Thread", args.socket, device_loop)
+        threads.append(control)
+    
+    if not args.headless:
+        gui_thread = GuiThread(2, "Gui Thread")
+        threads.insert(1, gui_thread)
+        watch_threads(threads)
+        for thread in threads:
+            thread.start()
+        return
     
-    console_thread.start()
-    gui_thread.start()
-    backend_thread.start()
-    monitoring.start()
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+    watch_threads(threads)
+    for thread in threads:
+        # the loops of the threads never end, the process ends with the main thread
+        thread.daemon = True
+        thread.start()
+    try:
+        while not stop.wait(1):
+            pass
+    except KeyboardInterrupt:
+        pass
+    print("Program will shut down...")
+    if control is not None:
+        control.server.close()
+    if device_loop is not None:
+        device_loop.stop()
+    if telemetry_server is not None:
+        telemetry_server.stop()
+    backend.hw.close()
 
 if __name__ == '__main__':
     main()
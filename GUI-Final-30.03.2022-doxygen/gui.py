@@ -11,8 +11,9 @@ info:
 from tkinter import *
 from tkinter import ttk
 import time
+import threading
 import backend
-from picamera import PiCamera
+import executor
 import datetime
 
 import matplotlib
@@ -21,15 +22,15 @@ from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 from matplotlib.figure import Figure
 
 # Array of Main Timecode
-CH_S_H = [
-    """
+"""
     CH_S_H:
         - data type: array 
         - data included: strings
         - info: 
             - includes the hours for the option menus for the start time of the user interface
             - 24 indices
-    """
+"""
+CH_S_H = [
     '00', '01', '02', '03', '04', 
     '05', '06', '07', '08', '09', 
     '10', '11', '12', '13', '14', 
@@ -37,15 +38,15 @@ CH_S_H = [
     '20', '21', '22', '23'
 ]
 
-CH_E_H = [
-    """
+"""
     CH_E_H:
         - data type: array 
         - data included: strings
         - info: 
             - includes the hours for the option menus for the stop time of the user interface
             - 24 indices
-    """
+"""
+CH_E_H = [
     '00', '01', '02', '03', '04', 
     '05', '06', '07', '08', '09', 
     '10', '11', '12', '13', '14', 
@@ -53,43 +54,43 @@ CH_E_H = [
     '20', '21', '22', '23'
 ]
 
-CH_S_M = [
-    """
+"""
     CH_S_M:
         - data type: array 
         - data included: strings
         - info: 
             - includes the minutes for the option menus for the start time of the user interface
             - 12 indices
-    """
+"""
+CH_S_M = [
     '00', '05', '10', '15', 
     '20', '25', '30', '35', 
     '40', '45', '50', '55'
 ]
 
-CH_E_M = [
-    """
+"""
     CH_E_M:
         - data type: array 
         - data included: strings
         - info: 
             - includes the minutes for the option menus for the stop time of the user interface
             - 12 indices
-    """
+"""
+CH_E_M = [
     '00', '05', '10', '15', 
     '20', '25', '30', '35', 
     '40', '45', '50', '55'
 ]
 
-POSITIONS = [
-    """
+"""
     POSITIONS:
         - data type: array 
         - data included: integers
         - info: 
             - includes the positions for the option menus for updating the booking system
             - 24 indices
-    """
+"""
+POSITIONS = [
     0, 1, 2, 3, 4, 5,
     6, 7, 8, 9, 10, 11,
     12, 13, 14, 15,
@@ -97,15 +98,15 @@ POSITIONS = [
     20, 21, 22, 23
 ]
 
-POSITIONS2 = [
-    """
+"""
     POSITIONS2:
         - data type: array 
         - data included: integers
         - info: 
             - includes the positions for the option menus for checking the booking system
             - 24 indices
-    """
+"""
+POSITIONS2 = [
     0, 1, 2, 3, 4, 5,
     6, 7, 8, 9, 10, 11,
     12, 13, 14, 15,
@@ -113,28 +114,28 @@ POSITIONS2 = [
     20, 21, 22, 23
 ]
 
-BOOKING_STATE = [
-    """
+"""
     BOOKING_STATE:
         - data type: array 
         - data included: boolean vars
         - info: 
             - includes the two states for the option menus for updating the booking system
             - 2 indices
-    """
+"""
+BOOKING_STATE = [
     True,
     False
 ]
 
-SPECIES = [
-    """
+"""
     SPECIES:
         - data type: array 
         - data included: strings
         - info: 
             - includes the available plant species for the option menus for updating the booking system
             - 8 indices
-    """
+"""
+SPECIES = [
            "None",
            "Arugula",
            "Basil",
@@ -149,35 +150,126 @@ SPECIES = [
 # Lightmode #D8D8D8
 # Hell #A4A4A4
 
-#camera = PiCamera()
-#camera.resolution = (640, 480)
-#camera.preview_window=(48, 105, 800, 720)
-#camera.rotation = 180
-#camera.framerate = 30
+""" camera of the preview, created on first use by get_camera (picamera is only imported then) """
+camera = None
+
+def get_camera():
+    """
+    get_camera()
+        - creates the camera at the first call and returns it
+    return parameter:
+        camera: PiCamera, camera of the preview
+    """
+    global camera
+    if camera is None:
+        from picamera import PiCamera
+        camera = PiCamera()
+        camera.resolution = (640, 480)
+        camera.preview_window=(48, 105, 800, 720)
+        camera.rotation = 180
+        camera.framerate = 30
+    return camera
 
+""" backend classes used by the UI, replaced by the control interface if the GUI runs as a client """
+config = backend.Config
 control_p = backend.Control_Parameters
 control_robot = backend.Control_Robot
 data_m = backend.Visualization
     
 def capture():
-    #camera.start_preview()
+    #get_camera().start_preview()
     print("Start cam.")
 
 def exit_capture():
-    #camera.stop_preview()
+    #get_camera().stop_preview()
     print("Stop cam.")
     
 def dig_time(curr_time):
     while True:
         return curr_time
 
-def gui():
+def mirror_channels(api, interval=1):
+    """
+    mirror_channels(api, interval=1)
+        - copies the samples of the farmer process into the local channel buffers of the live plots (client mode)
+        - runs until the program stops, connection problems are reported once
+    transfer parameters:
+        api:      Client, control interface of the farmer process
+        interval: float, seconds between two requests
     """
-    gui():
+    connected = True
+    while True:
+        try:
+            api.mirror_channels(backend.CHANNELS)
+            connected = True
+        except Exception as e:
+            if connected:
+                print("Connection to the farmer process failed: " + str(e))
+            connected = False
+        time.sleep(interval)
+
+def history_controls(master, history):
+    """
+    history_controls(master, history)
+        - creates the buttons to switch a plot between the live data and the stored history (24h, 7d, 30d)
+        - the history can be moved and zoomed with the buttons or the mouse wheel
+    transfer parameters:
+        master:  object, tkinter frame the buttons are placed in
+        history: HistoryPlot, history view of the plot
+    return parameter:
+        frame: object, tkinter frame with the buttons
+    """
+    frame = Frame(master, background="#FFFFFF")
+    buttons = [("Live", history.live),
+               ("24h", lambda: history.show('24h')),
+               ("7d", lambda: history.show('7d')),
+               ("30d", lambda: history.show('30d')),
+               ("<", lambda: history.pan(-0.5)),
+               (">", lambda: history.pan(0.5)),
+               ("+", lambda: history.zoom(0.5)),
+               ("-", lambda: history.zoom(2))]
+    for column, (text, command) in enumerate(buttons):
+        Button(frame, bg="#84E752", width=4, text=text, highlightthickness = 0, bd = 0, command=command).grid(row=0, column=column, padx=2, pady=2)
+    return frame
+
+""" channels shown with their statistics below the plots """
+STATISTICS_CHANNELS = (('pH', 'pH', 2), ('tds', 'TDS', 0), ('water temperature', 'Water °C', 1), ('level tank', 'Tank', 1))
+
+def format_statistics(report):
+    """
+    format_statistics(report)
+        - formats the rolling statistics of the watched channels as text lines
+    transfer parameters:
+        report: dict, result of Visualization.get_statistics
+    return parameter:
+        text: string, one line per channel and one per drift alert
+    """
+    lines = []
+    for name, label, digits in STATISTICS_CHANNELS:
+        stats = report['channels'].get(name)
+        if stats is not None:
+            lines.append(f"{label}: {stats['mean']:.{digits}f} ± {stats['std']:.{digits}f}  "
+                         f"(min {stats['min']:.{digits}f}, max {stats['max']:.{digits}f}, {stats['slope']:+.{digits + 1}f}/h)")
+    lines += ["Drift: " + alert for alert in report['alerts']]
+    return report['window'] + " (" + str(report['count']) + " samples)\n" + "\n".join(lines)
+
+def gui(api=None):
+    """
+    gui(api=None):
         - function for creating the user interface
         - called in the farmer.py as a thread
-        - UI is interacting with the backend
+        - UI is interacting with the backend, directly or through the control interface of a headless farmer process
+    transfer parameters:
+        api: Client, control interface (None: the backend of this process is used)
     """
+    global config, control_p, control_robot, data_m
+    
+    if api is not None:
+        config = api.Config
+        control_p = api.Control_Parameters
+        control_robot = api.Control_Robot
+        data_m = api.Visualization
+        threading.Thread(target=mirror_channels, args=(api,), name='MirrorThread', daemon=True).start()
     
     
     root = Tk()
@@ -187,6 +279,9 @@ def gui():
     win_icon = PhotoImage(file="Icons/tea-plant-leaf-icon.png")
     root.iconphoto(False, win_icon)
     
+    # commands of the buttons are executed in the background, the results are returned to the UI thread
+    commands = executor.CommandExecutor(root)
+    
     # other Vars
     var_scale_irrigation = IntVar()
     var_scale_lights = IntVar()
@@ -246,11 +341,14 @@ def gui():
     reset_img = PhotoImage(file="Icons/Reload-2-2-icon32p.png")
     
     shutdown_b = Button(header, image=exit_img, height=32, width=32, background = "#D8D8D8", highlightthickness = 0, bd = 0, command=lambda:[print("Program will shut down..."),
+                                                                                                                                             commands.shutdown(),
                                                                                                                                              root.destroy()]).grid(row=0, column=0, pady=5, padx=5)
     settings_b = Button(header, image=settings_img, height=32, width=32, background = "#D8D8D8", highlightthickness = 0, bd = 0).grid(row=0, column=1, pady=5, padx=5)
     camera_b = Button(header, image=camera_img, height=32, width=32, background = "#D8D8D8", highlightthickness = 0, bd = 0, command=capture).grid(row=0, column=2, pady=5, padx=5)
     camera_exit_b = Button(header, image=camera_img, height=32, width=32, background = "#A30000", highlightthickness = 0, bd = 0, command=exit_capture).grid(row=0, column=3, pady=5, padx=5)
-    reset_channels_b = Button(header, image=reset_img, height=32, width=32, background = "#D8D8D8", highlightthickness = 0, bd = 0, command=lambda:[control_p.reset_pwm_channels()]).grid(row=0, column=4, pady=5, padx=5)
+    reset_channels_b = Button(header, image=reset_img, height=32, width=32, background = "#D8D8D8", highlightthickness = 0, bd = 0, command=lambda:[commands.submit("reset", control_p.reset_pwm_channels)])
+    reset_channels_b.grid(row=0, column=4, pady=5, padx=5)
+    commands.bind_button("reset", reset_channels_b)
     
     # Spacer
     spacer_header1 = Frame(header, height=100, width=357, background = "#D8D8D8")
@@ -268,14 +366,22 @@ def gui():
     status_fix.grid(row=0, column=1)
 
     # Bereit mit "#40FF00"
-    #status_ready = Label(frame_state, height=2, width=10, text="Bereit", bg="#40FF00", font=('Helvetica', 10))
-    #status_ready.grid(row=1, column = 0, padx=2, pady=5)
     # In Aktion mit "#FACC2E"
-    #status_wait = Label(frame_state, height=2, width=10, text="In Aktion", bg="#FACC2E", font=('Helvetica', 10))
-    #status_wait.grid(row=1, column = 1, padx=2, pady=5)
     # Störung mit "#FF0000"
-    #status_var = Label(frame_state, height=2, width=10, text="Störung", bg="#FF0000", font=('Helvetica', 10))
-    #status_var.grid(row=1, column = 2, padx=2, pady=5)
+    status_var = Label(frame_state, height=2, width=30, text="Bereit", bg="#40FF00", font=('Helvetica', 10))
+    status_var.grid(row=1, column = 1, padx=2, pady=5)
+    
+    def show_state(commands):
+        # the periodic statistics update is not shown
+        running = [name for name, count in commands.busy.items() if count > 0 and name != "statistics"]
+        if running:
+            status_var.config(text="In Aktion: " + ", ".join(running), bg="#FACC2E")
+        elif commands.last_error is not None:
+            status_var.config(text="Störung: " + commands.last_error, bg="#FF0000")
+        else:
+            status_var.config(text="Bereit", bg="#40FF00")
+    
+    commands.on_state(show_state)
     
 # REIHE 2
     spacer_2_1 = Frame(root, background="#FFFFFF", pady=20, height=50)
@@ -348,6 +454,27 @@ def gui():
     ph_canvas.draw()
     ph_canvas.get_tk_widget().grid(row=0, column=0)
     
+    # history views, loaded on a worker thread (in client mode from the farmer process)
+    for history in (backend.temp_history, backend.pH_history):
+        history.loader = data_m.get_history_points
+        history.executor = commands
+    history_controls(data_frame, backend.temp_history).grid(row=1, column=0)
+    history_controls(data_frame3, backend.pH_history).grid(row=1, column=0)
+    
+    # rolling statistics of the last 24 hours, red if a drift alert is active
+    statistics_label = Label(monitoring_f, justify=LEFT, text="24h statistics...", background="#FFFFFF", font=('Helvetica', 10))
+    statistics_label.grid(row=4, column=0, pady=5)
+    
+    def show_statistics(report):
+        statistics_label.config(text=format_statistics(report), fg="#FF0000" if report['alerts'] else "#000000")
+    
+    def update_statistics():
+        if not commands.is_busy("statistics"):
+            commands.submit("statistics", data_m.get_statistics, '24h', on_done=show_statistics)
+        root.after(5000, update_statistics)
+    
+    update_statistics()
+    
     #plot_frame_ec = Canvas(data_frame4)
     #plot_frame_ec.grid(row=0, column=0)
     
@@ -386,9 +513,12 @@ def gui():
     command_text_new = Entry(control_frame_spacer, width=10)
     command_text_new.grid(row=1, column=1, padx=10, pady=5)
     
-    command_text_button = Button(control_frame_spacer, bg="#84E752", width=6, text="Apply", highlightthickness = 0, bd = 0, command=lambda:[control_robot.relocate(command_text_old.get(),
-                                                                                                                                            command_text_new.get())])
+    command_text_button = Button(control_frame_spacer, bg="#84E752", width=6, text="Apply", highlightthickness = 0, bd = 0, command=lambda:[commands.submit("relocate",
+                                                                                                                                                            control_robot.relocate,
+                                                                                                                                                            command_text_old.get(),
+                                                                                                                                                            command_text_new.get())])
     command_text_button.grid(row=2, column=1, padx = 10, pady=10)
+    commands.bind_button("relocate", command_text_button)
     
     # Position Management
     positions_frame = Frame(posman_f, background="#FFFFFF")
@@ -416,10 +546,13 @@ def gui():
     species_box = OptionMenu(positions_frame_spacer, Species_list, *SPECIES)
     species_box.grid(row=2, column=1, padx=10, pady=5)
     
-    config_update_button = Button(positions_frame_spacer, bg="#84E752", width=6, text="Update", highlightthickness = 0, bd = 0, command=lambda:[backend.Config.edit_positioning(Position_list.get(),
-                                                                                                                                                                                Booking_state_list.get(),
-                                                                                                                                                                                Species_list.get())])
+    config_update_button = Button(positions_frame_spacer, bg="#84E752", width=6, text="Update", highlightthickness = 0, bd = 0, command=lambda:[commands.submit("booking",
+                                                                                                                                                                     config.edit_positioning,
+                                                                                                                                                                     Position_list.get(),
+                                                                                                                                                                     Booking_state_list.get(),
+                                                                                                                                                                     Species_list.get())])
     config_update_button.grid(row=3, column=1, padx = 10, pady=10)
+    commands.bind_button("booking", config_update_button)
     
     #spacer_labels = Label(positions_frame_spacer, bg="#FFFFFF", height=10)
     #spacer_labels.grid(row=4, column=0, padx=10, pady=10)
@@ -435,7 +568,10 @@ def gui():
     pos_box_show = OptionMenu(ctl_labels_frame1, Position_list_show, *POSITIONS2)
     pos_box_show.grid(row=0, column=0, padx=10, pady=10)
     
-    show_booking_button = Button(ctl_labels_frame1, bg="#FFC300", width=6, text="Check", highlightthickness = 0, bd = 0, command=lambda:[ctl_pos.config(text=backend.Config.check_booking(Position_list_show.get()))])
+    show_booking_button = Button(ctl_labels_frame1, bg="#FFC300", width=6, text="Check", highlightthickness = 0, bd = 0, command=lambda:[commands.submit("check booking",
+                                                                                                                                                           config.check_booking,
+                                                                                                                                                           Position_list_show.get(),
+                                                                                                                                                           on_done=lambda text: ctl_pos.config(text=text))])
     show_booking_button.grid(row=0, column=1, padx=10, pady=10)
     
     #ctl_book = Label(ctl_labels_frame, bg="#FFFDDD")
@@ -473,7 +609,7 @@ def gui():
     irrigation_scale = Scale(irrigation_frame, activebackground="#84E752", bg="#FFFFFF", bd=0, highlightbackground="#FFFFFF", highlightcolor="#84E752", sliderrelief=FLAT, sliderlength=15, orient='horizontal', length=300, from_=0, to=100, variable=var_scale_irrigation)
     irrigation_scale.grid(row=1, column=0, padx=5, pady=5)
     
-    irrigation_apply = Button(irrigation_frame, bg="#84E752", width=6, text="Apply", highlightthickness = 0, bd = 0, command=lambda:[control_p.change_val_pump(var_scale_irrigation.get()),
+    irrigation_apply = Button(irrigation_frame, bg="#84E752", width=6, text="Apply", highlightthickness = 0, bd = 0, command=lambda:[commands.submit("irrigation", control_p.change_val_pump, var_scale_irrigation.get()),
                                                                                                                                      print("Values changed.")])
     irrigation_apply.grid(row=2, column=0, padx=5, pady=5)
     
@@ -485,10 +621,31 @@ def gui():
     nutrients_scale = Scale(nutrients_frame, activebackground="#84E752", bg="#FFFFFF", bd=0, highlightbackground="#FFFFFF", highlightcolor="#84E752", sliderrelief=FLAT, sliderlength=15, orient='horizontal', length=300, from_=0, to=100, variable=var_scale_nutrients)
     nutrients_scale.grid(row=1, column=0, padx=5, pady=5)
     
-    nutrients_apply = Button(nutrients_frame, bg="#84E752", width=6, text="Apply", highlightthickness = 0, bd = 0, command=lambda:[control_p.change_val_nutrients(var_scale_nutrients.get()),
+    nutrients_apply = Button(nutrients_frame, bg="#84E752", width=6, text="Apply", highlightthickness = 0, bd = 0, command=lambda:[commands.submit("nutrients", control_p.change_val_nutrients, var_scale_nutrients.get()),
+                                                                                                                                     var_auto_dosing.set(0),
                                                                                                                                      print("Values changed.")])
     nutrients_apply.grid(row=2, column=0, padx=5, pady=5)
     
+    # automatic dosing, the pump follows the TDS value (Apply with a manual value ends it)
+    nutrients_auto_frame = Frame(nutrients_frame, bg="#FFFFFF")
+    nutrients_auto_frame.grid(row=3, column=0, padx=5, pady=5)
+    
+    var_auto_dosing = IntVar()
+    var_tds_setpoint = IntVar(value=700)
+    
+    def toggle_dosing():
+        if var_auto_dosing.get():
+            # e.g. the pump channel is shared with a light, the box is cleared again
+            commands.submit("nutrients", control_p.start_dosing, var_tds_setpoint.get(),
+                            on_error=lambda error: var_auto_dosing.set(0))
+        else:
+            commands.submit("nutrients", control_p.stop_dosing)
+    
+    nutrients_auto = Checkbutton(nutrients_auto_frame, bg="#FFFFFF", text="automatic, TDS setpoint [ppm]:", highlightthickness = 0, variable=var_auto_dosing, command=toggle_dosing)
+    nutrients_auto.grid(row=0, column=0, padx=2)
+    nutrients_setpoint = Spinbox(nutrients_auto_frame, from_=200, to=2000, increment=50, width=6, textvariable=var_tds_setpoint)
+    nutrients_setpoint.grid(row=0, column=1, padx=2)
+    
     # circulation
     circulation_frame_label = Label(circulation_frame, bg="#FFFFFF", text="CIRCULATION", font=('Helvetica', 12))
     circulation_frame_label.grid(row=0, column=0, padx=10, pady=5)
@@ -506,15 +663,15 @@ def gui():
     #circulation_fan_growing = Label(circulation_fan_frame, bg="#FFFFFF", text="Fans Growing Floors", font=('Helvetica', 10))
     #circulation_fan_growing.grid(row=2, column=0, padx=5, pady=2)
     fan_raisin_button_on = Button(circulation_fan_frame, height=1, width=1, background = "#84E752", highlightthickness = 0, bd = 0, command=lambda:[print("Starting vents..."),
-                                                                                                                                                    control_p.start_circulation(12, 2500),
-                                                                                                                                                    control_p.start_circulation(13, 2500),
-                                                                                                                                                    control_p.start_circulation(10, 2500)
+                                                                                                                                                    commands.submit("circulation", control_p.start_circulation, 12, 2500),
+                                                                                                                                                    commands.submit("circulation", control_p.start_circulation, 13, 2500),
+                                                                                                                                                    commands.submit("circulation", control_p.start_circulation, 10, 2500)
                                                                                                                                                     ])
     fan_raisin_button_on.grid(row=1, column = 1, padx=5, pady=2)
     fan_raisin_button_off = Button(circulation_fan_frame, height=1, width=1, background = "#E75252", highlightthickness = 0, bd = 0, command=lambda:[print("Stopping vents..."),
-                                                                                                                                                     control_p.stop_circulation(12),
-                                                                                                                                                     control_p.stop_circulation(13),
-                                                                                                                                                     control_p.stop_circulation(10)
+                                                                                                                                                     commands.submit("circulation", control_p.stop_circulation, 12),
+                                                                                                                                                     commands.submit("circulation", control_p.stop_circulation, 13),
+                                                                                                                                                     commands.submit("circulation", control_p.stop_circulation, 10)
                                                                                                                                                      ])
     fan_raisin_button_off.grid(row=1, column = 2, padx=5, pady=2)
     
@@ -562,9 +719,9 @@ def gui():
     lights_end_m.grid(row=0, column=6, padx=1)
     
     lights_apply = Button(lights_time_frame, bg="#84E752", width=6, text="Apply", highlightthickness = 0, bd = 0, command=lambda:[print("Getting state of the checkboxes..."),
-                                                                                                                                  control_p.get_state_boxes(state_light_eg.get(), state_light_first.get(), state_light_second.get(), state_light_raisin.get()),
+                                                                                                                                  commands.submit("lights", control_p.get_state_boxes, state_light_eg.get(), state_light_first.get(), state_light_second.get(), state_light_raisin.get()),
                                                                                                                                   print("Success!"),
-                                                                                                                                  control_p.write_time_list(Light_start_h.get(), Light_start_m.get(), Light_end_h.get(), Light_end_m.get(), var_scale_lights.get()), 
+                                                                                                                                  commands.submit("lights", control_p.write_time_list, Light_start_h.get(), Light_start_m.get(), Light_end_h.get(), Light_end_m.get(), var_scale_lights.get()), 
                                                                                                                                   print("Values changed.")
                                                                                                                                   ])
     lights_apply.grid(row=0, column=7, padx=10, pady=2)
@@ -572,10 +729,15 @@ def gui():
     light_val_scale = Scale(control_lights, activebackground="#84E752", bg="#FFFFFF", bd=0, highlightbackground="#FFFFFF", highlightcolor="#84E752", sliderrelief=FLAT, sliderlength=15, orient='horizontal', length=350, from_=0, to=100, label = "intensity [%]", variable=var_scale_lights)
     light_val_scale.grid(row=1, column=0, padx=5, pady=5)
     
-    ani = backend.animation.FuncAnimation(monitoring.plot_figure(), backend.Visualization.animate, interval=5000)
-    #ani2 = backend.animation.FuncAnimation(monitoring.plot_figure2(), backend.Visualization.animate2, interval=5000)
-    ani3 = backend.animation.FuncAnimation(monitoring.plot_figure_pH(), backend.Visualization.animate_pH, interval=10000)
-    #ani4 = backend.animation.FuncAnimation(monitoring.plot_figure_ec(), backend.Visualization.animate_ec, interval=5000)
+    # live plots, only redrawn if new data has arrived
+    backend.temp_live.attach(temp_canvas)
+    backend.temp_live.start(root, 1000)
+    #backend.lev_live.attach(waterlevel_canvas)
+    #backend.lev_live.start(root, 1000)
+    backend.pH_live.attach(ph_canvas)
+    backend.pH_live.start(root, 1000)
+    #backend.ec_live.attach(ec_canvas)
+    #backend.ec_live.start(root, 1000)
     
     root.mainloop()
     
@@ -0,0 +1,227 @@
+'''
+module name: history.py
+
+info:
+    This module contains the persistent history of the monitoring data.
+    The samples are stored in a SQLite database (WAL mode) with the primary key (channel, time),
+    so a time range of one channel can be read without scanning the whole history.
+    Samples older than the retention time are downsampled into buckets (mean, min, max).
+    The batches and the downsampling are written by a writer thread, so the thread adding the frames
+    never waits for the database.
+'''
+
+import sqlite3
+import threading
+import time
+
+import metrics
+
+FLUSH_SECONDS = metrics.histogram('farmer_history_flush_seconds', 'Duration of a batched write to the history database')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS samples (
+    channel INTEGER NOT NULL,
+    ts      REAL    NOT NULL,
+    value   REAL,
+    PRIMARY KEY (channel, ts)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS rollup (
+    channel INTEGER NOT NULL,
+    ts      REAL    NOT NULL,
+    mean    REAL,
+    min     REAL,
+    max     REAL,
+    count   INTEGER,
+    PRIMARY KEY (channel, ts)
+) WITHOUT ROWID;
+"""
+
+DAY = 86400
+
+
+class HistoryStore:
+    """
+    class HistoryStore contains the functions to write and query the monitoring history
+        - add
+        - flush
+        - query
+        - query_rollup
+        - apply_retention
+        - close
+    """
+
+    def __init__(self, path='monitoringlog.db', batch_size=12, flush_interval=60,
+                 raw_days=7, bucket=300, rollup_days=365, retention_interval=3600):
+        """
+        transfer parameters:
+            path:               string, database file
+            batch_size:         int, number of frames collected before they are written
+            flush_interval:     float, maximum seconds between two writes
+            raw_days:           float, days the raw samples are kept before they are downsampled
+            bucket:             int, seconds per downsampled bucket
+            rollup_days:        float, days the downsampled buckets are kept (0: forever)
+            retention_interval: float, seconds between two retention runs
+        """
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.raw_days = raw_days
+        self.bucket = bucket
+        self.rollup_days = rollup_days
+        self.retention_interval = retention_interval
+
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._pending = []
+        self._pending_frames = 0
+        self._last_flush = time.monotonic()
+        # the first retention run waits one interval after the start
+        self._last_retention = time.monotonic()
+        # the writer thread and flush() must not write the same batch at the same time
+        self._write_lock = threading.Lock()
+
+        self._connect().executescript(SCHEMA)
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='HistoryWriter', daemon=True)
+        self._thread.start()
+
+    def _connect(self):
+        # sqlite connections must not be shared between threads, every thread gets its own
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def add(self, timestamp, values):
+        """
+        add(timestamp, values)
+            - adds the values of one frame to the pending batch (non-blocking)
+            - the writer thread writes the batch if batch_size frames are pending or flush_interval has passed
+        transfer parameters:
+            timestamp: float, unix time of the frame
+            values:    list, channel values, the list index is the channel number
+        """
+        with self._lock:
+            self._pending.extend((channel, timestamp, value) for channel, value in enumerate(values))
+            self._pending_frames += 1
+            due = self._pending_frames >= self.batch_size
+        if due:
+            self._wakeup.set()
+
+    def flush(self):
+        """
+        flush()
+            - writes all pending samples in one transaction on the calling thread
+        """
+        with self._write_lock:
+            with self._lock:
+                rows = self._pending
+                self._pending = []
+                self._pending_frames = 0
+                self._last_flush = time.monotonic()
+
+            if rows:
+                conn = self._connect()
+                with FLUSH_SECONDS.time(), conn:
+                    conn.executemany('INSERT OR REPLACE INTO samples VALUES (?, ?, ?)', rows)
+
+    def _run(self):
+        # writes the batches and runs the retention every retention_interval
+        while not self._stop.is_set():
+            self._wakeup.wait(max(self.flush_interval - (time.monotonic() - self._last_flush), 0.1))
+            self._wakeup.clear()
+            try:
+                self.flush()
+                if self.retention_interval and time.monotonic() - self._last_retention >= self.retention_interval:
+                    self._last_retention = time.monotonic()
+                    self.apply_retention()
+            except Exception as e:
+                # e.g. a locked or full database, the pending samples of the batch are lost
+                print("History writer failed: " + str(e))
+        try:
+            self.flush()
+        finally:
+            conn = getattr(self._local, 'conn', None)
+            if conn is not None:
+                conn.close()
+
+    def query(self, channel, start, end):
+        """
+        query(channel, start, end)
+            - returns the samples of a channel in a time range
+            - downsampled buckets are returned with their mean value where the raw samples are already removed
+        transfer parameters:
+            channel: int, channel number (index of VIAL_PARAMETERS)
+            start:   float, unix time, begin of the range
+            end:     float, unix time, end of the range
+        return parameter:
+            rows: list, (timestamp, value) tuples sorted by time
+        """
+        conn = self._connect()
+        # the buckets are always older than the raw samples, so both results can be joined in order
+        rows = conn.execute('SELECT ts, mean FROM rollup WHERE channel = ? AND ts BETWEEN ? AND ? ORDER BY ts',
+                            (channel, start, end)).fetchall()
+        rows += conn.execute('SELECT ts, value FROM samples WHERE channel = ? AND ts BETWEEN ? AND ? ORDER BY ts',
+                             (channel, start, end)).fetchall()
+        return rows
+
+    def query_rollup(self, channel, start, end):
+        """
+        query_rollup(channel, start, end)
+            - returns the downsampled buckets of a channel in a time range
+        transfer parameters:
+            channel: int, channel number
+            start:   float, unix time, begin of the range
+            end:     float, unix time, end of the range
+        return parameter:
+            rows: list, (timestamp, mean, min, max, count) tuples sorted by time
+        """
+        return self._connect().execute(
+            'SELECT ts, mean, min, max, count FROM rollup WHERE channel = ? AND ts BETWEEN ? AND ? ORDER BY ts',
+            (channel, start, end)).fetchall()
+
+    def apply_retention(self, now=None):
+        """
+        apply_retention(now=None)
+            - downsamples the raw samples older than raw_days into buckets of bucket seconds
+            - removes the downsampled raw samples and the buckets older than rollup_days
+        transfer parameters:
+            now: float, unix time used as reference (default: now)
+        """
+        if now is None:
+            now = time.time()
+        # only complete buckets are downsampled
+        cutoff = (now - self.raw_days * DAY) // self.bucket * self.bucket
+
+        conn = self._connect()
+        with conn:
+            # samples arriving late for an existing bucket are merged into it (count weighted mean)
+            conn.execute('INSERT INTO rollup '
+                         'SELECT channel, CAST(ts / :b AS INTEGER) * :b, avg(value), min(value), max(value), count(*) '
+                         'FROM samples WHERE ts < :cutoff GROUP BY channel, CAST(ts / :b AS INTEGER) '
+                         'ON CONFLICT (channel, ts) DO UPDATE SET '
+                         'mean = (rollup.mean * rollup.count + excluded.mean * excluded.count) '
+                         '/ (rollup.count + excluded.count), '
+                         'min = min(rollup.min, excluded.min), max = max(rollup.max, excluded.max), '
+                         'count = rollup.count + excluded.count',
+                         {'b': self.bucket, 'cutoff': cutoff})
+            conn.execute('DELETE FROM samples WHERE ts < ?', (cutoff,))
+            if self.rollup_days:
+                conn.execute('DELETE FROM rollup WHERE ts < ?', (now - self.rollup_days * DAY,))
+
+    def close(self):
+        """
+        close()
+            - stops the writer thread after the last batch and closes the connection of the calling thread
+        """
+        self._stop.set()
+        self._wakeup.set()
+        self._thread.join()
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
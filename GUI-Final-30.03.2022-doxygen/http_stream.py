@@ -0,0 +1,223 @@
+'''
+module name: http_stream.py
+
+info:
+    This module contains a small HTTP server for remote dashboards (asyncio, no additional packages):
+        GET /latest                                         newest frame as JSON
+        GET /stream                                         new frames as server-sent events (text/event-stream)
+        GET /history?channel=8&start=..&end=..&points=500   stored samples of a channel, decimated on the server
+                                                            (&method=minmax keeps the peaks, default lttb)
+    Every frame is encoded once and the same bytes are written to all viewers, so many viewers cost about
+    as much as one. Viewers which do not read their data fast enough are disconnected.
+'''
+
+import asyncio
+import json
+import threading
+import time
+from urllib.parse import urlsplit, parse_qs
+
+import telemetry
+
+""" bytes a viewer may have pending before it is disconnected """
+MAX_PENDING = 256 * 1024
+
+""" seconds between two keep-alive comments on idle streams """
+KEEPALIVE = 15
+
+""" default, minimum and maximum number of points returned by /history (the decimation needs at least 3) """
+DEFAULT_POINTS = 1000
+MIN_POINTS = 3
+MAX_POINTS = 10000
+
+REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed', 500: 'Internal Server Error'}
+
+
+class TelemetryServer:
+    """
+    class TelemetryServer streams the telemetry of the farmer process over HTTP
+        - publish
+        - start
+        - stop
+    attributes:
+        viewers: int, number of connected stream viewers
+        sent:    int, number of frames published
+        dropped: int, number of viewers disconnected because they were too slow
+    """
+
+    def __init__(self, history, host='127.0.0.1', port=8080):
+        """
+        transfer parameters:
+            history: function, history(channel, start, end, points, method) returning the decimated times and values
+                     (Visualization.get_history_points)
+            host:    string, address the server listens on ('0.0.0.0' for remote dashboards in the local network)
+            port:    int, tcp port
+        """
+        self.history = history
+        self.host = host
+        self.port = port
+        self.loop = None
+        self._server = None
+        self._thread = None
+        self._started = threading.Event()
+        self._streams = set()
+        self._latest = b'null'
+        self._seq = 0
+        self.sent = 0
+        self.dropped = 0
+
+    @property
+    def viewers(self):
+        return len(self._streams)
+
+    def publish(self, timestamp, values):
+        """
+        publish(timestamp, values)
+            - hands a new frame to the server (thread-safe, e.g. subscribed with Visualization.subscribe)
+        transfer parameters:
+            timestamp: float, unix time of the frame
+            values:    list, channel values
+        """
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self._broadcast, timestamp, list(values))
+
+    def _broadcast(self, timestamp, values):
+        self._seq += 1
+        self.sent += 1
+        self._latest = json.dumps({'seq': self._seq, 'timestamp': timestamp,
+                                   'channels': dict(zip(telemetry.CHANNEL_NAMES, values)),
+                                   'values': values}).encode()
+        # encoded once for all viewers
+        event = b'id: %d\nevent: frame\ndata: %s\n\n' % (self._seq, self._latest)
+        for writer in list(self._streams):
+            self._send(writer, event)
+
+    def _send(self, writer, data):
+        if writer.transport.get_write_buffer_size() > MAX_PENDING:
+            self.dropped += 1
+            self._streams.discard(writer)
+            writer.transport.abort()
+            return
+        writer.write(data)
+
+    def start(self):
+        """
+        start()
+            - starts the server on its own thread and waits until it listens
+        """
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='TelemetryServer', daemon=True)
+            self._thread.start()
+            self._started.wait()
+
+    def _run(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self._server = self.loop.run_until_complete(asyncio.start_server(self._handle, self.host, self.port))
+        self.port = self._server.sockets[0].getsockname()[1]
+        self.loop.call_later(KEEPALIVE, self._keepalive)
+        self._started.set()
+        try:
+            self.loop.run_forever()
+        finally:
+            self._server.close()
+            for writer in self._streams:
+                writer.transport.abort()
+            self.loop.run_until_complete(self._server.wait_closed())
+
+    def _keepalive(self):
+        # proxies and browsers close idle connections, a comment line keeps them open
+        for writer in list(self._streams):
+            self._send(writer, b': keep-alive\n\n')
+        self.loop.call_later(KEEPALIVE, self._keepalive)
+
+    def stop(self):
+        """
+        stop()
+            - closes all connections and stops the server
+        """
+        if self._thread is not None:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self._thread.join()
+            self._thread = None
+
+    async def _handle(self, reader, writer):
+        try:
+            head = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), 10)
+            method, target = head.split(b'\r\n', 1)[0].decode('latin-1').split(' ')[:2]
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, asyncio.TimeoutError, ValueError):
+            writer.close()
+            return
+
+        url = urlsplit(target)
+        if method != 'GET':
+            await self._respond(writer, 405, {'error': 'only GET is supported'})
+        elif url.path == '/latest':
+            await self._respond(writer, 200, self._latest)
+        elif url.path == '/stream':
+            await self._stream(reader, writer)
+        elif url.path == '/history':
+            await self._history(writer, parse_qs(url.query))
+        else:
+            await self._respond(writer, 404, {'error': 'unknown path', 'paths': ['/latest', '/stream', '/history']})
+
+    async def _stream(self, reader, writer):
+        writer.write(b'HTTP/1.1 200 OK\r\n'
+                     b'Content-Type: text/event-stream\r\n'
+                     b'Cache-Control: no-cache\r\n'
+                     b'Access-Control-Allow-Origin: *\r\n'
+                     b'Connection: keep-alive\r\n\r\n'
+                     b'retry: 2000\n\n')
+        self._streams.add(writer)
+        try:
+            # the frames are written by _broadcast, the viewer sends nothing until it disconnects
+            while await reader.read(1024):
+                pass
+        except ConnectionError:
+            pass
+        finally:
+            self._streams.discard(writer)
+            writer.close()
+
+    async def _history(self, writer, query):
+        try:
+            channel = int(query['channel'][0])
+            if not 0 <= channel < telemetry.FRAME_CHANNELS:
+                raise ValueError(f"channel must be between 0 and {telemetry.FRAME_CHANNELS - 1}")
+            end = float(query.get('end', [time.time()])[0])
+            start = float(query.get('start', [end - 86400])[0])
+            points = min(int(query.get('points', [DEFAULT_POINTS])[0]), MAX_POINTS)
+            if points < MIN_POINTS:
+                raise ValueError(f"points must be at least {MIN_POINTS}")
+            method = query.get('method', ['lttb'])[0]
+        except (KeyError, ValueError) as e:
+            await self._respond(writer, 400, {'error': f"invalid parameters: {e}"})
+            return
+
+        try:
+            # the database query runs on a worker thread, the loop keeps streaming
+            times, values = await self.loop.run_in_executor(None, self.history, channel, start, end, points, method)
+        except ValueError as e:
+            await self._respond(writer, 400, {'error': str(e)})
+            return
+        except Exception as e:
+            await self._respond(writer, 500, {'error': str(e)})
+            return
+        await self._respond(writer, 200, {'channel': channel, 'name': telemetry.CHANNEL_NAMES[channel],
+                                          'start': start, 'end': end, 'method': method,
+                                          'times': times.tolist(), 'values': values.tolist()})
+
+    async def _respond(self, writer, status, body):
+        if not isinstance(body, bytes):
+            body = json.dumps(body).encode()
+        writer.write(b'HTTP/1.1 %d %s\r\n'
+                     b'Content-Type: application/json\r\n'
+                     b'Content-Length: %d\r\n'
+                     b'Access-Control-Allow-Origin: *\r\n'
+                     b'Connection: close\r\n\r\n' % (status, REASONS[status].encode(), len(body)))
+        writer.write(body)
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass
+        writer.close()
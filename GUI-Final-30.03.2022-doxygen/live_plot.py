@@ -0,0 +1,341 @@
+'''
+module name: live_plot.py
+
+info:
+    This module contains the live plots of the user interface.
+    The lines of a plot are created once and only their data is updated afterwards.
+    As long as the new samples fit into the current axes limits, only the lines are redrawn
+    on top of a cached background (blitting). A full redraw is only needed when the axes limits change.
+    If no new sample has arrived since the last update, nothing is drawn at all.
+    A HistoryPlot shows the stored history (e.g. 24 hours, 7 days, 30 days) in the axes of a live plot.
+    The history is reduced to one point per pixel of the axes (decimate.py), so every range is drawn in about the same time.
+'''
+
+import time
+
+from matplotlib.ticker import FuncFormatter
+
+import metrics
+
+DRAW_SECONDS = metrics.histogram('farmer_gui_plot_draw_seconds', 'Redraw time of the live plots', ('kind',))
+
+
+""" shown time spans of the history view in seconds """
+SPANS = {'24h': 86400, '7d': 7 * 86400, '30d': 30 * 86400}
+
+
+def format_time(x, pos=None):
+    """
+    format_time(x, pos=None)
+        - formats a unix time as 'HH:MM:SS' for the x axis
+    transfer parameters:
+        x:   float, unix time
+        pos: int, tick position (unused, required by matplotlib)
+    return parameter:
+        label: string, formatted time
+    """
+    return time.strftime('%H:%M:%S', time.localtime(x))
+
+
+def format_date(x, pos=None):
+    """
+    format_date(x, pos=None)
+        - formats a unix time as 'DD.MM. HH:MM' for the x axis of the history view
+    transfer parameters:
+        x:   float, unix time
+        pos: int, tick position (unused, required by matplotlib)
+    return parameter:
+        label: string, formatted time
+    """
+    return time.strftime('%d.%m. %H:%M', time.localtime(x))
+
+
+class LivePlot:
+    """
+    class LivePlot draws one or more ring buffers into an axes and keeps them up to date
+        - attach
+        - update
+        - start
+        - pause
+        - resume
+    """
+
+    def __init__(self, figure, axes, series, ylim=None, xlabel='Time', ylabel='', headroom=1.0):
+        """
+        transfer parameters:
+            figure:   object, matplotlib figure
+            axes:     object, subplot of the figure
+            series:   list, (ringbuffer, label) tuples, one line per ring buffer
+            ylim:     tuple, fixed limits of the y axis, None scales the y axis with the data
+            xlabel:   string, label of the x axis
+            ylabel:   string, label of the y axis
+            headroom: float, free space added to the right of the x axis (in multiples of the shown time span),
+                      a larger value means fewer full redraws
+        """
+        self.figure = figure
+        self.axes = axes
+        self.buffers = [buffer for buffer, label in series]
+        self.ylim = ylim
+        self.headroom = headroom
+
+        self.lines = [axes.plot([], [], label=label, animated=True)[0] for buffer, label in series]
+        if ylim is not None:
+            axes.set_ylim(*ylim)
+        axes.set_xlabel(xlabel)
+        axes.set_ylabel(ylabel)
+        axes.xaxis.set_major_formatter(FuncFormatter(format_time))
+        axes.legend()
+
+        self.canvas = None
+        self.paused = False
+        self._background = None
+        self._versions = None
+
+    def attach(self, canvas):
+        """
+        attach(canvas)
+            - connects the plot to the canvas it is shown on
+            - the background is cached after every full redraw of the canvas (e.g. resize)
+        transfer parameters:
+            canvas: object, FigureCanvasTkAgg of the figure
+        """
+        self.canvas = canvas
+        canvas.mpl_connect('draw_event', self._on_draw)
+
+    def _on_draw(self, event):
+        self._background = self.canvas.copy_from_bbox(self.figure.bbox)
+        self._draw_lines()
+
+    def _draw_lines(self):
+        for line in self.lines:
+            self.axes.draw_artist(line)
+
+    def _rescale(self, force=False):
+        # returns True if the axes limits had to be changed
+        xs = [line.get_xdata() for line in self.lines if len(line.get_xdata())]
+        if not xs:
+            return False
+        x_min = min(x[0] for x in xs)
+        x_max = max(x[-1] for x in xs)
+        changed = False
+
+        left, right = self.axes.get_xlim()
+        if force or x_min < left or x_max > right:
+            span = max(x_max - x_min, 1.0)
+            self.axes.set_xlim(x_min, x_max + span * self.headroom)
+            changed = True
+
+        if self.ylim is None:
+            ys = [y for line in self.lines for y in line.get_ydata()]
+            bottom, top = self.axes.get_ylim()
+            y_min, y_max = min(ys), max(ys)
+            if force or y_min < bottom or y_max > top:
+                margin = max((y_max - y_min) * 0.1, 1.0)
+                self.axes.set_ylim(y_min - margin, y_max + margin)
+                changed = True
+
+        return changed
+
+    def update(self, i=None):
+        """
+        update(i=None)
+            - updates the lines with the current content of the ring buffers
+            - skips the redraw if no buffer has changed since the last update
+        transfer parameters:
+            i: int, frame number (unused, compatible with FuncAnimation)
+        return parameter:
+            drawn: boolean, True if the plot was redrawn
+        """
+        if self.canvas is None or self.paused:
+            return False
+
+        versions = [buffer.version for buffer in self.buffers]
+        if versions == self._versions:
+            return False
+        self._versions = versions
+
+        started = time.perf_counter()
+        for line, buffer in zip(self.lines, self.buffers):
+            line.set_data(*buffer.snapshot())
+
+        if self._rescale() or self._background is None:
+            # full redraw, the draw_event caches the new background and draws the lines
+            self.canvas.draw()
+            DRAW_SECONDS.labels('full').observe(time.perf_counter() - started)
+        else:
+            self.canvas.restore_region(self._background)
+            self._draw_lines()
+            self.canvas.blit(self.figure.bbox)
+            DRAW_SECONDS.labels('blit').observe(time.perf_counter() - started)
+        return True
+
+    def start(self, widget, interval):
+        """
+        start(widget, interval)
+            - updates the plot periodically using the tkinter event loop
+        transfer parameters:
+            widget:   object, tkinter widget providing the after() function
+            interval: int, milliseconds between two updates
+        """
+        def tick():
+            self.update()
+            widget.after(interval, tick)
+
+        widget.after(interval, tick)
+
+    def pause(self):
+        """
+        pause()
+            - stops the updates, the axes can be used by another view (e.g. the history)
+        """
+        self.paused = True
+
+    def resume(self):
+        """
+        resume()
+            - shows the ring buffers again, the axes limits are fitted to the buffered samples
+        """
+        self.paused = False
+        self.axes.xaxis.set_major_formatter(FuncFormatter(format_time))
+        for line, buffer in zip(self.lines, self.buffers):
+            line.set_data(*buffer.snapshot())
+        self._versions = [buffer.version for buffer in self.buffers]
+        self._rescale(force=True)
+        if self.canvas is not None:
+            self.canvas.draw()
+
+
+class HistoryPlot:
+    """
+    class HistoryPlot shows the stored history of the channels of a live plot with zoom and pan
+        - show
+        - zoom
+        - pan
+        - live
+        - fetch
+        - draw
+    attributes:
+        start, end: float, unix times of the shown range (None: the live data is shown)
+    """
+
+    def __init__(self, plot, channels, loader, executor=None, method='lttb'):
+        """
+        transfer parameters:
+            plot:     LivePlot, the plot whose axes and lines are used
+            channels: list, channel index of every line of the live plot (index of VIAL_PARAMETERS)
+            loader:   function, loader(index, start, end, points, method) returning the reduced times and values
+                      (Visualization.get_history_points)
+            executor: CommandExecutor, loads the history on a worker thread (None: the history is loaded directly)
+            method:   string, decimation method, 'lttb' or 'minmax'
+        """
+        self.plot = plot
+        self.channels = list(channels)
+        self.loader = loader
+        self.executor = executor
+        self.method = method
+        self.start = None
+        self.end = None
+        self._scroll = None
+
+    def show(self, span, end=None):
+        """
+        show(span, end=None)
+            - shows a time range of the history instead of the live data
+        transfer parameters:
+            span: float or string, length of the range in seconds or a key of SPANS ('24h', '7d', '30d')
+            end:  float, unix time, end of the range (default: now)
+        """
+        span = SPANS.get(span, span)
+        now = time.time()
+        end = min(now if end is None else end, now)
+        self.plot.pause()
+        self.start = end - span
+        self.end = end
+        if self._scroll is None and self.plot.canvas is not None:
+            self._scroll = self.plot.canvas.mpl_connect('scroll_event', self._on_scroll)
+
+        # one point per pixel of the axes
+        points = max(int(self.plot.axes.bbox.width), 10)
+        if self.executor is None:
+            self.draw(self.fetch(self.start, self.end, points))
+        else:
+            self.executor.submit('history', self.fetch, self.start, self.end, points, on_done=self.draw)
+
+    def fetch(self, start, end, points):
+        """
+        fetch(start, end, points)
+            - loads the reduced history of all channels (does not touch the figure, may run on a worker thread)
+        transfer parameters:
+            start:  float, unix time, begin of the range
+            end:    float, unix time, end of the range
+            points: int, maximum number of points per channel
+        return parameter:
+            view: tuple, (start, end, [(times, values) per channel])
+        """
+        return start, end, [self.loader(index, start, end, points, self.method) for index in self.channels]
+
+    def draw(self, view):
+        """
+        draw(view)
+            - draws a loaded history into the axes
+            - an outdated result (the range has changed while it was loaded) is ignored
+        transfer parameters:
+            view: tuple, result of fetch
+        """
+        start, end, data = view
+        if (start, end) != (self.start, self.end):
+            return
+        axes = self.plot.axes
+        for line, (times, values) in zip(self.plot.lines, data):
+            line.set_data(times, values)
+        axes.set_xlim(start, end)
+        axes.xaxis.set_major_formatter(FuncFormatter(format_time if end - start <= 86400 else format_date))
+        if self.plot.ylim is None:
+            ys = [y for times, values in data for y in values]
+            if ys:
+                margin = max((max(ys) - min(ys)) * 0.1, 1.0)
+                axes.set_ylim(min(ys) - margin, max(ys) + margin)
+        if self.plot.canvas is not None:
+            self.plot.canvas.draw()
+
+    def zoom(self, factor, center=None):
+        """
+        zoom(factor, center=None)
+            - changes the length of the shown range
+        transfer parameters:
+            factor: float, < 1 zooms in, > 1 zooms out
+            center: float, unix time kept at its position (default: middle of the range)
+        """
+        if self.start is None:
+            return
+        if center is None:
+            center = (self.start + self.end) / 2
+        span = max((self.end - self.start) * factor, 60)
+        # the point under the mouse stays at the same position
+        ratio = (center - self.start) / (self.end - self.start)
+        self.show(span, center + span * (1 - ratio))
+
+    def pan(self, fraction):
+        """
+        pan(fraction)
+            - moves the shown range
+        transfer parameters:
+            fraction: float, part of the range, < 0 moves back in time, > 0 moves forward
+        """
+        if self.start is None:
+            return
+        span = self.end - self.start
+        self.show(span, self.end + span * fraction)
+
+    def live(self):
+        """
+        live()
+            - returns to the live data of the ring buffers
+        """
+        self.start = None
+        self.end = None
+        self.plot.resume()
+
+    def _on_scroll(self, event):
+        if self.start is not None and event.inaxes is self.plot.axes:
+            self.zoom(0.8 if event.button == 'up' else 1.25, event.xdata)
@@ -0,0 +1,362 @@
+'''
+module name: metrics.py
+
+info:
+    This module contains the metrics of the farmer process (counters, gauges and histograms with fixed buckets).
+    The modules create their metrics once at import and update them in their hot paths
+    (an update takes well below a microsecond), e.g.
+        FRAMES = metrics.counter('farmer_frames_total', 'Processed monitoring frames')
+        FRAMES.inc()
+    Values which are already counted elsewhere (e.g. PWMService.transfers) are read when the metrics are
+    requested with set_function, so they cost nothing in between.
+    serve() publishes all metrics in the Prometheus text format on a local port (GET /metrics).
+'''
+
+import threading
+import time
+from bisect import bisect_left
+
+""" default buckets of the histograms in seconds, from 0.5 ms to 10 s """
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+class _Metric:
+    # common part of the metric types: name, help text and children per label value
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._labels = ()
+        self._children = {}
+        self._lock = threading.Lock()
+        self._function = None
+
+    def labels(self, *values):
+        """
+        labels(*values)
+            - returns the metric for one combination of label values (created on first use)
+        transfer parameters:
+            values: strings, one value per label name
+        return parameter:
+            metric: the metric of these label values
+        """
+        if len(values) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects the labels {', '.join(self.labelnames)}")
+        values = tuple(str(value) for value in values)
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.get(values)
+                if child is None:
+                    child = type(self)(self.name, self.documentation)
+                    child._labels = tuple(zip(self.labelnames, values))
+                    self._copy_settings(child)
+                    self._children[values] = child
+        return child
+
+    def _copy_settings(self, child):
+        pass
+
+    def set_function(self, function):
+        """
+        set_function(function)
+            - reads the value from a function when the metrics are requested (e.g. an existing counter attribute)
+        transfer parameters:
+            function: function, called without parameters, returns the current value
+        """
+        self._function = function
+
+    def _label_text(self, extra=()):
+        pairs = self._labels + tuple(extra)
+        if not pairs:
+            return ''
+        return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+    def _metrics(self):
+        return list(self._children.values()) if self.labelnames else [self]
+
+    def expose(self):
+        """
+        expose()
+            - returns the metric in the Prometheus text format
+        return parameter:
+            lines: list, text lines
+        """
+        lines = [f"# HELP {self.name} {_escape(self.documentation)}", f"# TYPE {self.name} {self.kind}"]
+        for metric in self._metrics():
+            lines += metric._samples()
+        return lines
+
+
+class Counter(_Metric):
+    """
+    class Counter counts events, the value only grows
+        - inc
+        - labels
+        - set_function
+    """
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        _Metric.__init__(self, name, documentation, labelnames)
+        self.value = 0
+
+    def inc(self, amount=1):
+        """
+        inc(amount=1)
+            - increases the counter
+        transfer parameters:
+            amount: number, increment (not negative)
+        """
+        with self._lock:
+            self.value += amount
+
+    def _samples(self):
+        value = self._function() if self._function is not None else self.value
+        return [f"{self.name}{self._label_text()} {_format(value)}"]
+
+
+class Gauge(Counter):
+    """
+    class Gauge contains a value which can rise and fall (queue length, duty cycle, ...)
+        - set
+        - inc
+        - dec
+        - labels
+        - set_function
+    """
+    kind = 'gauge'
+
+    def set(self, value):
+        """
+        set(value)
+            - sets the value
+        transfer parameters:
+            value: number, new value
+        """
+        self.value = value
+
+    def dec(self, amount=1):
+        """
+        dec(amount=1)
+            - decreases the value
+        transfer parameters:
+            amount: number, decrement
+        """
+        with self._lock:
+            self.value -= amount
+
+
+class Histogram(_Metric):
+    """
+    class Histogram counts observations (e.g. durations) in fixed buckets
+        - observe
+        - time
+        - labels
+    """
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        _Metric.__init__(self, name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def _copy_settings(self, child):
+        child.buckets = self.buckets
+        child._counts = [0] * (len(self.buckets) + 1)
+
+    def observe(self, value):
+        """
+        observe(value)
+            - adds an observation to its bucket
+        transfer parameters:
+            value: float, observed value (e.g. seconds)
+        """
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def time(self):
+        """
+        time()
+            - measures the duration of a with block, e.g. with HISTOGRAM.time(): ...
+        return parameter:
+            timer: object, context manager observing the duration in seconds
+        """
+        return _Timer(self)
+
+    def _samples(self):
+        with self._lock:
+            counts = list(self._counts)
+            total, count = self.sum, self.count
+        lines = []
+        cumulative = 0
+        for bound, bucket in zip(self.buckets + (float('inf'),), counts):
+            cumulative += bucket
+            lines.append(f"{self.name}_bucket{self._label_text((('le', _format(float(bound))),))} {cumulative}")
+        lines.append(f"{self.name}_sum{self._label_text()} {_format(total)}")
+        lines.append(f"{self.name}_count{self._label_text()} {count}")
+        return lines
+
+
+class _Timer:
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start)
+        return False
+
+
+class Registry:
+    """
+    class Registry contains all metrics of the process
+        - register
+        - expose
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        """
+        register(metric)
+            - adds a metric, an existing metric with the same name and type is returned instead
+        transfer parameters:
+            metric: Counter, Gauge or Histogram
+        return parameter:
+            metric: the registered metric
+        """
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                if type(existing) is not type(metric):
+                    raise ValueError(f"Metric {metric.name} is already registered as {existing.kind}")
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def expose(self):
+        """
+        expose()
+            - returns all metrics in the Prometheus text format
+        return parameter:
+            text: string, exposition text
+        """
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            try:
+                lines += metric.expose()
+            except Exception as e:
+                # a failing value function must not hide the other metrics
+                lines.append(f"# {metric.name} failed: {_escape(e)}")
+        return '\n'.join(lines) + '\n'
+
+
+""" registry of the farmer process """
+REGISTRY = Registry()
+
+
+def counter(name, documentation, labelnames=()):
+    """
+    counter(name, documentation, labelnames=())
+        - creates a counter in the registry of the process
+    transfer parameters:
+        name:          string, metric name (e.g. 'farmer_frames_total')
+        documentation: string, help text
+        labelnames:    tuple, names of the labels
+    return parameter:
+        counter: Counter
+    """
+    return REGISTRY.register(Counter(name, documentation, labelnames))
+
+
+def gauge(name, documentation, labelnames=()):
+    """
+    gauge(name, documentation, labelnames=())
+        - creates a gauge in the registry of the process
+    transfer parameters:
+        name:          string, metric name
+        documentation: string, help text
+        labelnames:    tuple, names of the labels
+    return parameter:
+        gauge: Gauge
+    """
+    return REGISTRY.register(Gauge(name, documentation, labelnames))
+
+
+def histogram(name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+    """
+    histogram(name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS)
+        - creates a histogram in the registry of the process
+    transfer parameters:
+        name:          string, metric name (e.g. 'farmer_save_data_seconds')
+        documentation: string, help text
+        labelnames:    tuple, names of the labels
+        buckets:       tuple, upper bounds of the buckets
+    return parameter:
+        histogram: Histogram
+    """
+    return REGISTRY.register(Histogram(name, documentation, labelnames, buckets))
+
+
+def serve(port, host='127.0.0.1', registry=REGISTRY):
+    """
+    serve(port, host='127.0.0.1', registry=REGISTRY)
+        - publishes the metrics in the Prometheus text format on http://host:port/metrics (own thread)
+    transfer parameters:
+        port:     int, tcp port
+        host:     string, address (localhost by default, the metrics are not meant for the network)
+        registry: Registry, published metrics
+    return parameter:
+        server: object, running http server (server.shutdown() stops it)
+    """
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+
+        def do_GET(self):
+            if self.path.split('?')[0] not in ('/', '/metrics'):
+                self.send_error(404)
+                return
+            body = registry.expose().encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            # scrapes every few seconds would fill the console
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='MetricsServer', daemon=True).start()
+    return server
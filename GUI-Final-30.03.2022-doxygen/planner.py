@@ -0,0 +1,195 @@
+'''
+module name: planner.py
+
+info:
+    This module contains the planner for the reorganization of the cultivation system.
+    A target layout (position -> species) is turned into an ordered list of relocations which can be
+    executed one after another by the robot (every move goes into a free position).
+    The travel of the robot is estimated with the step coordinates of the positions (STEP_TO_POS in RampsFinal.ino).
+    The plants are assigned to the target positions with the lowest total travel, cycles (e.g. swaps)
+    are resolved through the free position causing the least additional travel.
+'''
+
+""" step coordinates (x, y, z) of the 24 positions, copied from STEP_TO_POS in RampsFinal.ino """
+STEP_TO_POS = [(80, 2055, 2765),       # 0 - Stockwerk 1, Pos 1
+               (75, 1160, 2715),       # 1 - Stockwerk 1, Pos 2
+               (1030, 2010, 2750),     # 2
+               (1040, 1175, 2665),     # 3
+               (1970, 2045, 2710),     # 4
+               (1960, 1145, 2655),     # 5
+               (150, 2100, 5325),      # 6 - Stockwerk 2, Pos 1
+               (150, 1210, 5275),      # 7 - Stockwerk 2, Pos 2
+               (1035, 2090, 5290),     # 8
+               (1050, 1220, 5250),     # 9
+               (1990, 2080, 5300),     # 10
+               (2000, 1200, 5215),     # 11
+               (105, 2420, 7025),      # 12 - Anzucht
+               (105, 1910, 7000),      # 13
+               (105, 1455, 6965),      # 14
+               (105, 962, 6955),       # 15
+               (1110, 2435, 7012),     # 16
+               (1110, 1905, 6970),     # 17
+               (1110, 1450, 6930),     # 18
+               (1100, 965, 6915),      # 19
+               (2070, 2425, 6980),     # 20
+               (2080, 1935, 6930),     # 21
+               (2075, 1435, 6900),     # 22
+               (2065, 950, 6875)]      # 23
+
+"""
+    seconds per step of the axes (x and y: 2 * speed_x/speed_y, z: 4 * delaymicro, z and y step together)
+    z position of the robot after a relocation (home_protection_y) and z offset for placing a plant
+"""
+SECONDS_PER_STEP = (0.0012, 0.0012, 0.0015)
+HOME_Z = 100
+PLACE_OFFSET_Z = 400
+
+
+def move_cost(old, new):
+    """
+    move_cost(old, new)
+        - estimates the travel time of one relocation following the sequence of relocate() in RampsFinal.ino:
+            - from the home position to the initial position and back (home_x)
+            - to the target position (z + PLACE_OFFSET_Z) and back home
+        - the robot is homed after every relocation, so the cost does not depend on the previous move
+    transfer parameters:
+        old: int, initial position
+        new: int, target position
+    return parameter:
+        cost: float, estimated travel time in seconds
+    """
+    x_old, y_old, z_old = STEP_TO_POS[old]
+    x_new, y_new, z_new = STEP_TO_POS[new]
+    t_x, t_y, t_z = SECONDS_PER_STEP
+    z_steps = abs(z_old - HOME_Z) + abs(z_new + PLACE_OFFSET_Z - z_old)
+    return 2 * t_x * (x_old + x_new) + 2 * t_y * (y_old + y_new) + t_z * z_steps
+
+
+def plan_cost(moves):
+    """
+    plan_cost(moves)
+        - estimates the travel time of a list of relocations
+    transfer parameters:
+        moves: list, (old, new) tuples
+    return parameter:
+        cost: float, estimated travel time in seconds
+    """
+    return sum(move_cost(old, new) for old, new in moves)
+
+
+def _assign(sources, targets, cost):
+    # Hungarian algorithm (square cost matrix), returns the target index of every source
+    n = len(sources)
+    matrix = [[cost(s, t) for t in targets] for s in sources]
+    inf = float('inf')
+    u = [0.0] * (n + 1)
+    v = [0.0] * (n + 1)
+    match = [0] * (n + 1)
+    way = [0] * (n + 1)
+    for i in range(1, n + 1):
+        match[0] = i
+        j0 = 0
+        minv = [inf] * (n + 1)
+        used = [False] * (n + 1)
+        while True:
+            used[j0] = True
+            i0 = match[j0]
+            delta = inf
+            j1 = 0
+            for j in range(1, n + 1):
+                if not used[j]:
+                    cur = matrix[i0 - 1][j - 1] - u[i0] - v[j]
+                    if cur < minv[j]:
+                        minv[j] = cur
+                        way[j] = j0
+                    if minv[j] < delta:
+                        delta = minv[j]
+                        j1 = j
+            for j in range(n + 1):
+                if used[j]:
+                    u[match[j]] += delta
+                    v[j] -= delta
+                else:
+                    minv[j] -= delta
+            j0 = j1
+            if match[j0] == 0:
+                break
+        while j0:
+            j1 = way[j0]
+            match[j0] = match[j1]
+            j0 = j1
+    result = [0] * n
+    for j in range(1, n + 1):
+        result[match[j] - 1] = j - 1
+    return result
+
+
+def plan(current, target, cost=move_cost):
+    """
+    plan(current, target, cost=move_cost)
+        - calculates the relocations leading from the current to the target layout
+        - plants of the same species are interchangeable, they are assigned to the target positions with the lowest total cost
+        - positions missing in the target layout keep their plant, free ones can be used as buffer
+        - cycles are resolved by moving one plant to a free position first
+    transfer parameters:
+        current: dict, position -> species of the plant (None for a free position)
+        target:  dict, position -> species of the plant (None for a free position)
+        cost:    function, cost(old, new) of one relocation
+    return parameter:
+        moves: list, (old, new) tuples in the order of execution
+    """
+    current = {int(pos): species for pos, species in current.items()}
+    target = {int(pos): species for pos, species in target.items()}
+    unknown = [pos for pos in target if pos not in current]
+    if unknown:
+        raise ValueError(f"Unknown positions in the target layout: {unknown}")
+
+    # positions whose plant has to leave and positions which have to receive a plant, per species
+    sources = {}
+    sinks = {}
+    for pos, species in target.items():
+        if current[pos] == species:
+            continue
+        if current[pos] is not None:
+            sources.setdefault(current[pos], []).append(pos)
+        if species is not None:
+            sinks.setdefault(species, []).append(pos)
+
+    for species in set(sources) | set(sinks):
+        have, need = len(sources.get(species, [])), len(sinks.get(species, []))
+        if have != need:
+            raise ValueError(f"The target layout needs {need} plants of '{species}' at new positions, {have} are available")
+
+    destination = {}
+    for species, src in sources.items():
+        dst = sinks[species]
+        for i, j in enumerate(_assign(src, dst, cost)):
+            destination[src[i]] = dst[j]
+
+    layout = dict(current)
+    moves = []
+
+    def execute(old, new):
+        moves.append((old, new))
+        layout[new] = layout[old]
+        layout[old] = None
+
+    while destination:
+        # chains: move every plant whose destination is free
+        ready = [old for old, new in destination.items() if layout[new] is None]
+        if ready:
+            for old in sorted(ready, key=lambda old: cost(old, destination[old])):
+                if layout[destination[old]] is None:
+                    execute(old, destination.pop(old))
+            continue
+
+        # only cycles are left: park the plant with the cheapest detour in a free position
+        free = [pos for pos, species in layout.items() if species is None]
+        if not free:
+            raise ValueError("There is no free position to resolve the cycle of the target layout")
+        old, buffer = min(((old, buffer) for old in destination for buffer in free),
+                          key=lambda m: cost(m[0], m[1]) + cost(m[1], destination[m[0]]) - cost(m[0], destination[m[0]]))
+        execute(old, buffer)
+        destination[buffer] = destination.pop(old)
+
+    return moves
@@ -0,0 +1,220 @@
+'''
+module name: profiler.py
+
+info:
+    This module contains a sampling profiler which can be switched on and off in the running farmer process
+    (SIGUSR2 or the control interface, see farmer.py and control_api.py).
+    A background thread reads the current stack of every thread (sys._current_frames) at a fixed rate and
+    counts the identical stacks. Nothing is measured between two samples, so the program runs at its normal
+    speed also with a running profiler (about 1 % of one core at 100 samples per second).
+    The result is written in the collapsed stack format read by flame graph tools
+    (flamegraph.pl, speedscope, ...), one line per stack:
+        GuiThread;gui.py:gui;live_plot.py:update;backend_agg.py:draw 42
+    The first entry is the thread: the class name for the threads of farmer.py (GuiThread, ConsoleThread,
+    BackEndThread, MonitoringThread, ...), the thread name for all other threads.
+'''
+
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+""" default sampling interval in seconds and file of the collapsed stacks """
+DEFAULT_INTERVAL = 0.01
+DEFAULT_PATH = 'farmer.folded'
+
+
+def thread_label(thread):
+    """
+    thread_label(thread)
+        - returns the label of a thread in the collapsed stacks
+    transfer parameters:
+        thread: object, threading.Thread
+    return parameter:
+        label: string, class name of own thread classes (e.g. GuiThread), otherwise the thread name
+    """
+    cls = type(thread)
+    if cls.__module__ != 'threading':
+        label = cls.__name__
+    else:
+        label = thread.name
+    return label.replace(';', ':').replace(' ', '_')
+
+
+class Profiler:
+    """
+    class Profiler samples the stacks of all threads
+        - start
+        - stop
+        - toggle
+        - dump
+        - status
+    attributes:
+        running: boolean, the profiler is sampling
+        samples: int, number of samples taken since the start
+    """
+
+    def __init__(self, interval=DEFAULT_INTERVAL, path=DEFAULT_PATH, lines=False):
+        """
+        transfer parameters:
+            interval: float, seconds between two samples
+            path:     string, file of the collapsed stacks
+            lines:    boolean, the stack entries contain the line numbers (more detailed, larger files)
+        """
+        self.interval = interval
+        self.path = path
+        self.lines = lines
+        self.samples = 0
+        self.started = None
+        self.overhead = 0.0
+        self._stacks = Counter()
+        self._threads = Counter()
+        self._labels = {}
+        self._codes = {}
+        self._thread = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def running(self):
+        return self._thread is not None
+
+    def start(self, interval=None, path=None):
+        """
+        start(interval=None, path=None)
+            - starts sampling, the stacks of a previous run are discarded
+        transfer parameters:
+            interval: float, seconds between two samples (None: unchanged)
+            path:     string, file of the collapsed stacks (None: unchanged)
+        """
+        with self._lock:
+            if self._thread is not None:
+                return
+            if interval is not None:
+                self.interval = float(interval)
+            if path is not None:
+                self.path = path
+            self._stacks.clear()
+            self._threads.clear()
+            self.samples = 0
+            self.overhead = 0.0
+            self.started = time.time()
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='Profiler', daemon=True)
+            self._thread.start()
+        print(f"Profiler started ({1 / self.interval:.0f} samples per second)")
+
+    def stop(self):
+        """
+        stop()
+            - stops sampling and writes the collapsed stacks to the file
+        return parameter:
+            status: dict, see status()
+        """
+        with self._lock:
+            thread = self._thread
+            self._stop.set()
+        if thread is None:
+            return self.status()
+        thread.join()
+        with self._lock:
+            self._thread = None
+        self.dump()
+        print("Profiler stopped, stacks written to " + self.path)
+        return self.status()
+
+    def toggle(self):
+        """
+        toggle()
+            - starts the profiler if it is stopped, otherwise stops it (used for SIGUSR2)
+        """
+        if self.running:
+            self.stop()
+        else:
+            self.start()
+
+    def dump(self, path=None):
+        """
+        dump(path=None)
+            - writes the collapsed stacks sampled so far (also while the profiler is running)
+        transfer parameters:
+            path: string, file (None: the path of the profiler)
+        return parameter:
+            path: string, written file
+        """
+        path = path or self.path
+        with self._lock:
+            stacks = list(self._stacks.items())
+        tmp = path + '.tmp'
+        with open(tmp, 'w') as outfile:
+            outfile.writelines(';'.join(stack) + ' ' + str(count) + '\n' for stack, count in stacks)
+        os.replace(tmp, path)
+        return path
+
+    def status(self):
+        """
+        status()
+            - returns the state of the profiler
+        return parameter:
+            status: dict, running, interval, path, samples, duration, overhead (share of one core used by
+                    the sampling) and the number of samples per thread
+        """
+        with self._lock:
+            duration = time.time() - self.started if self.started else 0.0
+            return {'running': self.running, 'interval': self.interval, 'path': self.path,
+                    'samples': self.samples, 'duration': duration,
+                    'overhead': self.overhead / duration if duration else 0.0,
+                    'threads': dict(self._threads)}
+
+    def _label(self, ident):
+        label = self._labels.get(ident)
+        if label is None:
+            # new threads are looked up once, their label is cached by ident
+            for thread in threading.enumerate():
+                self._labels[thread.ident] = thread_label(thread)
+            label = self._labels.get(ident, str(ident))
+        return label
+
+    def _entry(self, frame):
+        code = frame.f_code
+        if self.lines:
+            return f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}"
+        entry = self._codes.get(code)
+        if entry is None:
+            entry = self._codes[code] = f"{os.path.basename(code.co_filename)}:{code.co_name}"
+        return entry
+
+    def _run(self):
+        own = threading.get_ident()
+        next_sample = time.monotonic()
+        while not self._stop.is_set():
+            started = time.perf_counter()
+            if self.samples % 1000 == 0:
+                # the ident of an ended thread may be reused by a new one
+                self._labels = {}
+            sampled = []
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(self._entry(frame))
+                    frame = frame.f_back
+                stack.append(self._label(ident))
+                stack.reverse()
+                sampled.append(tuple(stack))
+            with self._lock:
+                for stack in sampled:
+                    self._stacks[stack] += 1
+                    self._threads[stack[0]] += 1
+                self.samples += 1
+                self.overhead += time.perf_counter() - started
+
+            # fixed rate, a late sample does not shift the following ones
+            next_sample += self.interval
+            delay = next_sample - time.monotonic()
+            if delay < 0:
+                next_sample = time.monotonic()
+                delay = 0
+            self._stop.wait(delay)
@@ -0,0 +1,326 @@
+#!/usr/bin/python3
+
+'''
+module name: replay.py
+
+info:
+    This module contains the replay of recorded monitoring data through the live pipeline.
+    Sources:
+        - monitoringlog.csv written by the former save_log_file ("%m/%d/%Y; %H:%M:%S" and 9 values per row,
+          the second humidity was not logged and is replayed with the value of the first one)
+        - raw dumps of the monitoring port (binary telemetry frames, e.g. cat /dev/ttyACM0 > dump.bin), decoded
+          with telemetry.FrameDecoder like get_vial_parameters does, one frame every 5 s
+        - serial captures of farmer.py --capture (capture.py), decoded the same way with the recorded times
+    Every frame is handed to Visualization.process_frame with its recorded timestamp, so the live plots,
+    the history, the drift detection, the dosing and the telemetry stream see the same frames as in operation.
+    The replay runs in real time (speed 1), N times faster (speed N) or as fast as possible (speed 0),
+    e.g. a week of frames is replayed in a few seconds:
+
+        python replay.py monitoringlog.csv --speed 0
+
+    By default the command line replay runs in a temporary directory, so the monitoring history of the
+    farm is not changed. farmer.py --replay FILE replays a file instead of reading the monitoring port.
+'''
+
+import argparse
+import csv
+import os
+import shutil
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+import farmlog
+import telemetry
+
+""" time format and channel indices of the columns of the former monitoringlog.csv """
+CSV_TIME_FORMAT = '%m/%d/%Y; %H:%M:%S'
+CSV_CHANNELS = (0, 1, 2, 3, 4, 5, 7, 8, 9)
+CSV_HEADER = ["date; time", "air temperature", "water temperature", "level tank", "level 1", "level 2",
+              "humidity", "pH voltage", "pH", "tds"]
+
+""" time between two frames of Monitoring.ino, used for raw dumps without timestamps """
+CYCLE_TIME = 5.0
+
+REPLAY_LOG = farmlog.get('replay')
+
+
+def read_csv(path):
+    """
+    read_csv(path)
+        - reads the frames of a monitoringlog.csv file one after another (also files of several GB)
+        - rows which can not be read (header, cut off last row, ...) are skipped and logged
+    transfer parameters:
+        path: string, csv file
+    return parameter:
+        frames: iterator, (timestamp, values) with FRAME_CHANNELS values per frame
+    """
+    hours = {}
+    with open(path, newline='') as infile:
+        for number, row in enumerate(csv.reader(infile), 1):
+            try:
+                # strptime takes most of the time of a row, the start of an hour is parsed once per hour
+                start = hours.get(row[0][:14])
+                if start is None:
+                    start = hours[row[0][:14]] = time.mktime(datetime.strptime(row[0][:14], '%m/%d/%Y; %H').timetuple())
+                    if len(hours) > 48:
+                        hours.clear()
+                minutes, seconds = row[0][15:].split(':')
+                timestamp = start + int(minutes) * 60 + int(seconds)
+                measured = [float(value) for value in row[1:len(CSV_CHANNELS) + 1]]
+            except (ValueError, IndexError):
+                if number > 1:
+                    REPLAY_LOG.warning("Row skipped", path=path, row=number)
+                continue
+            if len(measured) != len(CSV_CHANNELS):
+                REPLAY_LOG.warning("Row skipped", path=path, row=number)
+                continue
+            values = [0.0] * telemetry.FRAME_CHANNELS
+            for channel, value in zip(CSV_CHANNELS, measured):
+                values[channel] = value
+            values[6] = values[5]
+            yield timestamp, values
+
+
+def write_csv(path, frames):
+    """
+    write_csv(path, frames)
+        - writes frames in the format of the former monitoringlog.csv (e.g. a generated workload for the benchmark)
+    transfer parameters:
+        path:   string, csv file
+        frames: iterable, (timestamp, values) with FRAME_CHANNELS values per frame
+    return parameter:
+        count: int, number of written frames
+    """
+    count = 0
+    with open(path, 'w', newline='') as outfile:
+        writer = csv.writer(outfile, delimiter=',', quotechar='"', quoting=csv.QUOTE_MINIMAL)
+        writer.writerow(CSV_HEADER)
+        for timestamp, values in frames:
+            writer.writerow([time.strftime(CSV_TIME_FORMAT, time.localtime(timestamp))]
+                            + [round(values[channel], 2) for channel in CSV_CHANNELS])
+            count += 1
+    return count
+
+
+def read_frames(path, interval=CYCLE_TIME, start=None, chunk_size=65536):
+    """
+    read_frames(path, interval=CYCLE_TIME, start=None, chunk_size=65536)
+        - decodes a raw dump of the monitoring port, corrupt data is skipped like on the live port
+    transfer parameters:
+        path:       string, dump file
+        interval:   float, seconds between two frames (the dump contains no time)
+        start:      float, unix time of the first frame (None: the frames end at the modification time of the file)
+        chunk_size: int, bytes read at once
+    return parameter:
+        frames: iterator, (timestamp, values)
+    """
+    if start is None:
+        start = os.path.getmtime(path) - os.path.getsize(path) / telemetry.FRAME_SIZE * interval
+    decoder = telemetry.FrameDecoder()
+    count = 0
+    with open(path, 'rb') as infile:
+        while True:
+            chunk = infile.read(chunk_size)
+            if not chunk:
+                break
+            for frame in decoder.feed(chunk):
+                yield start + count * interval, list(frame.values)
+                count += 1
+    if decoder.corrupt or decoder.skipped:
+        REPLAY_LOG.warning("Corrupt data skipped", path=path, corrupt=decoder.corrupt, skipped=decoder.skipped)
+
+
+def read_capture(path, port='monitor', start=None, end=None):
+    """
+    read_capture(path, port='monitor', start=None, end=None)
+        - decodes the monitoring port of a serial capture, a frame gets the time of the chunk completing it
+    transfer parameters:
+        path:  string, capture file (capture.py)
+        port:  string, name of the monitoring port in the capture (the id of the device with --devices)
+        start: float, unix time of the first frame (None: start of the capture), found with the index of the capture
+        end:   float, unix time after the last frame (None: end of the capture)
+    return parameter:
+        frames: iterator, (timestamp, values)
+    """
+    import capture
+    
+    recording = capture.Capture(path)
+    decoder = telemetry.FrameDecoder()
+    try:
+        for timestamp, record_port, data in recording.records(start, end, port):
+            for frame in decoder.feed(data):
+                yield timestamp, list(frame.values)
+    finally:
+        recording.close()
+
+
+def open_source(path, port='monitor'):
+    """
+    open_source(path, port='monitor')
+        - returns the frames of a recorded file depending on its type
+    transfer parameters:
+        path: string, monitoringlog.csv, serial capture or raw dump of the monitoring port
+        port: string, monitoring port of a serial capture
+    return parameter:
+        frames: iterator, (timestamp, values)
+    """
+    if path.lower().endswith('.csv'):
+        return read_csv(path)
+    with open(path, 'rb') as infile:
+        magic = infile.read(4)
+    if magic == b'FCAP':
+        return read_capture(path, port)
+    return read_frames(path)
+
+
+class Replay:
+    """
+    class Replay hands recorded frames to the processing of the monitoring frames at the recorded pace
+        - run
+        - start
+        - stop
+        - status
+    attributes:
+        frames: int, number of replayed frames
+        lag:    float, largest delay of a frame behind its due time in seconds (speed > 0)
+    """
+
+    def __init__(self, source, speed=1.0, sink=None, shift=False, max_gap=60.0):
+        """
+        transfer parameters:
+            source:  iterable, (timestamp, values) frames sorted by time (e.g. open_source(path))
+            speed:   float, factor of the recorded pace (1: real time), 0: as fast as possible
+            sink:    function, called as sink(values, timestamp) (None: backend.Visualization.process_frame)
+            shift:   boolean, the timestamps are moved so the first frame has the time of the start of the replay
+            max_gap: float, recorded pauses longer than max_gap seconds (program not running) are shortened to max_gap
+        """
+        self.source = source
+        self.speed = speed
+        self.sink = sink
+        self.shift = shift
+        self.max_gap = max_gap
+        self.frames = 0
+        self.lag = 0.0
+        self.position = None
+        self.started = None
+        self.finished = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def run(self):
+        """
+        run()
+            - replays all frames of the source on the calling thread (returns when the source is finished or stopped)
+        return parameter:
+            status: dict, see status()
+        """
+        sink = self.sink
+        if sink is None:
+            import backend
+            sink = backend.Visualization.process_frame
+        self.started = time.monotonic()
+        offset = time.time() if self.shift else None
+        first = last = None
+        elapsed = 0.0
+        for timestamp, values in self.source:
+            if self._stop.is_set():
+                break
+            if first is None:
+                first = last = timestamp
+                if offset is not None:
+                    offset -= timestamp
+            # recorded time without the long pauses
+            elapsed += min(max(timestamp - last, 0.0), self.max_gap)
+            last = timestamp
+            if self.speed:
+                delay = self.started + elapsed / self.speed - time.monotonic()
+                if delay > 0:
+                    if self._stop.wait(delay):
+                        break
+                else:
+                    self.lag = max(self.lag, -delay)
+            if offset is not None:
+                timestamp += offset
+            sink(values, timestamp)
+            self.frames += 1
+            self.position = timestamp
+        self.finished = time.monotonic()
+        status = self.status()
+        REPLAY_LOG.info("Replay finished", frames=self.frames, seconds=round(status['duration'], 2),
+                        fps=round(status['fps'], 1))
+        return status
+
+    def start(self):
+        """
+        start()
+            - replays the frames on its own thread
+        """
+        if self._thread is None:
+            self._thread = threading.Thread(target=self.run, name='Replay', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """
+        stop()
+            - stops the replay after the current frame
+        """
+        self._stop.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+
+    def status(self):
+        """
+        status()
+            - returns the progress of the replay
+        return parameter:
+            status: dict, frames, position (timestamp of the last frame), duration, fps (frames per second)
+                    and lag (seconds behind the recorded pace)
+        """
+        if self.started is None:
+            duration = 0.0
+        else:
+            duration = (self.finished or time.monotonic()) - self.started
+        return {'frames': self.frames, 'position': self.position, 'duration': duration,
+                'fps': self.frames / duration if duration else 0.0, 'lag': self.lag}
+
+
+def main(argv=None):
+    """
+    main(argv=None)
+        - replays a recorded file through the processing of the backend and prints the throughput
+    transfer parameters:
+        argv: list, command line arguments (default: sys.argv[1:])
+    """
+    parser = argparse.ArgumentParser(description='Replay recorded monitoring data through the backend')
+    parser.add_argument('file', help='monitoringlog.csv, serial capture or raw dump of the monitoring port')
+    parser.add_argument('--port', default='monitor', help='monitoring port of a serial capture')
+    parser.add_argument('--speed', type=float, default=0.0, help='factor of the recorded pace (1: real time, 0: as fast as possible)')
+    parser.add_argument('--shift', action='store_true', help='move the frames to the current time')
+    parser.add_argument('--workdir', default=None, help='directory of the history database (default: a temporary directory)')
+    parser.add_argument('--no-analytics', action='store_true', help='do not run the drift detection')
+    args = parser.parse_args(argv)
+
+    # the skipped rows and the drift messages are only shown on the console
+    farmlog.configure(None)
+    source = open_source(os.path.abspath(args.file), args.port)
+    workdir = args.workdir or tempfile.mkdtemp(prefix='farmer-replay-')
+    previous = os.getcwd()
+    os.chdir(workdir)
+    try:
+        import backend
+        if not args.no_analytics:
+            backend.hw.get('analytics')
+        status = Replay(source, args.speed, shift=args.shift).run()
+        backend.hw.close()
+    finally:
+        os.chdir(previous)
+        if args.workdir is None:
+            shutil.rmtree(workdir, ignore_errors=True)
+    farmlog.close()
+    print(f"{status['frames']} frames in {status['duration']:.2f} s ({status['fps']:.0f} frames per second)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+'''
+module name: ringbuffer.py
+
+info:
+    This module contains a fixed-capacity ring buffer for time series.
+    The monitoring thread appends the measured values, the live plots read them directly from memory.
+'''
+
+import threading
+from array import array
+
+
+def _capacity(capacity):
+    # at least one sample, append computes the next position modulo the capacity
+    capacity = int(capacity)
+    if capacity < 1:
+        raise ValueError(f"The capacity must be at least 1 (got {capacity})")
+    return capacity
+
+
+class RingBuffer:
+    """
+    class RingBuffer stores the last samples of one channel as float64 timestamps and values
+        - append
+        - snapshot
+        - latest
+        - resize
+        - clear
+    attributes:
+        capacity: int, maximum number of samples
+        version:  int, incremented with every append (readers can skip unchanged buffers)
+    """
+
+    def __init__(self, capacity):
+        self.capacity = _capacity(capacity)
+        self._times = array('d', bytes(8 * self.capacity))
+        self._values = array('d', bytes(8 * self.capacity))
+        self._head = 0
+        self._count = 0
+        self.version = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self._count
+
+    def append(self, timestamp, value):
+        """
+        append(timestamp, value)
+            - stores one sample, the oldest sample is overwritten if the buffer is full
+        transfer parameters:
+            timestamp: float, unix time of the sample
+            value:     float, measured value
+        """
+        with self._lock:
+            self._times[self._head] = timestamp
+            self._values[self._head] = value
+            self._head = (self._head + 1) % self.capacity
+            if self._count < self.capacity:
+                self._count += 1
+            self.version += 1
+
+    def snapshot(self):
+        """
+        snapshot()
+            - returns a copy of the stored samples, oldest first
+        return parameter:
+            times:  array, float64 timestamps
+            values: array, float64 values
+        """
+        with self._lock:
+            if self._count < self.capacity:
+                return self._times[:self._count], self._values[:self._count]
+            head = self._head
+            return (self._times[head:] + self._times[:head],
+                    self._values[head:] + self._values[:head])
+
+    def latest(self):
+        """
+        latest()
+            - returns the newest sample
+        return parameter:
+            sample: tuple, (timestamp, value) or None if the buffer is empty
+        """
+        with self._lock:
+            if self._count == 0:
+                return None
+            i = (self._head - 1) % self.capacity
+            return self._times[i], self._values[i]
+
+    def resize(self, capacity):
+        """
+        resize(capacity)
+            - changes the capacity, the newest samples are kept
+            - raises ValueError if the capacity is smaller than 1
+        transfer parameters:
+            capacity: int, new maximum number of samples
+        """
+        capacity = _capacity(capacity)
+        times, values = self.snapshot()
+        with self._lock:
+            self.capacity = capacity
+            keep = min(len(times), self.capacity)
+            self._times = array('d', bytes(8 * self.capacity))
+            self._values = array('d', bytes(8 * self.capacity))
+            self._times[:keep] = times[len(times) - keep:]
+            self._values[:keep] = values[len(values) - keep:]
+            self._count = keep
+            self._head = keep % self.capacity
+            self.version += 1
+
+    def clear(self):
+        """
+        clear()
+            - removes all samples
+        """
+        with self._lock:
+            self._head = 0
+            self._count = 0
+            self.version += 1
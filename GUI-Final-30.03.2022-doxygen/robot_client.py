@@ -0,0 +1,290 @@
+'''
+module name: robot_client.py
+
+info:
+    This module contains the client for the robot arduino (RampsFinal.ino).
+    Relocation jobs are queued and sent to the robot one at a time. After sending the 'oldTnew' command
+    the client waits for the reply of the robot: 'Success' ends the job, a 'Something failed' line
+    before it marks the job as failed. The booking is only changed if the relocation was successful.
+'''
+
+import itertools
+import queue
+import threading
+import time
+from collections import OrderedDict
+
+import metrics
+import serial_reader
+
+JOBS = metrics.counter('farmer_robot_jobs_total', 'Finished relocation jobs', ('status',))
+JOB_SECONDS = metrics.histogram('farmer_robot_job_seconds', 'Duration of a relocation from the first command to the answer',
+                                buckets=(1, 2, 5, 10, 20, 30, 45, 60, 90, 120, 180, 300))
+
+""" number of finished jobs kept for status requests """
+JOB_HISTORY = 500
+
+
+class Job:
+    """
+    class Job contains one relocation
+    attributes:
+        id:        int, job number
+        old:       int, initial position
+        new:       int, target position
+        status:    string, 'queued', 'running', 'done', 'failed', 'timeout' or 'rejected'
+        message:   string, reason for failed or rejected jobs
+        submitted: float, unix time of the submission
+        started:   float, unix time the command was sent (None before)
+        finished:  float, unix time the job ended (None before)
+    """
+
+    __slots__ = ('id', 'old', 'new', 'status', 'message', 'submitted', 'started', 'finished', '_done')
+
+    def __init__(self, id, old, new):
+        self.id = id
+        self.old = int(old)
+        self.new = int(new)
+        self.status = 'queued'
+        self.message = None
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+        self._done = threading.Event()
+
+    def __repr__(self):
+        return f"Job({self.id}, {self.old}T{self.new}, {self.status})"
+
+    def wait(self, timeout=None):
+        """
+        wait(timeout=None)
+            - waits until the job has ended
+        transfer parameters:
+            timeout: float, maximum seconds to wait
+        return parameter:
+            finished: boolean, False if the timeout was reached
+        """
+        return self._done.wait(timeout)
+
+    def to_dict(self):
+        """
+        to_dict()
+            - returns the job as a dict (e.g. for status requests)
+        return parameter:
+            job: dict, all attributes of the job
+        """
+        return {'id': self.id, 'old': self.old, 'new': self.new, 'status': self.status,
+                'message': self.message, 'submitted': self.submitted,
+                'started': self.started, 'finished': self.finished}
+
+
+class RobotClient:
+    """
+    class RobotClient owns the serial port of the robot and executes the relocation jobs
+        - start
+        - submit
+        - submit_many
+        - get_job
+        - stats
+        - stop
+    attributes:
+        reader: SerialLineReader, distributes the lines of the robot (run it on a thread, e.g. read_serial)
+    """
+
+    def __init__(self, port, table, timeout=180):
+        """
+        transfer parameters:
+            port:    object, serial port of the robot
+            table:   PositionTable, booking table (checked before and changed after a relocation)
+            timeout: float, seconds to wait for the reply of the robot
+        """
+        self.port = port
+        self.table = table
+        self.timeout = timeout
+        self.reader = serial_reader.SerialLineReader(port, 'robot')
+        self.reader.subscribe(self._on_line)
+
+        self.jobs = OrderedDict()
+        self._queue = queue.Queue()
+        self._replies = queue.Queue()
+        self._current = None
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._thread = None
+
+        self.done = 0
+        self.failed = 0
+        self.busy_time = 0.0
+
+    def start(self):
+        """
+        start()
+            - starts the thread executing the jobs
+        """
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='RobotClient', daemon=True)
+            self._thread.start()
+
+    def submit(self, old, new):
+        """
+        submit(old, new)
+            - queues a relocation, the booking is checked when the job is executed
+        transfer parameters:
+            old: int, initial position
+            new: int, target position
+        return parameter:
+            job: Job, the queued job
+        """
+        job = Job(next(self._ids), old, new)
+        with self._lock:
+            self.jobs[job.id] = job
+            while len(self.jobs) > JOB_HISTORY:
+                oldest = next(iter(self.jobs.values()))
+                if oldest.finished is None:
+                    break
+                self.jobs.popitem(last=False)
+        self._queue.put(job)
+        return job
+
+    def submit_many(self, moves):
+        """
+        submit_many(moves)
+            - queues several relocations, they are executed in the given order
+        transfer parameters:
+            moves: list, (old, new) tuples
+        return parameter:
+            jobs: list, the queued jobs
+        """
+        return [self.submit(old, new) for old, new in moves]
+
+    def get_job(self, job_id):
+        """
+        get_job(job_id)
+            - returns a job by its number
+        transfer parameters:
+            job_id: int, job number
+        return parameter:
+            job: Job or None if the job is unknown
+        """
+        return self.jobs.get(int(job_id))
+
+    def stats(self):
+        """
+        stats()
+            - returns the state of the job queue
+        return parameter:
+            stats: dict, number of queued, done and failed jobs, average duration and throughput (jobs per hour)
+        """
+        finished = self.done + self.failed
+        return {'queued': self._queue.qsize(),
+                'running': self._current.to_dict() if self._current is not None else None,
+                'done': self.done,
+                'failed': self.failed,
+                'avg_duration': self.busy_time / finished if finished else None,
+                'jobs_per_hour': 3600 * self.done / self.busy_time if self.busy_time else None}
+
+    def stop(self):
+        """
+        stop()
+            - stops the job thread after the current job (queued jobs stay queued)
+        """
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def _on_line(self, line):
+        # called on the reader thread, only lines received during a job are relevant
+        if self._current is not None:
+            self._replies.put(line)
+
+    def _finish(self, job, status, message=None):
+        job.status = status
+        job.message = message
+        job.finished = time.time()
+        if job.started is not None:
+            self.busy_time += job.finished - job.started
+            JOB_SECONDS.observe(job.finished - job.started)
+        JOBS.labels(status).inc()
+        if status == 'done':
+            self.done += 1
+        else:
+            self.failed += 1
+        job._done.set()
+        print(f"Relocation {job.old} -> {job.new}: {status}" + (f" ({message})" if message else ""))
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            try:
+                self._execute(job)
+            except Exception as e:
+                self._finish(job, 'failed', str(e))
+
+    def _check(self, job):
+        # returns the reason why the job cannot be executed with the current booking (None if it can)
+        source = self.table.get(job.old)
+        target = self.table.get(job.new)
+        if source is None or target is None:
+            return "unknown position"
+        if not source.booked:
+            return f"position {job.old} currently has no plant"
+        if target.booked:
+            return f"there is currently a plant in position {job.new}"
+        return None
+
+    def _begin(self, job):
+        # checks the job and marks it as running, returns False if it was rejected
+        # (shared with aio_devices.AsyncRobotClient, self._replies only needs empty() and get_nowait())
+        reason = self._check(job)
+        if reason is not None:
+            self._finish(job, 'rejected', reason)
+            return False
+
+        while not self._replies.empty():
+            self._replies.get_nowait()
+
+        job.status = 'running'
+        job.started = time.time()
+        self._current = job
+        return True
+
+    def _reply(self, job, line):
+        # handles a reply of the robot, returns True when the robot has finished the relocation
+        if line.startswith("Something failed"):
+            job.message = line
+        elif line == "Success":
+            return True
+        return False
+
+    def _complete(self, job):
+        # books the relocation after the final reply, unless the robot reported a failure
+        if job.message is not None:
+            return self._finish(job, 'failed', job.message)
+        self.table.move(job.old, job.new)
+        self._finish(job, 'done')
+
+    def _execute(self, job):
+        if not self._begin(job):
+            return
+        try:
+            self.port.write(f"{job.old}T{job.new}\n".encode())
+            self.port.flush()
+
+            deadline = time.monotonic() + self.timeout
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return self._finish(job, 'timeout', f"no reply within {self.timeout} s")
+                try:
+                    line = self._replies.get(timeout=remaining)
+                except queue.Empty:
+                    continue
+                if self._reply(job, line):
+                    break
+        finally:
+            self._current = None
+
+        self._complete(job)
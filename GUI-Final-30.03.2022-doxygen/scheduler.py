@@ -0,0 +1,245 @@
+'''
+module name: scheduler.py
+
+info:
+    This module contains a timer scheduler for time switched actions such as the lights.
+    All schedules are kept in a heap sorted by their next deadline. The scheduler thread sleeps
+    until the earliest deadline instead of polling the clock every second.
+    Deadlines which were missed during a stall are executed as soon as the thread runs again
+    (once per schedule, in the order of their deadlines).
+'''
+
+import heapq
+import itertools
+import threading
+import time
+from datetime import datetime, timedelta
+
+import metrics
+
+LAG_SECONDS = metrics.histogram('farmer_scheduler_lag_seconds', 'Delay of scheduled actions behind their deadline')
+ACTION_SECONDS = metrics.histogram('farmer_scheduler_action_seconds', 'Duration of scheduled actions', ('job',))
+
+""" longest time the scheduler sleeps without looking at the clock (handles clock jumps, e.g. NTP after boot) """
+MAX_SLEEP = 60
+
+
+def next_daily(after, hour, minute, second=0):
+    """
+    next_daily(after, hour, minute, second=0)
+        - returns the next point in time with the given local time of day
+    transfer parameters:
+        after:  float, unix time, the result is later than this time
+        hour:   int, hour of the day
+        minute: int, minute
+        second: int, second
+    return parameter:
+        deadline: float, unix time
+    """
+    start = datetime.fromtimestamp(after)
+    deadline = start.replace(hour=int(hour), minute=int(minute), second=int(second), microsecond=0)
+    if deadline <= start:
+        deadline += timedelta(days=1)
+    return deadline.timestamp()
+
+
+class Job:
+    """
+    class Job contains one scheduled action
+    attributes:
+        name:      string, unique name of the schedule (a new schedule with the same name replaces it)
+        action:    function, called without parameters
+        deadline:  float, unix time of the next execution
+        repeat:    function, returns the next deadline after a given time (None for a single execution)
+        cancelled: boolean, True if the job was cancelled or replaced
+    """
+
+    __slots__ = ('name', 'action', 'deadline', 'repeat', 'cancelled')
+
+    def __init__(self, name, action, deadline, repeat=None):
+        self.name = name
+        self.action = action
+        self.deadline = deadline
+        self.repeat = repeat
+        self.cancelled = False
+
+
+class Scheduler:
+    """
+    class Scheduler executes actions at their deadlines
+        - schedule_at
+        - schedule_every
+        - schedule_daily
+        - cancel
+        - next_deadline
+        - run_pending
+        - run
+        - stop
+    attributes:
+        executed: int, number of executed actions
+        late:     int, number of actions executed more than one second after their deadline
+        max_lag:  float, largest delay between deadline and execution in seconds
+    """
+
+    def __init__(self, clock=time.time):
+        self.clock = clock
+        self._heap = []
+        self._jobs = {}
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._running = False
+        self.executed = 0
+        self.late = 0
+        self.max_lag = 0.0
+
+    def _add(self, job):
+        with self._cond:
+            old = self._jobs.get(job.name)
+            if old is not None:
+                old.cancelled = True
+            self._jobs[job.name] = job
+            heapq.heappush(self._heap, (job.deadline, next(self._seq), job))
+            self._cond.notify()
+        return job
+
+    def schedule_at(self, name, deadline, action):
+        """
+        schedule_at(name, deadline, action)
+            - executes an action once at the given time
+        transfer parameters:
+            name:     string, unique name of the schedule
+            deadline: float, unix time
+            action:   function, called without parameters
+        return parameter:
+            job: Job, the scheduled job
+        """
+        return self._add(Job(name, action, deadline))
+
+    def schedule_every(self, name, interval, action):
+        """
+        schedule_every(name, interval, action)
+            - executes an action periodically, the first time after one interval
+        transfer parameters:
+            name:     string, unique name of the schedule
+            interval: float, seconds between two executions
+            action:   function, called without parameters
+        return parameter:
+            job: Job, the scheduled job
+        """
+        first = self.clock() + interval
+
+        def repeat(now, deadline):
+            # skip the periods missed during a stall, but keep the phase
+            missed = int((now - deadline) // interval) + 1
+            return deadline + missed * interval
+
+        return self._add(Job(name, action, first, repeat))
+
+    def schedule_daily(self, name, hour, minute, action, second=0):
+        """
+        schedule_daily(name, hour, minute, action, second=0)
+            - executes an action every day at the given local time
+        transfer parameters:
+            name:   string, unique name of the schedule
+            hour:   int, hour of the day
+            minute: int, minute
+            action: function, called without parameters
+            second: int, second
+        return parameter:
+            job: Job, the scheduled job
+        """
+        def repeat(now, deadline):
+            return next_daily(now, hour, minute, second)
+
+        return self._add(Job(name, action, next_daily(self.clock(), hour, minute, second), repeat))
+
+    def cancel(self, name):
+        """
+        cancel(name)
+            - removes a schedule, unknown names are ignored
+        transfer parameters:
+            name: string, name of the schedule
+        """
+        with self._cond:
+            job = self._jobs.pop(name, None)
+            if job is not None:
+                job.cancelled = True
+            self._cond.notify()
+
+    def next_deadline(self):
+        """
+        next_deadline()
+            - returns the earliest deadline of all schedules
+        return parameter:
+            deadline: float, unix time or None if nothing is scheduled
+        """
+        with self._cond:
+            while self._heap and self._heap[0][2].cancelled:
+                heapq.heappop(self._heap)
+            return self._heap[0][0] if self._heap else None
+
+    def run_pending(self, now=None):
+        """
+        run_pending(now=None)
+            - executes all actions whose deadline has passed and reschedules the repeating ones
+            - a schedule missed several times during a stall is executed only once
+        transfer parameters:
+            now: float, unix time used as reference (default: clock())
+        return parameter:
+            count: int, number of executed actions
+        """
+        if now is None:
+            now = self.clock()
+
+        due = []
+        with self._cond:
+            while self._heap and self._heap[0][0] <= now:
+                deadline, seq, job = heapq.heappop(self._heap)
+                if job.cancelled:
+                    continue
+                due.append((deadline, job))
+                if job.repeat is None:
+                    del self._jobs[job.name]
+                else:
+                    job.deadline = job.repeat(now, deadline)
+                    heapq.heappush(self._heap, (job.deadline, next(self._seq), job))
+
+        for deadline, job in due:
+            lag = now - deadline
+            self.max_lag = max(self.max_lag, lag)
+            if lag > 1:
+                self.late += 1
+            self.executed += 1
+            LAG_SECONDS.observe(max(lag, 0))
+            with ACTION_SECONDS.labels(job.name).time():
+                try:
+                    job.action()
+                except Exception as e:
+                    print(f"Scheduled action '{job.name}' failed: {e}")
+        return len(due)
+
+    def run(self):
+        """
+        run()
+            - executes the schedules until stop() is called
+            - sleeps until the next deadline, a new schedule wakes the thread up
+        """
+        self._running = True
+        while self._running:
+            self.run_pending()
+            with self._cond:
+                if not self._running:
+                    break
+                deadline = self.next_deadline()
+                timeout = MAX_SLEEP if deadline is None else min(max(deadline - self.clock(), 0), MAX_SLEEP)
+                if timeout > 0:
+                    self._cond.wait(timeout)
+
+    def stop(self):
+        """
+        stop()
+            - stops the run() loop
+        """
+        with self._cond:
+            self._running = False
+            self._cond.notify()
@@ -0,0 +1,135 @@
+'''
+module name: serial_reader.py
+
+info:
+    This module contains an event driven reader for line based serial links such as the robot arduino.
+    The reader blocks on the port until data arrives, splits the received bytes into lines and
+    hands every line to the registered subscribers (console, relocation logic, logs, ...).
+'''
+
+import threading
+
+
+class LineSplitter:
+    """
+    class LineSplitter splits a byte stream into text lines using an incremental buffer
+        - feed
+    """
+
+    def __init__(self, delimiter=b'\n', max_length=4096):
+        self._buffer = bytearray()
+        self.delimiter = delimiter
+        self.max_length = max_length
+
+    def feed(self, data):
+        """
+        feed(data)
+            - appends the received bytes to the buffer and returns all complete lines
+            - an incomplete line stays in the buffer until the rest arrives
+            - lines longer than max_length are cut, so a missing delimiter cannot fill the memory
+        transfer parameters:
+            data: bytes, received bytes (any chunk size)
+        return parameter:
+            lines: list, decoded lines without line endings
+        """
+        buf = self._buffer
+        buf += data
+        lines = []
+
+        start = 0
+        while True:
+            end = buf.find(self.delimiter, start)
+            if end < 0:
+                break
+            lines.append(buf[start:end].decode('utf-8', 'replace').rstrip('\r'))
+            start = end + len(self.delimiter)
+        del buf[:start]
+
+        if len(buf) > self.max_length:
+            lines.append(buf.decode('utf-8', 'replace'))
+            del buf[:]
+
+        return lines
+
+
+class SerialLineReader:
+    """
+    class SerialLineReader reads lines from a serial port and distributes them to subscribers
+        - subscribe
+        - unsubscribe
+        - run
+        - stop
+    attributes:
+        tee: function, called with every received chunk before it is split (e.g. the serial capture), None: off
+    """
+
+    def __init__(self, port, name='serial'):
+        self.port = port
+        self.name = name
+        self.splitter = LineSplitter()
+        self._subscribers = []
+        self._lock = threading.Lock()
+        self._running = False
+        self.tee = None
+
+    def subscribe(self, callback):
+        """
+        subscribe(callback)
+            - registers a function which is called with every received line
+            - callbacks are called on the reader thread and should return quickly
+        transfer parameters:
+            callback: function, called as callback(line)
+        return parameter:
+            callback: function, the registered callback (to unsubscribe it later)
+        """
+        with self._lock:
+            self._subscribers = self._subscribers + [callback]
+        return callback
+
+    def unsubscribe(self, callback):
+        """
+        unsubscribe(callback)
+            - removes a registered callback, unknown callbacks are ignored
+        transfer parameters:
+            callback: function, callback to be removed
+        """
+        with self._lock:
+            self._subscribers = [s for s in self._subscribers if s is not callback]
+
+    def dispatch(self, line):
+        """
+        dispatch(line)
+            - hands one line to all subscribers
+            - an exception in a subscriber is printed and does not stop the reader
+        transfer parameters:
+            line: string, received line
+        """
+        for callback in self._subscribers:
+            try:
+                callback(line)
+            except Exception as e:
+                print(f"{self.name}: subscriber failed: {e}")
+
+    def run(self):
+        """
+        run()
+            - reads the serial port until stop() is called
+            - the read blocks until data has arrived or the port timeout is reached, so an idle
+              port costs no cpu time
+        """
+        self._running = True
+        while self._running:
+            chunk = self.port.read(self.port.in_waiting or 1)
+            if not chunk:
+                continue
+            if self.tee is not None:
+                self.tee(chunk)
+            for line in self.splitter.feed(chunk):
+                self.dispatch(line)
+
+    def stop(self):
+        """
+        stop()
+            - stops the run() loop after the current read has returned
+        """
+        self._running = False
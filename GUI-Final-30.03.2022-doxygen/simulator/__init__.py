@@ -0,0 +1,17 @@
+'''
+module name: simulator
+
+info:
+    This package simulates the hardware of the vertical farm, so the software can run and be load-tested
+    on a normal Linux computer:
+        - MonitoringSimulator: sends the frames of Monitoring.ino over a pseudo terminal
+        - RobotSimulator:      answers the relocation commands like RampsFinal.ino over a pseudo terminal
+        - FakePCA9685:         replaces Adafruit_PCA9685.PCA9685 and records all writes
+    The pseudo terminals are opened with pyserial like the real ports (see the FARMER_* variables in backend.py).
+    Run 'python -m simulator' to start both serial simulators.
+'''
+
+from simulator.pty_link import PtyLink
+from simulator.monitoring import MonitoringSimulator
+from simulator.robot import RobotSimulator
+from simulator.pwm import FakePCA9685
@@ -0,0 +1,76 @@
+'''
+module name: __main__.py
+
+info:
+    Starts the monitoring and the robot simulator and prints the paths of the pseudo terminals.
+    A command given after '--' is started with the FARMER_* variables set, e.g.
+
+        python -m simulator --speed 100 -- python farmer.py
+
+    Without a command the simulators run until Ctrl+C.
+'''
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+from simulator import PtyLink, MonitoringSimulator, RobotSimulator
+
+
+def main(argv=None):
+    """
+    main(argv=None)
+        - parses the command line, starts the simulators and optionally the software under test
+    transfer parameters:
+        argv: list, command line arguments (default: sys.argv[1:])
+    return parameter:
+        code: int, exit code (of the started command)
+    """
+    argv = sys.argv[1:] if argv is None else argv
+    command = []
+    if '--' in argv:
+        command = argv[argv.index('--') + 1:]
+        argv = argv[:argv.index('--')]
+
+    parser = argparse.ArgumentParser(prog='python -m simulator', description='Hardware simulator of the vertical farm')
+    parser.add_argument('--speed', type=float, default=1.0, help='frame rate factor of the monitoring arduino (0: as fast as possible)')
+    parser.add_argument('--noise', type=float, default=1.0, help='factor of the measurement noise')
+    parser.add_argument('--corrupt', type=float, default=0.0, help='probability of a corrupt frame')
+    parser.add_argument('--garbage', type=float, default=0.0, help='probability of garbage bytes between two frames')
+    parser.add_argument('--robot-speed', type=float, default=1.0, help='speed factor of the robot movements (0: no delay)')
+    parser.add_argument('--fail', type=float, default=0.0, help='probability of a failed relocation')
+    parser.add_argument('--seed', type=int, default=None, help='seed of the random generators')
+    args = parser.parse_args(argv)
+
+    monitor_link = PtyLink()
+    robot_link = PtyLink()
+    monitor = MonitoringSimulator(monitor_link, args.speed, args.noise, args.corrupt, args.garbage, args.seed)
+    robot = RobotSimulator(robot_link, args.robot_speed, args.fail, args.seed)
+
+    env = {'FARMER_MONITOR_PORT': monitor_link.path,
+           'FARMER_ROBOT_PORT': robot_link.path,
+           'FARMER_FAKE_PWM': '1'}
+    for name, value in env.items():
+        print(f"export {name}={value}")
+
+    monitor.start()
+    robot.start()
+    try:
+        if command:
+            return subprocess.call(command, env=dict(os.environ, **env))
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        return 0
+    finally:
+        monitor.stop()
+        robot.stop()
+        print(f"Frames sent: {monitor.sent} ({monitor.corrupted} corrupt), relocations: {len(robot.commands)} ({robot.failed} failed)")
+        monitor_link.close()
+        robot_link.close()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,134 @@
+'''
+module name: monitoring.py
+
+info:
+    This module contains the simulator of the monitoring arduino (Monitoring.ino).
+    It sends one telemetry frame per measurement cycle (every 5 s, faster with speed > 1). The values
+    follow a slow random walk with measurement noise on top. Corrupt frames and garbage bytes can be
+    injected to test the resync of the frame decoder.
+'''
+
+import random
+import threading
+import time
+
+import telemetry
+
+""" time between two frames of Monitoring.ino (delay(5000) in loop) """
+CYCLE_TIME = 5.0
+
+"""
+    start value, noise (standard deviation) and allowed range of every channel,
+    same index as VIAL_PARAMETERS
+"""
+CHANNEL_MODEL = [(22.0, 0.2, (15.0, 30.0)),      # index 0: temp air
+                 (20.0, 0.1, (15.0, 28.0)),      # index 1: watertemp tank
+                 (60.0, 0.5, (0.0, 100.0)),      # index 2: waterlevel tank
+                 (1.0, 0.0, (0.0, 1.0)),         # index 3: waterlevel floor 1
+                 (1.0, 0.0, (0.0, 1.0)),         # index 4: waterlevel floor 2
+                 (65.0, 1.0, (30.0, 95.0)),      # index 5: humidity floor 1
+                 (65.0, 1.0, (30.0, 95.0)),      # index 6: humidity floor 2
+                 (2.4, 0.01, (1.5, 3.5)),        # index 7: pH voltage
+                 (6.2, 0.03, (4.0, 9.0)),        # index 8: pH tank
+                 (800.0, 10.0, (0.0, 2000.0))]   # index 9: ec tank
+
+
+class MonitoringSimulator:
+    """
+    class MonitoringSimulator sends frames like the monitoring arduino
+        - next_values
+        - start
+        - stop
+    attributes:
+        sent:      int, number of sent frames
+        corrupted: int, number of frames sent with a wrong checksum
+    """
+
+    def __init__(self, link, speed=1.0, noise=1.0, corrupt_rate=0.0, garbage_rate=0.0, seed=None, listener=None):
+        """
+        transfer parameters:
+            link:         PtyLink, pseudo terminal of the monitoring port
+            speed:        float, factor of the frame rate (1: one frame every 5 s, 100: 20 frames per second), 0: as fast as possible
+            noise:        float, factor of the measurement noise
+            corrupt_rate: float, probability of a frame being sent with a flipped byte
+            garbage_rate: float, probability of random bytes being sent between two frames
+            seed:         int, seed of the random generator (reproducible runs)
+            listener:     function, called as listener(seq, t) after every sent frame, t is the time.monotonic() of the write
+        """
+        self.link = link
+        self.speed = speed
+        self.noise = noise
+        self.corrupt_rate = corrupt_rate
+        self.garbage_rate = garbage_rate
+        self.random = random.Random(seed)
+        self.listener = listener
+        self.values = [model[0] for model in CHANNEL_MODEL]
+        self.seq = 0
+        self.sent = 0
+        self.corrupted = 0
+        self._running = threading.Event()
+        self._thread = None
+
+    def next_values(self):
+        """
+        next_values()
+            - advances the random walk by one measurement cycle
+        return parameter:
+            values: list, measured values of all channels (walk + noise)
+        """
+        measured = []
+        for i, (start, sigma, (low, high)) in enumerate(CHANNEL_MODEL):
+            if sigma:
+                drift = self.random.gauss(0, sigma * 0.2) + 0.01 * (start - self.values[i])
+                self.values[i] = min(max(self.values[i] + drift, low), high)
+            value = self.values[i] + self.random.gauss(0, sigma * self.noise) if sigma else self.values[i]
+            measured.append(min(max(value, low), high))
+        return measured
+
+    def _frame(self):
+        frame = bytearray(telemetry.encode_frame(self.seq, self.next_values()))
+        if self.random.random() < self.corrupt_rate:
+            frame[self.random.randrange(2, len(frame))] ^= 0xFF
+            self.corrupted += 1
+        if self.random.random() < self.garbage_rate:
+            frame = bytearray(self.random.getrandbits(8) for i in range(self.random.randint(1, 64))) + frame
+        return bytes(frame)
+
+    def start(self):
+        """
+        start()
+            - starts the thread sending the frames
+        """
+        if self._thread is None:
+            self._running.set()
+            self._thread = threading.Thread(target=self._run, name='MonitoringSimulator', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """
+        stop()
+            - stops sending frames
+        """
+        if self._thread is not None:
+            self._running.clear()
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        interval = CYCLE_TIME / self.speed if self.speed else 0
+        deadline = time.monotonic()
+        while self._running.is_set():
+            try:
+                self.link.write(self._frame())
+            except OSError:
+                return
+            if self.listener is not None:
+                self.listener(self.seq, time.monotonic())
+            self.seq = (self.seq + 1) & 0xFFFF
+            self.sent += 1
+            if interval:
+                # fixed rate without drift, a late frame does not shift the following ones
+                deadline += interval
+                delay = deadline - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
@@ -0,0 +1,73 @@
+'''
+module name: pty_link.py
+
+info:
+    This module contains the pseudo terminal pair used by the simulators.
+    The simulator uses the master side, the software under test opens the slave path (e.g. /dev/pts/3)
+    like a serial port.
+'''
+
+import os
+import select
+import tty
+
+
+class PtyLink:
+    """
+    class PtyLink contains one pseudo terminal pair in raw mode
+        - write
+        - read
+        - close
+    attributes:
+        path: string, path of the slave side, to be opened by the software under test
+    """
+
+    def __init__(self):
+        self.master, self._slave = os.openpty()
+        # raw mode: no echo and no line editing, bytes are passed on unchanged
+        tty.setraw(self._slave)
+        self.path = os.ttyname(self._slave)
+        self.closed = False
+        # the slave stays open, so the link survives the software under test closing and reopening the port
+
+    def write(self, data):
+        """
+        write(data)
+            - writes bytes to the software under test
+        transfer parameters:
+            data: bytes, data to be sent
+        """
+        view = memoryview(data)
+        while view:
+            view = view[os.write(self.master, view):]
+
+    def read(self, size=4096, timeout=None):
+        """
+        read(size=4096, timeout=None)
+            - reads the bytes sent by the software under test
+        transfer parameters:
+            size:    int, maximum number of bytes
+            timeout: float, maximum seconds to wait for data (None: wait until data arrives)
+        return parameter:
+            data: bytes, received bytes (empty after the timeout or after close)
+        """
+        if self.closed:
+            return b''
+        try:
+            if timeout is not None and not select.select([self.master], [], [], timeout)[0]:
+                return b''
+            return os.read(self.master, size)
+        except (OSError, ValueError):
+            return b''
+
+    def close(self):
+        """
+        close()
+            - closes both sides of the pseudo terminal
+        """
+        self.closed = True
+        for fd in (self.master, self._slave):
+            try:
+                os.close(fd)
+            except OSError:
+                pass
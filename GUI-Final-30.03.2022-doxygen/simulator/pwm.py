@@ -0,0 +1,90 @@
+'''
+module name: pwm.py
+
+info:
+    This module contains a replacement of Adafruit_PCA9685.PCA9685 without I2C hardware.
+    It offers the same methods and an I2C device (_device) with the register interface used by
+    actuator.PCA9685Bus, so the complete write path of the pwm service is used. All writes are recorded.
+'''
+
+import threading
+
+import actuator
+
+""" ALL_LED register of the PCA9685 """
+ALL_LED_ON_L = 0xFA
+
+
+class FakeI2CDevice:
+    """
+    class FakeI2CDevice emulates the registers of the PCA9685
+        - write8
+        - readU8
+        - writeList
+    attributes:
+        registers: bytearray, the 256 registers
+        writes:    list, recorded transfers as (register, data)
+    """
+
+    def __init__(self):
+        self.registers = bytearray(256)
+        self.writes = []
+        self._lock = threading.Lock()
+
+    def write8(self, register, value):
+        self.writeList(register, [value])
+
+    def readU8(self, register):
+        return self.registers[register]
+
+    def writeList(self, register, data):
+        with self._lock:
+            self.registers[register:register + len(data)] = bytes(data)
+            self.writes.append((register, list(data)))
+            if register == ALL_LED_ON_L:
+                for ch in range(actuator.CHANNELS):
+                    start = actuator.LED0_ON_L + 4 * ch
+                    self.registers[start:start + 4] = bytes(data)
+
+
+class FakePCA9685:
+    """
+    class FakePCA9685 replaces Adafruit_PCA9685.PCA9685
+        - set_pwm_freq
+        - set_pwm
+        - set_all_pwm
+        - channel
+    attributes:
+        frequency: float, pwm frequency
+        writes:    list, all recorded transfers (see FakeI2CDevice)
+    """
+
+    def __init__(self, address=0x40, **kwargs):
+        self.address = address
+        self.frequency = None
+        self._device = FakeI2CDevice()
+
+    @property
+    def writes(self):
+        return self._device.writes
+
+    def set_pwm_freq(self, freq_hz):
+        self.frequency = freq_hz
+
+    def set_pwm(self, channel, on, off):
+        self._device.writeList(actuator.LED0_ON_L + 4 * channel, [on & 0xFF, on >> 8, off & 0xFF, off >> 8])
+
+    def set_all_pwm(self, on, off):
+        self._device.writeList(ALL_LED_ON_L, [on & 0xFF, on >> 8, off & 0xFF, off >> 8])
+
+    def channel(self, channel):
+        """
+        channel(channel)
+            - returns the off count of a channel read from the registers
+        transfer parameters:
+            channel: int, channel 0..15
+        return parameter:
+            value: int, off count (0..4095)
+        """
+        start = actuator.LED0_ON_L + 4 * channel
+        return self._device.registers[start + 2] | (self._device.registers[start + 3] << 8)
@@ -0,0 +1,125 @@
+'''
+module name: robot.py
+
+info:
+    This module contains the simulator of the robot arduino (RampsFinal.ino).
+    A relocation command 'oldTnew' is answered like relocate() in the sketch: both position numbers
+    are echoed, the movement takes the time estimated from the step coordinates (planner.move_cost),
+    the homing messages are sent and the relocation ends with 'Success'. Failures can be injected,
+    they are reported with 'Something failed. Please try again!' before the final 'Success'.
+'''
+
+import random
+import re
+import threading
+import time
+
+import planner
+import serial_reader
+
+""" command format, parsed like Serial.parseInt() / Serial.read() in relocate() """
+COMMAND = re.compile(r'^\s*(\d+)\D(\d+)$')
+
+""" time of the fixed parts of a relocation (delays, grab and place) in seconds """
+HANDLING_TIME = 6.0
+
+
+class RobotSimulator:
+    """
+    class RobotSimulator answers relocation commands like the robot arduino
+        - duration
+        - start
+        - stop
+    attributes:
+        commands: list, received (old, new) relocations
+        failed:   int, number of relocations answered with a failure
+    """
+
+    def __init__(self, link, speed=1.0, fail_rate=0.0, seed=None):
+        """
+        transfer parameters:
+            link:      PtyLink, pseudo terminal of the robot port
+            speed:     float, factor of the movement speed (1: real time, 0: no delay)
+            fail_rate: float, probability of a relocation failing
+            seed:      int, seed of the random generator (reproducible runs)
+        """
+        self.link = link
+        self.speed = speed
+        self.fail_rate = fail_rate
+        self.random = random.Random(seed)
+        self.commands = []
+        self.failed = 0
+        self._running = threading.Event()
+        self._thread = None
+
+    def duration(self, old, new):
+        """
+        duration(old, new)
+            - returns the simulated duration of a relocation
+        transfer parameters:
+            old: int, initial position
+            new: int, target position
+        return parameter:
+            duration: float, seconds
+        """
+        if not self.speed:
+            return 0.0
+        return (planner.move_cost(old, new) + HANDLING_TIME) / self.speed
+
+    def start(self):
+        """
+        start()
+            - starts the thread answering the commands
+        """
+        if self._thread is None:
+            self._running.set()
+            self._thread = threading.Thread(target=self._run, name='RobotSimulator', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """
+        stop()
+            - stops answering commands (a running relocation is finished first)
+        """
+        if self._thread is not None:
+            self._running.clear()
+            self._thread.join()
+            self._thread = None
+
+    def _send(self, line):
+        self.link.write(line.encode() + b'\r\n')
+
+    def _run(self):
+        splitter = serial_reader.LineSplitter()
+        while self._running.is_set():
+            data = self.link.read(timeout=0.2)
+            if not data:
+                if self.link.closed:
+                    return
+                continue
+            for line in splitter.feed(data):
+                try:
+                    self._relocate(line)
+                except OSError:
+                    return
+
+    def _relocate(self, line):
+        match = COMMAND.match(line)
+        if match is None:
+            self._send("Something failed. Please try again!")
+        else:
+            old, new = int(match.group(1)), int(match.group(2))
+            self._send(str(old))
+            self._send(str(new))
+            self.commands.append((old, new))
+            if old >= len(planner.STEP_TO_POS) or new >= len(planner.STEP_TO_POS):
+                self._send("Something failed. Please try again!")
+                self.failed += 1
+            else:
+                time.sleep(self.duration(old, new))
+                if self.random.random() < self.fail_rate:
+                    self._send("Something failed. Please try again!")
+                    self.failed += 1
+                self._send("Y-Homed.")
+                self._send("X-Homed.")
+        self._send("Success")
@@ -0,0 +1,149 @@
+'''
+module name: telemetry.py
+
+info:
+    This module contains the binary frame protocol used between the monitoring arduino (Monitoring.ino) and the Pi.
+    Every measurement cycle the arduino sends one fixed-size frame instead of ten bare text lines:
+
+        offset  size  content
+        0       2     sync marker 0xAA 0x55
+        2       1     protocol version
+        3       1     number of channels (10)
+        4       2     sequence number, uint16, wraps around
+        6       40    10 x float32 channel values (index layout of VIAL_PARAMETERS)
+        46      2     CRC-16/CCITT-FALSE over the bytes 2..45
+
+    All multi-byte fields are little endian, which is the native byte order of the AVR.
+'''
+
+import struct
+from binascii import crc_hqx
+from collections import namedtuple
+
+FRAME_SYNC = b'\xAA\x55'
+FRAME_VERSION = 1
+FRAME_CHANNELS = 10
+
+""" struct layout of a complete frame, parsed with a single unpack """
+FRAME_STRUCT = struct.Struct('<2sBBH%dfH' % FRAME_CHANNELS)
+FRAME_SIZE = FRAME_STRUCT.size
+
+""" names of the channels in the order they are sent by the arduino """
+CHANNEL_NAMES = ('air temperature',     # index 0
+                 'water temperature',   # index 1
+                 'level tank',          # index 2
+                 'level 1',             # index 3
+                 'level 2',             # index 4
+                 'humidity 1',          # index 5
+                 'humidity 2',          # index 6
+                 'pH voltage',          # index 7
+                 'pH',                  # index 8
+                 'tds')                 # index 9
+
+Frame = namedtuple('Frame', ['seq', 'values'])
+
+
+def crc16(data):
+    """
+    crc16(data)
+        - calculates the CRC-16/CCITT-FALSE checksum (poly 0x1021, init 0xFFFF) used by the frame protocol
+    transfer parameters:
+        data: bytes, data to be checked
+    return parameter:
+        crc: int, 16 bit checksum
+    """
+    return crc_hqx(data, 0xFFFF)
+
+
+def encode_frame(seq, values):
+    """
+    encode_frame(seq, values)
+        - builds a frame the same way the monitoring arduino does
+        - used by the simulator and for testing the decoder
+    transfer parameters:
+        seq:    int, sequence number (will be wrapped to 16 bit)
+        values: list, FRAME_CHANNELS float values
+    return parameter:
+        frame: bytes, complete frame including sync marker and CRC
+    """
+    body = struct.pack('<BBH%df' % FRAME_CHANNELS, FRAME_VERSION, FRAME_CHANNELS, seq & 0xFFFF, *values)
+    return FRAME_SYNC + body + struct.pack('<H', crc16(body))
+
+
+class FrameDecoder:
+    """
+    class FrameDecoder splits a raw byte stream into telemetry frames
+        - feed
+        - stats
+    attributes:
+        frames:  int, number of valid frames
+        corrupt: int, number of rejected frames (wrong version, channel count or CRC)
+        lost:    int, number of frames missing according to the sequence numbers
+        skipped: int, number of bytes dropped while searching for a sync marker
+    """
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._expected = None
+        self.frames = 0
+        self.corrupt = 0
+        self.lost = 0
+        self.skipped = 0
+
+    def feed(self, data):
+        """
+        feed(data)
+            - appends the received bytes to the internal buffer and extracts all complete frames
+            - after a corrupt frame the decoder resyncs on the next sync marker
+        transfer parameters:
+            data: bytes, bytes received from the serial port (any chunk size)
+        return parameter:
+            frames: list, decoded Frame tuples in order of arrival
+        """
+        buf = self._buffer
+        buf += data
+        frames = []
+
+        while True:
+            start = buf.find(FRAME_SYNC)
+            if start < 0:
+                # keep a trailing first sync byte, the second one may follow with the next chunk
+                keep = 1 if buf[-1:] == FRAME_SYNC[:1] else 0
+                self.skipped += len(buf) - keep
+                del buf[:len(buf) - keep]
+                break
+            if start > 0:
+                self.skipped += start
+                del buf[:start]
+            if len(buf) < FRAME_SIZE:
+                break
+
+            fields = FRAME_STRUCT.unpack_from(buf)
+            version, channels, seq, crc = fields[1], fields[2], fields[3], fields[-1]
+            if (version != FRAME_VERSION or channels != FRAME_CHANNELS
+                    or crc16(bytes(buf[2:FRAME_SIZE - 2])) != crc):
+                # drop the sync marker only, a valid frame may start inside the rejected bytes
+                self.corrupt += 1
+                del buf[:1]
+                continue
+
+            del buf[:FRAME_SIZE]
+            if self._expected is not None and seq != self._expected:
+                self.lost += (seq - self._expected) & 0xFFFF
+            self._expected = (seq + 1) & 0xFFFF
+            self.frames += 1
+            frames.append(Frame(seq, fields[4:-1]))
+
+        return frames
+
+    def stats(self):
+        """
+        stats()
+            - returns the counters of the decoder
+        return parameter:
+            stats: dict, frames, corrupt, lost and skipped
+        """
+        return {'frames': self.frames,
+                'corrupt': self.corrupt,
+                'lost': self.lost,
+                'skipped': self.skipped}
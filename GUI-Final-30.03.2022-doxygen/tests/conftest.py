@@ -0,0 +1,12 @@
+'''
+module name: conftest.py
+
+info:
+    The modules of the farmer are imported by their file name (python farmer.py is started in its directory),
+    so the directory is added to the import path of the tests. Run the tests with python -m pytest tests.
+'''
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
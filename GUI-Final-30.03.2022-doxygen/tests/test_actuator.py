@@ -0,0 +1,123 @@
+'''
+module name: test_actuator.py
+
+info:
+    Tests of the pwm service (actuator.py) against the simulated PCA9685 (simulator/pwm.py).
+    The assertions use the transfers and the registers recorded by the fake I2C device.
+'''
+
+import threading
+
+import pytest
+
+import actuator
+from simulator.pwm import ALL_LED_ON_L, FakePCA9685
+
+
+def register(channel):
+    return actuator.LED0_ON_L + 4 * channel
+
+
+@pytest.fixture
+def board():
+    pwm = FakePCA9685()
+    bus = actuator.PCA9685Bus(pwm)
+    # the auto increment bit written by the bus is not a channel write
+    pwm.writes.clear()
+    return pwm, bus
+
+
+@pytest.fixture
+def service(board):
+    pwm, bus = board
+    service = actuator.PWMService(bus)
+    service.start()
+    yield service
+    service.stop()
+
+
+def test_bus_enables_auto_increment():
+    pwm = FakePCA9685()
+    actuator.PCA9685Bus(pwm)
+    assert pwm._device.readU8(actuator.MODE1) & actuator.MODE1_AI
+
+
+def test_unchanged_value_is_not_written(board, service):
+    pwm, bus = board
+    service.set(3, 1000)
+    assert service.sync(1)
+    service.set(3, 1000)
+    assert service.sync(1)
+
+    assert pwm.writes == [(register(3), [0, 0, 1000 & 0xFF, 1000 >> 8])]
+    assert service.skipped == 1
+    assert service.get(3) == 1000
+    assert pwm.channel(3) == 1000
+
+
+def test_adjacent_channels_are_written_in_one_block(board, service):
+    pwm, bus = board
+    service.set_many({4: 100, 5: 200, 6: 300, 9: 400})
+    assert service.sync(1)
+
+    assert [reg for reg, data in pwm.writes] == [register(4), register(9)]
+    assert len(pwm.writes[0][1]) == 3 * 4
+    assert service.transfers == 2
+    assert [pwm.channel(ch) for ch in (4, 5, 6, 9)] == [100, 200, 300, 400]
+
+
+def test_block_is_split_at_max_block(board, service):
+    pwm, bus = board
+    service.set_many({ch: ch + 1 for ch in range(actuator.MAX_BLOCK + 2)})
+    assert service.sync(1)
+
+    assert [reg for reg, data in pwm.writes] == [register(0), register(actuator.MAX_BLOCK)]
+    assert all(len(data) <= 4 * actuator.MAX_BLOCK for reg, data in pwm.writes)
+
+
+def test_all_off_uses_one_all_led_write(board, service):
+    pwm, bus = board
+    service.set_many({1: 500, 8: 600})
+    assert service.sync(1)
+    pwm.writes.clear()
+
+    service.set_all(0)
+    assert service.sync(1)
+
+    assert pwm.writes == [(ALL_LED_ON_L, [0, 0, 0, 0])]
+    assert all(pwm.channel(ch) == 0 for ch in range(actuator.CHANNELS))
+    assert all(service.get(ch) == 0 for ch in range(actuator.CHANNELS))
+
+
+def test_later_set_from_another_thread_wins(board):
+    pwm, bus = board
+    # the commands are queued before the service runs, so they are combined into one batch
+    service = actuator.PWMService(bus)
+    service.set(2, 100)
+    other = threading.Thread(target=service.set, args=(2, 3000))
+    other.start()
+    other.join()
+    service.start()
+    try:
+        assert service.sync(1)
+    finally:
+        service.stop()
+
+    assert pwm.writes == [(register(2), [0, 0, 3000 & 0xFF, 3000 >> 8])]
+    assert pwm.channel(2) == 3000
+    assert service.commands == 2
+
+
+def test_listener_gets_the_written_channels(board):
+    pwm, bus = board
+    written = []
+    service = actuator.PWMService(bus, listener=written.append)
+    service.start()
+    try:
+        service.set_many({1: 10, 2: 20})
+        service.set_many({1: 10})
+        assert service.sync(1)
+    finally:
+        service.stop()
+
+    assert written == [{1: 10, 2: 20}]
@@ -39,6 +39,12 @@ float averageVoltage = 0,tdsValue = 0,temperature = 25;
 int pHArray[ArrayLenth];   //Store the average value of the sensor feedback
 int pHArrayIndex=0;
 
+// Telemetry Frame (see telemetry.py on the Pi)
+#define FRAME_VERSION 1
+#define FRAME_CHANNELS 10
+#define FRAME_SIZE (6 + 4 * FRAME_CHANNELS + 2)
+uint16_t frame_seq = 0;
+
 
 OneWire oneWire(TEMP_TANK);
 DallasTemperature sensors(&oneWire);
@@ -150,12 +156,46 @@ void loop()
   vial_parameters[7] = voltage;
   vial_parameters[8] = pHValue;
   
-  // Print Array to Serial (to the Pi)
-  for (int i = 0; i < 10; i++)
+  // Send Array to Serial (to the Pi) as one binary frame
+  sendFrame();
+}
+
+void sendFrame()
+{
+  byte frame[FRAME_SIZE];
+
+  frame[0] = 0xAA;                  // sync marker
+  frame[1] = 0x55;
+  frame[2] = FRAME_VERSION;
+  frame[3] = FRAME_CHANNELS;
+  frame[4] = frame_seq & 0xFF;      // sequence number, little endian
+  frame[5] = frame_seq >> 8;
+  memcpy(&frame[6], vial_parameters, 4 * FRAME_CHANNELS); // float32, little endian on the AVR
+
+  uint16_t crc = crc16(&frame[2], FRAME_SIZE - 4);
+  frame[FRAME_SIZE - 2] = crc & 0xFF;
+  frame[FRAME_SIZE - 1] = crc >> 8;
+
+  Serial.write(frame, FRAME_SIZE);
+  frame_seq++;
+}
+
+uint16_t crc16(const byte* data, int len)
+{
+  // CRC-16/CCITT-FALSE, poly 0x1021, init 0xFFFF
+  uint16_t crc = 0xFFFF;
+  for (int i = 0; i < len; i++)
   {
-    Serial.println(vial_parameters[i]);
-    delay(50);
+    crc ^= (uint16_t)data[i] << 8;
+    for (byte b = 0; b < 8; b++)
+    {
+      if (crc & 0x8000)
+        crc = (crc << 1) ^ 0x1021;
+      else
+        crc = crc << 1;
+    }
   }
+  return crc;
 }
 
 int getMedianNum(int bArray[], int iFilterLen)